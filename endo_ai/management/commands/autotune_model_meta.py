@@ -0,0 +1,129 @@
+"""
+Probes batch sizes and thread counts of a ModelMeta on this host and caches the fastest
+setting in CONF_DIR/autotune, see endo_ai.predictor.autotune.
+"""
+
+from django.core.management import BaseCommand
+from icecream import ic
+from endoreg_db.models import ModelMeta
+
+from endo_ai.predictor.autotune import DEFAULT_BATCH_SIZES
+from endo_ai.predictor.backends import BACKENDS
+from endo_ai.predictor.quantization import PRECISIONS
+from endo_ai.predictor.video_prediction import (
+    get_inference_config,
+    get_inference_model,
+    tune_inference_config,
+)
+
+
+# Example usage:
+# python manage.py autotune_model_meta
+# python manage.py autotune_model_meta --backend onnxruntime --batch_sizes 8,16,32 --memory_cap_mb 4096
+
+
+class Command(BaseCommand):
+    help = """
+        Runs the model of a ModelMeta on synthetic inputs of its input size over a grid of
+        batch sizes and torch intra-op thread counts and caches the fastest setting below
+        the memory cap for this host, ModelMeta, backend and precision. Prediction commands
+        use the cached setting with --autotune.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--meta_name",
+            type=str,
+            default="image_multilabel_classification_colonoscopy_default",
+            help="Name of the ModelMeta",
+        )
+
+        parser.add_argument(
+            "--model_meta_version",
+            type=int,
+            default=None,
+            help="Model Version, defaults to the latest",
+        )
+
+        parser.add_argument(
+            "--device",
+            type=str,
+            default=None,
+            help="Inference device (cpu, cuda, cuda:0, ...). Defaults to cuda if available",
+        )
+
+        parser.add_argument(
+            "--backend", type=str, choices=BACKENDS, default=None, help="Inference backend"
+        )
+
+        parser.add_argument(
+            "--precision",
+            type=str,
+            choices=PRECISIONS,
+            default=None,
+            help="Reduced precision variant, must be validated with validate_precision first",
+        )
+
+        parser.add_argument(
+            "--batch_sizes",
+            type=str,
+            default=",".join(str(b) for b in DEFAULT_BATCH_SIZES),
+            help="Comma separated batch sizes",
+        )
+
+        parser.add_argument(
+            "--thread_counts",
+            type=str,
+            default=None,
+            help="Comma separated intra-op thread counts, defaults to 1, 2, 4, ... cores",
+        )
+
+        parser.add_argument(
+            "--memory_cap_mb",
+            type=int,
+            default=None,
+            help="Peak memory cap in MiB, defaults to half of the physical memory",
+        )
+
+        parser.add_argument(
+            "--n_batches", type=int, default=3, help="Timed batches per setting"
+        )
+
+    def handle(self, *args, **options):
+        meta_name = options["meta_name"]
+        meta_version = options["model_meta_version"]
+        if not meta_version:
+            meta_version = ModelMeta.get_latest_version(name=meta_name)
+            ic(f"No Version Provided, Using Latest Version: {meta_version}")
+        assert meta_version is not None, "ModelMeta not found"
+
+        model_meta = ModelMeta.get_by_name(meta_name, meta_version)
+        config = get_inference_config(
+            model_meta,
+            device=options["device"],
+            backend=options["backend"],
+            precision=options["precision"],
+        )
+        model = get_inference_model(model_meta, config)
+
+        probe_kwargs = {
+            "batch_sizes": [int(b) for b in options["batch_sizes"].split(",")],
+            "n_batches": options["n_batches"],
+        }
+        if options["thread_counts"]:
+            probe_kwargs["thread_counts"] = [int(t) for t in options["thread_counts"].split(",")]
+        if options["memory_cap_mb"]:
+            probe_kwargs["memory_cap_bytes"] = options["memory_cap_mb"] * 1024**2
+
+        tuning = tune_inference_config(model_meta, config, model, overwrite=True, **probe_kwargs)
+
+        self.stdout.write(f"{'batchsize':>10} {'threads':>8} {'frames/s':>10} {'peak MiB':>10}")
+        for entry in tuning["grid"]:
+            self.stdout.write(
+                f"{entry['batchsize']:>10} {str(entry['intra_op_threads']):>8} "
+                f"{entry['fps']:>10.1f} {entry['peak_rss_mb']:>10.0f}"
+            )
+        self.stdout.write(
+            f"Selected batchsize {tuning['batchsize']}, threads {tuning['intra_op_threads']} "
+            f"({tuning['fps']:.1f} frames/s)"
+        )
@@ -0,0 +1,123 @@
+"""
+Exports the weights of a ModelMeta to TorchScript and ONNX and compares the backends.
+"""
+
+from django.core.management import BaseCommand
+from icecream import ic
+from endoreg_db.models import ModelMeta
+
+from endo_ai.predictor.backends import BACKENDS, export_model, compare_backends, EXPORTERS
+from endo_ai.predictor.inference_model import InferenceNet
+
+
+# Example usage:
+# python manage.py export_model_meta --model_meta_version 7 --compare
+# python manage.py export_model_meta --compare --backends eager,torchscript,onnxruntime,compile
+
+
+class Command(BaseCommand):
+    help = """
+        Exports the weights of a ModelMeta for the TorchScript and ONNX Runtime backends.
+        Exports are cached next to the checkpoint, keyed by the hash of the weights.
+        With --compare every backend predicts the same random batches and the maximum
+        absolute difference of the sigmoid outputs to eager and the throughput are reported.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--meta_name",
+            type=str,
+            default="image_multilabel_classification_colonoscopy_default",
+            help="Name of the ModelMeta",
+        )
+
+        parser.add_argument(
+            "--model_meta_version",
+            type=int,
+            default=None,
+            help="Model Version, defaults to the latest",
+        )
+
+        parser.add_argument(
+            "--backends",
+            type=str,
+            default="torchscript,onnxruntime",
+            help=f"Comma separated backends ({', '.join(BACKENDS)})",
+        )
+
+        parser.add_argument(
+            "--overwrite",
+            action="store_true",
+            default=False,
+            help="Export again even if a cached export exists",
+        )
+
+        parser.add_argument(
+            "--compare",
+            action="store_true",
+            default=False,
+            help="Run the parity check and throughput comparison",
+        )
+
+        parser.add_argument(
+            "--n_batches",
+            type=int,
+            default=10,
+            help="Number of batches for the comparison",
+        )
+
+        parser.add_argument(
+            "--max_abs_diff",
+            type=float,
+            default=1e-4,
+            help="Maximum absolute difference of the sigmoid outputs to eager",
+        )
+
+    def handle(self, *args, **options):
+        meta_name = options["meta_name"]
+        meta_version = options["model_meta_version"]
+        backends = [b.strip() for b in options["backends"].split(",") if b.strip()]
+        for backend in backends:
+            assert backend in BACKENDS, f"Unknown backend {backend}, choose from {BACKENDS}"
+
+        if not meta_version:
+            meta_version = ModelMeta.get_latest_version(name=meta_name)
+            ic(f"No Version Provided, Using Latest Version: {meta_version}")
+        assert meta_version is not None, "ModelMeta not found"
+
+        model_meta = ModelMeta.get_by_name(meta_name, meta_version)
+        config = model_meta.get_inference_dataset_config()
+        weights_path = model_meta.weights.path
+
+        model = InferenceNet.load_from_checkpoint(
+            checkpoint_path=weights_path,
+            map_location="cpu",
+        )
+        model.eval()
+
+        for backend in backends:
+            if backend in EXPORTERS:
+                export_path = export_model(
+                    model, backend, weights_path, config, overwrite=options["overwrite"]
+                )
+                ic(f"{backend}: {export_path}")
+
+        if not options["compare"]:
+            return
+
+        results = compare_backends(
+            model, backends, weights_path, config, n_batches=options["n_batches"]
+        )
+
+        self.stdout.write(f"{'backend':<12} {'max abs diff':>14} {'frames/s':>10}")
+        for backend, result in results.items():
+            self.stdout.write(
+                f"{backend:<12} {result['max_abs_diff']:>14.2e} {result['fps']:>10.1f}"
+            )
+
+        failed = [
+            backend
+            for backend, result in results.items()
+            if result["max_abs_diff"] > options["max_abs_diff"]
+        ]
+        assert not failed, f"Parity check failed for: {failed}"
@@ -10,10 +10,12 @@ from endoreg_db.models import (
     Center,
     EndoscopyProcessor,
 )
+from endo_ai.predictor.frame_extraction import extract_video_frames
 
 # Example usage:
 # python manage.py import_video ~/test-data/video/lux-gastro-video.mp4
 # python manage.py import_video ~/test-data/video/NINJAU_S001_S001_T026.MOV
+# python manage.py import_video ~/test-data/video/lux-gastro-video.mp4 --extraction_workers 4
 
 FPS = 50
 SMOOTH_WINDOW_SIZE_S = 1
@@ -97,6 +99,16 @@ class Command(BaseCommand):
             help="Path to the model file",
         )
 
+        parser.add_argument(
+            "--extraction_workers",
+            type=int,
+            default=None,
+            help=(
+                "Parallel ffmpeg processes extracting keyframe-aligned ranges of the video, "
+                "defaults to the number of cores"
+            ),
+        )
+
     def handle(self, *args, **options):
         verbose = True
         center_name = options["center_name"]
@@ -142,7 +154,14 @@ class Command(BaseCommand):
             processor_name=processor_name,
         )
 
-        paths = video_file_obj.extract_frames(quality=2, overwrite=False, ext="jpg")
+        # the frame paths come from the extraction plan, the frame dir is not rescanned
+        paths = extract_video_frames(
+            video_file_obj,
+            n_workers=options["extraction_workers"],
+            quality=2,
+            overwrite=False,
+            ext="jpg",
+        )
         video_file_obj.initialize_frames(paths)
         video_file_obj.update_text_metadata(ocr_frame_fraction=0.001) #TODO implement lx-anonymizer
 
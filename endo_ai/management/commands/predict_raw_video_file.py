@@ -5,10 +5,14 @@ from endoreg_db.models import (
     ModelMeta,
     RawVideoFile,
 )
+from endo_ai.predictor.video_prediction import predict_video, repostprocess_video
+from endo_ai.predictor.backends import BACKENDS
+from endo_ai.predictor.quantization import PRECISIONS
 
 
 # Example usage:
 # python manage.py predict_raw_video_file --raw_video_uuid 138c846e649a40eb84d6633c99f7e704 --model_meta_version 7 --test_run
+# python manage.py predict_raw_video_file --raw_video_uuid 138c846e649a40eb84d6633c99f7e704 --repostprocess --smooth_window_size_s 2
 
 
 class Command(BaseCommand):
@@ -58,13 +62,6 @@ class Command(BaseCommand):
             help="Model Version",
         )
 
-        parser.add_argument(
-            "--dataset_name",
-            type=str,
-            default="inference_dataset",
-            help="Name of the dataset",
-        )
-
         parser.add_argument(
             "--smooth_window_size_s",
             type=float,
@@ -80,14 +77,6 @@ class Command(BaseCommand):
             help="Threshold for binarization",
         )
 
-        # img_suffix
-        parser.add_argument(
-            "--img_suffix",
-            type=str,
-            default=".jpg",
-            help="Suffix of the image files",
-        )
-
         parser.add_argument(
             "--test_run",
             action="store_true",
@@ -103,16 +92,140 @@ class Command(BaseCommand):
             help="Number of frames to test",
         )
 
+        parser.add_argument(
+            "--device",
+            type=str,
+            default=None,
+            help="Inference device (cpu, cuda, cuda:0, ...). Defaults to cuda if available",
+        )
+
+        parser.add_argument(
+            "--intra_op_threads",
+            type=int,
+            default=None,
+            help="Number of torch intra-op threads for CPU inference",
+        )
+
+        parser.add_argument(
+            "--inter_op_threads",
+            type=int,
+            default=None,
+            help="Number of torch inter-op threads for CPU inference",
+        )
+
+        parser.add_argument(
+            "--from_video",
+            "--from-video",
+            dest="from_video",
+            action="store_true",
+            default=False,
+            help="Decode frames straight from the video file, without extracted frames on disk",
+        )
+
+        parser.add_argument(
+            "--sparse_stride",
+            type=int,
+            default=None,
+            help="Only classify every n-th frame and refine label transitions by bisection",
+        )
+
+        parser.add_argument(
+            "--sparse_tolerance",
+            type=int,
+            default=1,
+            help="Maximum error of segment boundaries in frames for sparse prediction",
+        )
+
+        parser.add_argument(
+            "--preprocessing",
+            type=str,
+            choices=["item", "batch"],
+            default=None,
+            help="Normalize every frame in the dataset (item) or ship uint8 frames and normalize per batch (batch)",
+        )
+
+        parser.add_argument(
+            "--pipeline_threads",
+            type=int,
+            default=None,
+            help="Decode frames in this many threads, overlapping the forward pass (with num_workers 0)",
+        )
+
+        parser.add_argument(
+            "--backend",
+            type=str,
+            choices=BACKENDS,
+            default=None,
+            help="Inference backend, exports are cached next to the checkpoint",
+        )
+
+        parser.add_argument(
+            "--precision",
+            type=str,
+            choices=PRECISIONS,
+            default=None,
+            help="Reduced precision variant, must be validated with validate_precision first",
+        )
+
+        parser.add_argument(
+            "--filters",
+            type=str,
+            default=None,
+            help=(
+                "Per label temporal filters replacing the moving average, e.g. "
+                '"default=box:1;blood=median:1,hysteresis:0.3:0.7" '
+                "(box:<s>, ema:<half life s>, median:<s>, hysteresis:<low>:<high>)"
+            ),
+        )
+
+        parser.add_argument(
+            "--autotune",
+            action="store_true",
+            default=None,
+            help="Use the batch size and thread count tuned for this host, probing once if none is cached",
+        )
+
+        parser.add_argument(
+            "--stream_segments",
+            action="store_true",
+            default=False,
+            help=(
+                "Store every label video segment as soon as it closes while the video is "
+                "classified, instead of after the whole video (moving average only)"
+            ),
+        )
+
+        parser.add_argument(
+            "--repostprocess",
+            action="store_true",
+            default=False,
+            help=(
+                "Only recompute smoothing, binarization and segments from the prediction "
+                "matrix stored by an earlier prediction with this ModelMeta"
+            ),
+        )
+
     def handle(self, *args, **options):
         video_uuid = options["raw_video_uuid"]
-        dataset_name = options["dataset_name"]
         meta_name = options["meta_name"]
         meta_version = options["model_meta_version"]
         smooth_window_size_s = options["smooth_window_size_s"]
         binarize_threshold = options["binarize_threshold"]
-        img_suffix = options["img_suffix"]
         test_run = options["test_run"]
         n_test_frames = options["n_test_frames"]
+        device = options["device"]
+        intra_op_threads = options["intra_op_threads"]
+        inter_op_threads = options["inter_op_threads"]
+        from_video = options["from_video"]
+        sparse_stride = options["sparse_stride"]
+        sparse_tolerance = options["sparse_tolerance"]
+        preprocessing = options["preprocessing"]
+        pipeline_threads = options["pipeline_threads"]
+        backend = options["backend"]
+        precision = options["precision"]
+        filters = options["filters"]
+        autotune = options["autotune"]
+        stream_segments = options["stream_segments"]
 
         if not meta_version:
             version = ModelMeta.get_latest_version(name=meta_name)
@@ -128,13 +241,37 @@ class Command(BaseCommand):
 
         assert raw_video_object is not None, "Raw video not found"
 
-        raw_video_object.predict_video(
+        if options["repostprocess"]:
+            sequences = repostprocess_video(
+                raw_video_object,
+                model_meta_name=meta_name,
+                model_meta_version=version,
+                smooth_window_size_s=smooth_window_size_s,
+                binarize_threshold=binarize_threshold,
+                filters=filters,
+            )
+            ic({label: len(s) for label, s in sequences.items()})
+            return
+
+        predict_video(
+            raw_video_object,
             model_meta_name=meta_name,
-            dataset_name=dataset_name,
             model_meta_version=version,
             smooth_window_size_s=smooth_window_size_s,
             binarize_threshold=binarize_threshold,
-            img_suffix=img_suffix,
             test_run=test_run,
             n_test_frames=n_test_frames,
+            device=device,
+            intra_op_threads=intra_op_threads,
+            inter_op_threads=inter_op_threads,
+            from_video=from_video,
+            sparse_stride=sparse_stride,
+            sparse_tolerance=sparse_tolerance,
+            preprocessing=preprocessing,
+            pipeline_threads=pipeline_threads,
+            backend=backend,
+            precision=precision,
+            filters=filters,
+            autotune=autotune,
+            stream_segments=stream_segments,
         )
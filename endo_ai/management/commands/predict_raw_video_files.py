@@ -1,18 +1,49 @@
+import time
+from functools import partial
+
 from icecream import ic
 
 from django.core.management import BaseCommand  # , call_command
+from django.db import connections
 from endoreg_db.models import (
     ModelMeta,
     RawVideoFile,
 )
+from endo_ai.predictor.fingerprint import (
+    FINGERPRINT_KEY,
+    get_fingerprint_options,
+    get_prediction_fingerprint,
+    get_stale_videos,
+)
+from endo_ai.predictor.model_cache import model_cache
+from endo_ai.predictor.video_prediction import (
+    get_inference_config,
+    get_inference_model,
+    tune_inference_config,
+)
+from endo_ai.predictor.video_pool import (
+    get_worker_threads,
+    init_prediction_worker,
+    predict_raw_video_file_task,
+    run_pool,
+    summarize_results,
+)
+from endo_ai.predictor.backends import BACKENDS
+from endo_ai.predictor.quantization import PRECISIONS
 
 
 # Example usage:
-# python manage.py predict_raw_video_file --raw_video_uuid 138c846e649a40eb84d6633c99f7e704 --model_meta_version 7 --test_run
+# python manage.py predict_raw_video_files --model_meta_version 7 --test_run
+# python manage.py predict_raw_video_files --workers 4 --device cpu
+# python manage.py predict_raw_video_files --dry_run  # list new / stale videos
 
 
 class Command(BaseCommand):
     help = """
+        Predicts all RawVideoFiles (or --raw_video_uuids) whose prediction is missing or
+        stale. Every prediction stores a fingerprint of the video hash, the ModelMeta and
+        the preprocessing and prediction settings; videos with a matching fingerprint are
+        skipped unless --force is set.
     """
 
     def add_arguments(self, parser):
@@ -30,13 +61,6 @@ class Command(BaseCommand):
             help="Model Version",
         )
 
-        parser.add_argument(
-            "--dataset_name",
-            type=str,
-            default="inference_dataset",
-            help="Name of the dataset",
-        )
-
         parser.add_argument(
             "--smooth_window_size_s",
             type=float,
@@ -52,14 +76,6 @@ class Command(BaseCommand):
             help="Threshold for binarization",
         )
 
-        # img_suffix
-        parser.add_argument(
-            "--img_suffix",
-            type=str,
-            default=".jpg",
-            help="Suffix of the image files",
-        )
-
         parser.add_argument(
             "--test_run",
             action="store_true",
@@ -75,15 +91,163 @@ class Command(BaseCommand):
             help="Number of frames to test",
         )
 
+        parser.add_argument(
+            "--device",
+            type=str,
+            default=None,
+            help="Inference device (cpu, cuda, cuda:0, ...). Defaults to cuda if available",
+        )
+
+        parser.add_argument(
+            "--intra_op_threads",
+            type=int,
+            default=None,
+            help="Number of torch intra-op threads for CPU inference",
+        )
+
+        parser.add_argument(
+            "--inter_op_threads",
+            type=int,
+            default=None,
+            help="Number of torch inter-op threads for CPU inference",
+        )
+
+        parser.add_argument(
+            "--from_video",
+            "--from-video",
+            dest="from_video",
+            action="store_true",
+            default=False,
+            help="Decode frames straight from the video file, without extracted frames on disk",
+        )
+
+        parser.add_argument(
+            "--sparse_stride",
+            type=int,
+            default=None,
+            help="Only classify every n-th frame and refine label transitions by bisection",
+        )
+
+        parser.add_argument(
+            "--sparse_tolerance",
+            type=int,
+            default=1,
+            help="Maximum error of segment boundaries in frames for sparse prediction",
+        )
+
+        parser.add_argument(
+            "--preprocessing",
+            type=str,
+            choices=["item", "batch"],
+            default=None,
+            help="Normalize every frame in the dataset (item) or ship uint8 frames and normalize per batch (batch)",
+        )
+
+        parser.add_argument(
+            "--pipeline_threads",
+            type=int,
+            default=None,
+            help="Decode frames in this many threads, overlapping the forward pass (with num_workers 0)",
+        )
+
+        parser.add_argument(
+            "--backend",
+            type=str,
+            choices=BACKENDS,
+            default=None,
+            help="Inference backend, exports are cached next to the checkpoint",
+        )
+
+        parser.add_argument(
+            "--precision",
+            type=str,
+            choices=PRECISIONS,
+            default=None,
+            help="Reduced precision variant, must be validated with validate_precision first",
+        )
+
+        parser.add_argument(
+            "--filters",
+            type=str,
+            default=None,
+            help=(
+                "Per label temporal filters replacing the moving average, e.g. "
+                '"default=box:1;blood=median:1,hysteresis:0.3:0.7" '
+                "(box:<s>, ema:<half life s>, median:<s>, hysteresis:<low>:<high>)"
+            ),
+        )
+
+        parser.add_argument(
+            "--autotune",
+            action="store_true",
+            default=None,
+            help=(
+                "Use the batch size and thread count tuned for this host, probing once "
+                "before the workers start if none is cached"
+            ),
+        )
+
+        parser.add_argument(
+            "--stream_segments",
+            action="store_true",
+            default=False,
+            help=(
+                "Store every label video segment as soon as it closes while the video is "
+                "classified, instead of after the whole video (moving average only)"
+            ),
+        )
+
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help=(
+                "Predict this many videos in parallel worker processes, each loading the "
+                "model once. Without --intra_op_threads the cores are split evenly"
+            ),
+        )
+
+        parser.add_argument(
+            "--raw_video_uuids",
+            type=str,
+            default=None,
+            help="Comma separated RawVideoFile UUIDs, defaults to all",
+        )
+
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            default=False,
+            help="Predict all videos, also those with a current prediction",
+        )
+
+        parser.add_argument(
+            "--dry_run",
+            action="store_true",
+            default=False,
+            help="Only list the videos which would be predicted",
+        )
+
     def handle(self, *args, **options):
-        dataset_name = options["dataset_name"]
         meta_name = options["meta_name"]
         meta_version = options["model_meta_version"]
         smooth_window_size_s = options["smooth_window_size_s"]
         binarize_threshold = options["binarize_threshold"]
-        img_suffix = options["img_suffix"]
         test_run = options["test_run"]
         n_test_frames = options["n_test_frames"]
+        device = options["device"]
+        intra_op_threads = options["intra_op_threads"]
+        inter_op_threads = options["inter_op_threads"]
+        from_video = options["from_video"]
+        sparse_stride = options["sparse_stride"]
+        sparse_tolerance = options["sparse_tolerance"]
+        preprocessing = options["preprocessing"]
+        pipeline_threads = options["pipeline_threads"]
+        backend = options["backend"]
+        precision = options["precision"]
+        filters = options["filters"]
+        autotune = options["autotune"]
+        stream_segments = options["stream_segments"]
 
         if not meta_version:
             version = ModelMeta.get_latest_version(name=meta_name)
@@ -94,16 +258,135 @@ class Command(BaseCommand):
             ic("Version Provided: ", version)
             assert version is not None, "ModelMeta not found"
 
-        raw_video_files = RawVideoFile.objects.all()
-
-        for raw_video_file in raw_video_files:
-            raw_video_file.predict_video(
-                model_meta_name=meta_name,
-                dataset_name=dataset_name,
-                model_meta_version=version,
-                smooth_window_size_s=smooth_window_size_s,
-                binarize_threshold=binarize_threshold,
-                img_suffix=img_suffix,
-                test_run=test_run,
-                n_test_frames=n_test_frames,
+        workers = options["workers"]
+        if workers > 1:
+            intra_op_threads = get_worker_threads(workers, intra_op_threads)
+            ic(f"{workers} workers with {intra_op_threads} intra-op threads each")
+
+        raw_video_files = RawVideoFile.objects.all()  # pylint: disable=no-member
+        if options["raw_video_uuids"]:
+            raw_video_files = raw_video_files.filter(
+                uuid__in=options["raw_video_uuids"].split(",")
+            )
+
+        predict_kwargs = {
+            "model_meta_name": meta_name,
+            "model_meta_version": version,
+            "smooth_window_size_s": smooth_window_size_s,
+            "binarize_threshold": binarize_threshold,
+            "test_run": test_run,
+            "n_test_frames": n_test_frames,
+            "device": device,
+            "intra_op_threads": intra_op_threads,
+            "inter_op_threads": inter_op_threads,
+            "from_video": from_video,
+            "sparse_stride": sparse_stride,
+            "sparse_tolerance": sparse_tolerance,
+            "preprocessing": preprocessing,
+            "pipeline_threads": pipeline_threads,
+            "backend": backend,
+            "precision": precision,
+            "filters": filters,
+            "autotune": autotune,
+            "stream_segments": stream_segments,
+        }
+        config_overrides = {
+            key: predict_kwargs[key]
+            for key in ["device", "intra_op_threads", "preprocessing", "backend", "precision"]
+        }
+
+        uuids = self.get_videos_to_predict(
+            raw_video_files, meta_name, version, predict_kwargs, options
+        )
+        if options["dry_run"] or not uuids:
+            return
+
+        if autotune:
+            # probe (if nothing is cached) once here: parallel probes in every worker
+            # would measure each other's load
+            model_meta = ModelMeta.get_by_name(meta_name, version)
+            config = get_inference_config(model_meta, **config_overrides)
+            tuning = tune_inference_config(
+                model_meta, config, get_inference_model(model_meta, config)
+            )
+            ic(f"Tuned batchsize: {tuning['batchsize']}, threads: {tuning['intra_op_threads']}")
+            predict_kwargs["tuning"] = tuning
+            if workers > 1:
+                # the workers load their own copy
+                model_cache.invalidate(meta_name, version)
+
+        # workers open their own connections, none is inherited
+        connections.close_all()
+
+        results = []
+        start = time.perf_counter()
+        for result in run_pool(
+            uuids,
+            partial(predict_raw_video_file_task, predict_kwargs=predict_kwargs),
+            workers=workers,
+            initializer=init_prediction_worker,
+            initargs=(meta_name, version, config_overrides),
+        ):
+            results.append(result)
+            status = "ok" if result["ok"] else "FAILED"
+            ic(f"[{len(results)}/{len(uuids)}] {result['item']} {status} ({result['seconds']:.1f}s)")
+            if not result["ok"]:
+                ic(result["error"])
+
+        summary = summarize_results(results, time.perf_counter() - start)
+        self.stdout.write(
+            f"Predicted {summary['n_videos']} videos ({summary['n_failed']} failed) "
+            f"in {summary['wall_seconds']:.1f}s: {summary['videos_per_hour']:.1f} videos/hour, "
+            f"{summary['frames_per_s']:.1f} frames/s"
+        )
+        for uuid, error in summary["failed"].items():
+            self.stdout.write(f"Failed {uuid}: {error}")
+        assert not summary["failed"], f"Prediction failed for {summary['n_failed']} videos"
+
+    def get_videos_to_predict(self, raw_video_files, meta_name, version, predict_kwargs, options):
+        """
+        Compares the stored fingerprints (one query, only the fingerprint key of the
+        predictions is loaded) with the fingerprints of the current settings.
+        """
+        model_meta = ModelMeta.get_by_name(meta_name, version)
+        config = get_inference_config(
+            model_meta,
+            preprocessing=predict_kwargs["preprocessing"],
+            backend=predict_kwargs["backend"],
+            precision=predict_kwargs["precision"],
+        )
+        fingerprint_options = get_fingerprint_options(
+            **{
+                key: predict_kwargs[key]
+                for key in [
+                    "smooth_window_size_s",
+                    "binarize_threshold",
+                    "test_run",
+                    "n_test_frames",
+                    "from_video",
+                    "sparse_stride",
+                    "sparse_tolerance",
+                    "filters",
+                ]
+            }
+        )
+
+        stored, expected = {}, {}
+        for uuid, video_hash, fingerprint in raw_video_files.values_list(
+            "uuid", "video_hash", f"predictions__{FINGERPRINT_KEY}"
+        ):
+            uuid = str(uuid)
+            stored[uuid] = fingerprint
+            expected[uuid] = get_prediction_fingerprint(
+                video_hash, model_meta.name, model_meta.version, config, fingerprint_options
             )
+
+        stale = get_stale_videos(stored, expected, force=options["force"])
+        prefix = "Would predict" if options["dry_run"] else "Predicting"
+        for uuid, reason in stale.items():
+            self.stdout.write(f"{prefix} {uuid} ({reason})")
+        self.stdout.write(
+            f"{len(stale)} of {len(expected)} videos to predict, "
+            f"{len(expected) - len(stale)} current"
+        )
+        return list(stale)
@@ -0,0 +1,177 @@
+"""
+Selects frames of predicted videos for image annotation and creates
+BinaryClassificationAnnotationTasks for them.
+"""
+
+from django.core.management import BaseCommand
+from django.db import transaction
+from icecream import ic
+from endoreg_db.models import BinaryClassificationAnnotationTask, Frame, Label, Video
+
+from endo_ai.predictor.frame_selection import (
+    SELECTION_MODES,
+    get_frame_numbers,
+    select_annotation_frames,
+)
+
+
+# Example usage:
+# python manage.py select_annotation_frames --nice_task_label gg-pilot-nice --paris_task_label gg-pilot-paris --dry_run
+# python manage.py select_annotation_frames --nice_task_label gg-pilot-nice --paris_task_label gg-pilot-paris
+
+
+class Command(BaseCommand):
+    help = """
+        Selects about one frame per second of the target label (default polyp) in every
+        predicted Video, without excluded labels (default outside), separately for frames
+        with the split label (default nbi, for the NICE classification) and without it
+        (for the Paris classification). The selection runs on the stored prediction matrix
+        of every video (no per-frame queries); the tasks are created with bulk_create.
+        Frames which already have a task for the task label are skipped.
+        Tasks reference Frames of the (anonymized) Video, so the selection reads
+        Video.predictions: the copy of RawVideoFile.predictions (written by the predict
+        commands) which create_anonym_videos stores when it creates the Video
+        (RawVideoFile.get_or_create_video / Video.sync_from_raw_video). Run
+        predict_raw_video_files and create_anonym_videos first.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--video_uuids",
+            type=str,
+            default=None,
+            help="Comma separated video UUIDs, defaults to all videos with predictions",
+        )
+
+        parser.add_argument("--target_label", type=str, default="polyp", help="Label to select")
+
+        parser.add_argument(
+            "--exclude_labels",
+            type=str,
+            default="outside",
+            help="Comma separated labels which must not be predicted",
+        )
+
+        parser.add_argument(
+            "--split_label",
+            type=str,
+            default="nbi",
+            help="Label splitting the selection in two task sets",
+        )
+
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.5,
+            help="Threshold above which a label counts as predicted",
+        )
+
+        parser.add_argument(
+            "--frames_per_s", type=float, default=1, help="Selected frames per second"
+        )
+
+        parser.add_argument(
+            "--mode",
+            type=str,
+            choices=SELECTION_MODES,
+            default="confidence",
+            help="Pick the most confident or a random frame per second",
+        )
+
+        parser.add_argument("--seed", type=int, default=None, help="Seed for --mode random")
+
+        parser.add_argument(
+            "--nice_task_label",
+            type=str,
+            required=True,
+            help="Task label of the frames with the split label (NICE classification)",
+        )
+
+        parser.add_argument(
+            "--paris_task_label",
+            type=str,
+            required=True,
+            help="Task label of the frames without the split label (Paris classification)",
+        )
+
+        parser.add_argument(
+            "--dry_run",
+            action="store_true",
+            default=False,
+            help="Only report the number of selected frames",
+        )
+
+    def handle(self, *args, **options):
+        split_label = options["split_label"]
+        # with one label the second task set would be deduplicated against the first
+        assert options["nice_task_label"] != options["paris_task_label"], (
+            "--nice_task_label and --paris_task_label must differ"
+        )
+        exclude_labels = [
+            label.strip() for label in options["exclude_labels"].split(",") if label.strip()
+        ]
+        task_labels = {
+            f"with_{split_label}": Label.objects.get(name=options["nice_task_label"]),
+            f"without_{split_label}": Label.objects.get(name=options["paris_task_label"]),
+        }
+
+        # predictions copied from the RawVideoFile by create_anonym_videos
+        videos = Video.objects.exclude(predictions={})
+        if options["video_uuids"]:
+            videos = videos.filter(uuid__in=options["video_uuids"].split(","))
+        if not videos.exists():
+            self.stdout.write(
+                "No Video with predictions, run predict_raw_video_files and "
+                "create_anonym_videos first"
+            )
+            return
+
+        totals = {key: 0 for key in task_labels}
+        for video in videos.iterator():
+            prediction_dict = video.predictions
+            selection = select_annotation_frames(
+                prediction_dict["predictions"],
+                prediction_dict["labels"],
+                fps=video.get_fps(),
+                frame_numbers=get_frame_numbers(prediction_dict),
+                target_label=options["target_label"],
+                exclude_labels=exclude_labels,
+                split_label=split_label,
+                threshold=options["threshold"],
+                frames_per_s=options["frames_per_s"],
+                mode=options["mode"],
+                seed=options["seed"],
+            )
+
+            for key, frame_numbers in selection.items():
+                totals[key] += len(frame_numbers)
+                if options["dry_run"] or not len(frame_numbers):
+                    continue
+                self.create_tasks(video, frame_numbers.tolist(), task_labels[key])
+
+            ic(video.uuid, {key: len(v) for key, v in selection.items()})
+
+        ic(f"Selected frames: {totals}" + (" (dry run)" if options["dry_run"] else ""))
+
+    @staticmethod
+    def create_tasks(video, frame_numbers, label):
+        """One frame query and one bulk insert per video and task label"""
+        existing = set(
+            BinaryClassificationAnnotationTask.objects.filter(
+                frame__video=video, label=label
+            ).values_list("frame__frame_number", flat=True)
+        )
+        frames = Frame.objects.filter(
+            video=video, frame_number__in=[n for n in frame_numbers if n not in existing]
+        ).only("pk", "image")
+
+        tasks = [
+            BinaryClassificationAnnotationTask(
+                label=label,
+                frame=frame,
+                image_path=frame.image.path if frame.image else None,
+            )
+            for frame in frames
+        ]
+        with transaction.atomic():
+            BinaryClassificationAnnotationTask.objects.bulk_create(tasks, batch_size=1000)
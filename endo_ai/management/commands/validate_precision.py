@@ -0,0 +1,224 @@
+"""
+Validates a reduced precision variant of a ModelMeta against fp32 and activates it if the
+predicted segments are unchanged within a tolerance.
+"""
+
+from django.core.management import BaseCommand
+from icecream import ic
+from endoreg_db.models import ModelMeta, RawVideoFile
+
+from endo_ai.predictor.backends import get_weights_hash
+from endo_ai.predictor.inference_model import InferenceNet
+from endo_ai.predictor.predict import Classifier
+from endo_ai.predictor.quantization import (
+    PRECISIONS,
+    build_precision_model,
+    compare_sequences,
+    get_calibration_batches,
+    write_validation_report,
+)
+from endo_ai.predictor.video_prediction import get_inference_config, get_sorted_frame_paths
+
+
+# Example usage:
+# python manage.py validate_precision --precision int8_static --n_videos 4 --n_calibration_videos 2
+# python manage.py validate_precision --precision bf16 --raw_video_uuids <uuid>,<uuid>
+
+
+class Command(BaseCommand):
+    help = """
+        Compares the per label filtered_sequences (post_process_predictions) of a reduced
+        precision variant (int8_static, bf16) with fp32 on videos with extracted frames.
+        int8_static is calibrated on frames of the first --n_calibration_videos videos and
+        validated on the remaining, held-out videos only.
+        The variant is activated for the weights of the ModelMeta only if on every video and
+        label the number of segments is unchanged and no boundary moved by more than
+        --boundary_tolerance_s. The report is written next to the checkpoint either way.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--meta_name",
+            type=str,
+            default="image_multilabel_classification_colonoscopy_default",
+            help="Name of the ModelMeta",
+        )
+
+        parser.add_argument(
+            "--model_meta_version",
+            type=int,
+            default=None,
+            help="Model Version, defaults to the latest",
+        )
+
+        parser.add_argument(
+            "--precision",
+            type=str,
+            required=True,
+            choices=[p for p in PRECISIONS if p != "fp32"],
+            help="Variant to validate",
+        )
+
+        parser.add_argument(
+            "--raw_video_uuids",
+            type=str,
+            default=None,
+            help="Comma separated RawVideoFile UUIDs, defaults to videos with extracted frames",
+        )
+
+        parser.add_argument(
+            "--n_videos",
+            type=int,
+            default=3,
+            help="Number of videos if no UUIDs are given",
+        )
+
+        parser.add_argument(
+            "--n_calibration_videos",
+            type=int,
+            default=1,
+            help="Videos used for int8_static calibration, excluded from the validation",
+        )
+
+        parser.add_argument(
+            "--max_frames",
+            type=int,
+            default=None,
+            help="Only use the first max_frames frames per video",
+        )
+
+        parser.add_argument(
+            "--n_calibration_frames",
+            type=int,
+            default=256,
+            help="Number of calibration frames for static quantization",
+        )
+
+        parser.add_argument(
+            "--smooth_window_size_s",
+            type=float,
+            default=1,
+            help="Size of the smoothing window in seconds",
+        )
+
+        parser.add_argument(
+            "--min_seq_len_s",
+            type=float,
+            default=0.5,
+            help="Minimum sequence length in seconds",
+        )
+
+        parser.add_argument(
+            "--boundary_tolerance_s",
+            type=float,
+            default=0.5,
+            help="Maximum shift of a segment boundary in seconds",
+        )
+
+    def handle(self, *args, **options):
+        meta_name = options["meta_name"]
+        meta_version = options["model_meta_version"]
+        precision = options["precision"]
+
+        if not meta_version:
+            meta_version = ModelMeta.get_latest_version(name=meta_name)
+            ic(f"No Version Provided, Using Latest Version: {meta_version}")
+        assert meta_version is not None, "ModelMeta not found"
+
+        model_meta = ModelMeta.get_by_name(meta_name, meta_version)
+        config = get_inference_config(model_meta)
+        weights_path = model_meta.weights.path
+
+        if options["raw_video_uuids"]:
+            uuids = options["raw_video_uuids"].split(",")
+            videos = [RawVideoFile.objects.get(uuid=uuid) for uuid in uuids]  # pylint: disable=no-member
+        else:
+            videos = list(
+                RawVideoFile.objects.filter(state_frames_extracted=True)[: options["n_videos"]]  # pylint: disable=no-member
+            )
+        assert videos, "No videos with extracted frames found"
+
+        video_frames = []
+        for video in videos:
+            assert video.state_frames_extracted, f"Frames not extracted: {video.uuid}"
+            paths, _indices = get_sorted_frame_paths(video)
+            paths = [p.resolve().as_posix() for p in paths[: options["max_frames"]]]
+            crops = [video.get_crop_template() for _ in paths]
+            video_frames.append((video, paths, crops))
+
+        # calibration frames must not be part of the validation
+        calibration_frames, validation_frames = [], video_frames
+        if precision == "int8_static":
+            n_calibration = options["n_calibration_videos"]
+            calibration_frames = video_frames[:n_calibration]
+            validation_frames = video_frames[n_calibration:]
+            assert calibration_frames and validation_frames, (
+                f"int8_static needs at least {n_calibration + 1} videos: "
+                f"{n_calibration} for calibration and one held out for validation"
+            )
+
+        model = InferenceNet.load_from_checkpoint(
+            checkpoint_path=weights_path,
+            map_location="cpu",
+        )
+        model.eval()
+
+        calibration_batches = None
+        if precision == "int8_static":
+            n_per_video = max(options["n_calibration_frames"] // len(calibration_frames), 1)
+            calibration_batches = []
+            for _video, paths, crops in calibration_frames:
+                calibration_batches += get_calibration_batches(
+                    paths, crops, config, n_frames=n_per_video
+                )
+
+        variant = build_precision_model(
+            model, precision, weights_path, config, calibration_batches
+        )
+        reference_classifier = Classifier(model, config=config, device="cpu")
+        variant_classifier = Classifier(variant, config=config, device="cpu")
+
+        report = {
+            "meta_name": meta_name,
+            "meta_version": meta_version,
+            "precision": precision,
+            "weights_hash": get_weights_hash(weights_path),
+            "boundary_tolerance_s": options["boundary_tolerance_s"],
+            "calibration_videos": [str(video.uuid) for video, *_ in calibration_frames],
+            "videos": {},
+        }
+        for video, paths, crops in validation_frames:
+            fps = video.get_fps()
+            sequences = []
+            for classifier in [reference_classifier, variant_classifier]:
+                predictions = classifier.pipe(paths, crops, output="array")
+                *_, filtered_sequences = classifier.post_process_predictions(
+                    predictions,
+                    window_size_s=options["smooth_window_size_s"],
+                    fps=fps,
+                    min_seq_len_s=options["min_seq_len_s"],
+                )
+                sequences.append(filtered_sequences)
+
+            video_report = compare_sequences(
+                sequences[0],
+                sequences[1],
+                n_frames=len(paths),
+                boundary_tolerance=int(options["boundary_tolerance_s"] * fps),
+            )
+            report["videos"][str(video.uuid)] = video_report
+            ic(f"{video.uuid}: {video_report}")
+
+        failed = [
+            (uuid, label)
+            for uuid, video_report in report["videos"].items()
+            for label, label_report in video_report.items()
+            if not label_report["passed"]
+        ]
+        report["passed"] = not failed
+
+        report_path = write_validation_report(weights_path, precision, report)
+        ic(f"Validation report: {report_path}")
+
+        assert not failed, f"Refusing to activate {precision}, segments changed for: {failed}"
+        self.stdout.write(f"Activated {precision} for {meta_name} v{meta_version}")
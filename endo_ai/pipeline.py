@@ -0,0 +1,265 @@
+"""
+Dependency graph runner for the processing pipeline (see scripts/run_pipeline.py).
+
+Every stage declares the artifacts it consumes (inputs) and produces (outputs), e.g.
+"import_video" consumes "base_data" and produces "raw_videos". A stage depends on the
+stages producing its inputs; stages without a path between them run in parallel (in
+subprocesses, up to max_parallel at a time). Completed stages are checkpointed in a JSON
+state file with a signature of their command, so a rerun resumes after the last failure
+and skips finished stages, unless their command changed or an upstream stage ran again.
+"""
+
+import hashlib
+import json
+import subprocess
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from icecream import ic
+
+# stage states in the report
+RAN = "ran"
+CACHED = "cached"
+FAILED = "failed"
+BLOCKED = "blocked"
+
+
+class Stage:
+    """
+    One pipeline step.
+
+    Args:
+        name (str): Unique stage name.
+        command (list | callable): Subprocess arguments, e.g. ["python", "manage.py",
+            "migrate"], or a callable without arguments (returning nothing or raising).
+        inputs (tuple): Artifacts this stage consumes.
+        outputs (tuple): Artifacts this stage produces.
+    """
+
+    def __init__(self, name, command, inputs=(), outputs=()):
+        self.name = name
+        self.command = command
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+
+    def __repr__(self):
+        return f"Stage({self.name})"
+
+    def get_signature(self):
+        """Changes when the command or the declared artifacts change"""
+        command = self.command
+        if callable(command):
+            command = f"{command.__module__}.{command.__qualname__}"
+        payload = json.dumps([command, self.inputs, self.outputs], default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Pipeline:
+    """
+    Args:
+        stages (list): Stage objects; every input must be the output of exactly one stage
+            or one of sources.
+        state_path (str | Path, optional): Checkpoint file, None disables checkpoints.
+        max_parallel (int): Maximum number of stages running at the same time.
+        log_dir (str | Path, optional): stdout / stderr of subprocess stages go to
+            <log_dir>/<stage>.log, so parallel output does not interleave. None inherits
+            the output of this process.
+        sources (tuple): Artifacts which exist before the pipeline runs.
+    """
+
+    def __init__(self, stages, state_path=None, max_parallel=4, log_dir=None, sources=()):
+        self.stages = {}
+        for stage in stages:
+            assert stage.name not in self.stages, f"Duplicate stage {stage.name}"
+            self.stages[stage.name] = stage
+        self.state_path = Path(state_path) if state_path else None
+        self.max_parallel = max(1, max_parallel)
+        self.log_dir = Path(log_dir) if log_dir else None
+        self.wall_seconds = None
+
+        producers = {}
+        for stage in stages:
+            for artifact in stage.outputs:
+                assert artifact not in producers, (
+                    f"{artifact} is produced by {producers[artifact]} and {stage.name}"
+                )
+                producers[artifact] = stage.name
+
+        self.dependencies = {}
+        for stage in stages:
+            missing = [a for a in stage.inputs if a not in producers and a not in sources]
+            assert not missing, f"No stage produces {missing}, required by {stage.name}"
+            self.dependencies[stage.name] = {
+                producers[a] for a in stage.inputs if a in producers
+            }
+        self.order = self.topological_order()
+
+    def topological_order(self):
+        """Stage names in dependency order, fails on cycles"""
+        remaining = {name: set(deps) for name, deps in self.dependencies.items()}
+        order = []
+        while remaining:
+            ready = sorted(name for name, deps in remaining.items() if not deps)
+            assert ready, f"Dependency cycle between {sorted(remaining)}"
+            for name in ready:
+                order.append(name)
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+        return order
+
+    def get_upstream(self, targets):
+        """The targets and all stages they depend on"""
+        selected, queue = set(), list(targets)
+        while queue:
+            name = queue.pop()
+            assert name in self.stages, f"Unknown stage {name}, choose from {self.order}"
+            if name not in selected:
+                selected.add(name)
+                queue.extend(self.dependencies[name])
+        return selected
+
+    def load_state(self):
+        if self.state_path is None or not self.state_path.exists():
+            return {}
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_state(self, state):
+        if self.state_path is None:
+            return
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_name(self.state_path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+        tmp_path.replace(self.state_path)
+
+    def run_stage(self, stage):
+        """Runs one stage, raises on failure"""
+        if callable(stage.command):
+            stage.command()
+            return
+
+        if self.log_dir is None:
+            subprocess.run(stage.command, check=True)
+            return
+
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        log_path = self.log_dir / f"{stage.name}.log"
+        with open(log_path, "w", encoding="utf-8") as log_file:
+            result = subprocess.run(
+                stage.command, stdout=log_file, stderr=subprocess.STDOUT, check=False
+            )
+        assert result.returncode == 0, (
+            f"{stage.name} exited with {result.returncode}, see {log_path}"
+        )
+
+    def _timed_run(self, stage, pipeline_start):
+        start = time.perf_counter()
+        try:
+            self.run_stage(stage)
+            error = None
+        except Exception as e:  # pylint: disable=broad-except
+            error = f"{type(e).__name__}: {e}"
+        end = time.perf_counter()
+        return {
+            "status": RAN if error is None else FAILED,
+            "start": start - pipeline_start,
+            "seconds": end - start,
+            "error": error,
+        }
+
+    def run(self, targets=None, restart=False):
+        """
+        Runs the pipeline (or the targets and their upstream stages).
+
+        Args:
+            targets (list, optional): Stage names, defaults to all stages.
+            restart (bool): Ignore the checkpoints and run every stage.
+
+        Returns:
+            dict: stage name -> {"status", "start", "seconds", "error"} in dependency order.
+        """
+        selected = self.get_upstream(targets) if targets else set(self.order)
+        state = {} if restart else self.load_state()
+        if restart:
+            self.save_state(state)
+
+        results = {}
+        pending = [name for name in self.order if name in selected]
+        running = {}
+        pipeline_start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_parallel) as executor:
+            while pending or running:
+                for name in list(pending):
+                    deps = self.dependencies[name] & selected
+                    if any(results.get(d, {}).get("status") in (FAILED, BLOCKED) for d in deps):
+                        # a failed upstream stage blocks everything downstream
+                        results[name] = {"status": BLOCKED, "start": None, "seconds": 0.0}
+                        pending.remove(name)
+                        continue
+                    if not all(d in results for d in deps):
+                        continue
+                    if len(running) >= self.max_parallel:
+                        break
+
+                    pending.remove(name)
+                    stage = self.stages[name]
+                    checkpoint = state.get(name)
+                    upstream_ran = any(results[d]["status"] == RAN for d in deps)
+                    if (
+                        checkpoint
+                        and checkpoint["signature"] == stage.get_signature()
+                        and not upstream_ran
+                    ):
+                        results[name] = {
+                            "status": CACHED,
+                            "start": None,
+                            "seconds": checkpoint["seconds"],
+                        }
+                        continue
+
+                    ic(f"Starting {name}")
+                    running[executor.submit(self._timed_run, stage, pipeline_start)] = name
+
+                if not running:
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    result = future.result()
+                    results[name] = result
+                    if result["status"] == RAN:
+                        ic(f"Finished {name} in {result['seconds']:.1f}s")
+                        state[name] = {
+                            "signature": self.stages[name].get_signature(),
+                            "seconds": result["seconds"],
+                            "finished": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                        }
+                        self.save_state(state)
+                    else:
+                        ic(f"Failed {name}: {result['error']}")
+                        state.pop(name, None)
+                        self.save_state(state)
+
+        self.wall_seconds = time.perf_counter() - pipeline_start
+        return {name: results[name] for name in self.order if name in results}
+
+
+def format_report(results, wall_seconds):
+    """Per stage timing table; cached stages show the duration of their checkpointed run"""
+    lines = [f"{'stage':<32} {'status':<8} {'start s':>9} {'seconds':>9}"]
+    for name, result in results.items():
+        start = "" if result.get("start") is None else f"{result['start']:.1f}"
+        lines.append(f"{name:<32} {result['status']:<8} {start:>9} {result['seconds']:>9.1f}")
+        if result.get("error"):
+            lines.append(f"    {result['error']}")
+    ran = sum(r["seconds"] for r in results.values() if r["status"] == RAN)
+    lines.append(
+        f"wall {wall_seconds:.1f}s, sum of executed stages {ran:.1f}s "
+        f"(parallel speedup {ran / max(wall_seconds, 1e-9):.2f}x)"
+    )
+    return "\n".join(lines)
@@ -0,0 +1,257 @@
+"""
+Batch size and thread tuning for CPU / GPU inference.
+
+A short probe runs the model on synthetic inputs of the configured size over a grid of
+batch sizes and torch intra-op thread counts and keeps the setting with the highest
+throughput whose peak memory stays below a cap. Results are cached as JSON in
+CONF_DIR/autotune, one file per (host, ModelMeta name and version, backend, precision),
+and applied to the Classifier config (batchsize, intra_op_threads) by predict_video
+when the "autotune" option is set.
+"""
+
+import json
+import os
+import resource
+import socket
+import threading
+import time
+from pathlib import Path
+
+import torch
+from icecream import ic
+
+from .backends import get_example_input
+
+DEFAULT_BATCH_SIZES = (1, 2, 4, 8, 16, 32, 64)
+# fraction of the physical memory the probe may use
+DEFAULT_MEMORY_FRACTION = 0.5
+
+
+def get_tuning_dir():
+    return Path(os.environ.get("CONF_DIR", "./conf")) / "autotune"
+
+
+def get_tuning_path(meta_name, meta_version, backend="eager", precision="fp32", host=None):
+    host = host or socket.gethostname()
+    name = f"{host}_{meta_name}_v{meta_version}_{backend}_{precision}.json"
+    return get_tuning_dir() / name
+
+
+def load_tuning(tuning_path):
+    """Cached tuning result or None"""
+    tuning_path = Path(tuning_path)
+    if not tuning_path.exists():
+        return None
+    with open(tuning_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_tuning(tuning_path, result):
+    tuning_path = Path(tuning_path)
+    tuning_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = tuning_path.with_name(tuning_path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    tmp_path.replace(tuning_path)
+
+
+def get_total_memory_bytes():
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+
+
+def get_peak_rss_bytes():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def get_current_rss_bytes():
+    """Resident set size now; falls back to the process peak where /proc is missing"""
+    try:
+        with open("/proc/self/statm", "r", encoding="utf-8") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return get_peak_rss_bytes()
+
+
+class RssSampler:
+    """
+    Highest current RSS while the context is active, polled in a background thread.
+    Unlike ru_maxrss (the high-water mark of the whole process lifetime) it measures
+    the peak of one probe setting only.
+    """
+
+    def __init__(self, interval_s=0.005):
+        self.interval_s = interval_s
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, get_current_rss_bytes())
+            self._stop.wait(self.interval_s)
+
+    def __enter__(self):
+        self.peak = get_current_rss_bytes()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, get_current_rss_bytes())
+
+
+def get_thread_grid():
+    """1, 2, 4, ... up to the number of usable cores (and the core count itself)"""
+    if hasattr(os, "sched_getaffinity"):
+        n_cores = len(os.sched_getaffinity(0))
+    else:
+        n_cores = os.cpu_count()
+    grid = []
+    threads = 1
+    while threads < n_cores:
+        grid.append(threads)
+        threads *= 2
+    grid.append(n_cores)
+    return grid
+
+
+def probe(
+    model,
+    config,
+    batch_sizes=DEFAULT_BATCH_SIZES,
+    thread_counts=None,
+    memory_cap_bytes=None,
+    n_batches=3,
+    device="cpu",
+):
+    """
+    Measures the throughput of the model over a grid of batch sizes and thread counts.
+
+    Batch sizes are tried in ascending order per thread count. The peak RSS of every
+    setting is sampled while it runs (RssSampler); larger batch sizes are skipped once
+    it, or its linear extrapolation from the previous setting of the same thread sweep,
+    exceeds memory_cap_bytes. Thread counts only apply on CPU.
+
+    Args:
+        model (callable): Prepared inference model (see utils.prepare_model).
+        config (dict): Classifier config, for the input size.
+        batch_sizes (tuple): Batch sizes to try.
+        thread_counts (list, optional): Intra-op thread counts, defaults to get_thread_grid().
+        memory_cap_bytes (int, optional): Defaults to half of the physical memory.
+        n_batches (int): Timed batches per setting, after one warmup batch.
+        device (str | torch.device): Device of the model.
+
+    Returns:
+        list: One dict per measured setting (batchsize, intra_op_threads, fps, peak_rss_mb).
+    """
+    device = torch.device(device)
+    if memory_cap_bytes is None:
+        memory_cap_bytes = int(get_total_memory_bytes() * DEFAULT_MEMORY_FRACTION)
+    if device.type != "cpu":
+        thread_counts = [None]
+    elif thread_counts is None:
+        thread_counts = get_thread_grid()
+
+    memory_format = torch.channels_last if device.type == "cpu" else torch.contiguous_format
+    original_threads = torch.get_num_threads()
+    grid = []
+    try:
+        for threads in thread_counts:
+            if threads:
+                torch.set_num_threads(threads)
+            # (batchsize, peak RSS) points of this sweep, starting from the RSS before it
+            points = [(0, get_current_rss_bytes())]
+            for batchsize in sorted(batch_sizes):
+                if len(points) > 1:
+                    # peak memory grows about linearly with the batch size
+                    (size_a, rss_a), (size_b, rss_b) = points[-2:]
+                    growth = max(0.0, (rss_b - rss_a) / (size_b - size_a))
+                    if rss_b + growth * (batchsize - size_b) > memory_cap_bytes:
+                        break
+
+                example = get_example_input(config, batchsize=batchsize).to(
+                    device, memory_format=memory_format
+                )
+                with RssSampler() as sampler, torch.inference_mode():
+                    model(example)
+                    if device.type == "cuda":
+                        torch.cuda.synchronize(device)
+                    start = time.perf_counter()
+                    for _ in range(n_batches):
+                        model(example)
+                    if device.type == "cuda":
+                        torch.cuda.synchronize(device)
+                    elapsed = time.perf_counter() - start
+
+                peak_rss = sampler.peak
+                points.append((batchsize, peak_rss))
+                grid.append(
+                    {
+                        "batchsize": batchsize,
+                        "intra_op_threads": threads,
+                        "fps": batchsize * n_batches / elapsed,
+                        "peak_rss_mb": peak_rss / 1024**2,
+                    }
+                )
+                if peak_rss > memory_cap_bytes:
+                    break
+    finally:
+        torch.set_num_threads(original_threads)
+
+    return grid
+
+
+def select_best(grid, tolerance=0.03):
+    """
+    Fastest setting; settings within tolerance of the best throughput prefer smaller
+    batches (latency, memory) and fewer threads.
+    """
+    assert grid, "No setting was measured"
+    best_fps = max(entry["fps"] for entry in grid)
+    candidates = [entry for entry in grid if entry["fps"] >= best_fps * (1 - tolerance)]
+    return min(candidates, key=lambda e: (e["batchsize"], e["intra_op_threads"] or 0))
+
+
+def autotune(model, config, tuning_path, overwrite=False, **probe_kwargs):
+    """
+    Returns the cached tuning at tuning_path, or probes the model and caches the result.
+
+    Returns:
+        dict: {"batchsize", "intra_op_threads", "fps", "grid", "host", ...}
+    """
+    if not overwrite:
+        cached = load_tuning(tuning_path)
+        if cached is not None:
+            return cached
+
+    device = probe_kwargs.pop("device", config.get("device") or "cpu")
+    start = time.perf_counter()
+    grid = probe(model, config, device=device, **probe_kwargs)
+    best = select_best(grid)
+    result = {
+        "batchsize": best["batchsize"],
+        "intra_op_threads": best["intra_op_threads"],
+        "fps": best["fps"],
+        "host": socket.gethostname(),
+        "cpu_count": os.cpu_count(),
+        "total_memory_mb": get_total_memory_bytes() / 1024**2,
+        "torch_version": torch.__version__,
+        "probe_seconds": time.perf_counter() - start,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "grid": grid,
+    }
+    save_tuning(tuning_path, result)
+    ic(f"Autotune: batchsize {result['batchsize']}, threads {result['intra_op_threads']}")
+    return result
+
+
+def apply_tuning(config, tuning):
+    """Sets batchsize and intra_op_threads of the config from a tuning result"""
+    config["batchsize"] = tuning["batchsize"]
+    if tuning.get("intra_op_threads"):
+        config["intra_op_threads"] = tuning["intra_op_threads"]
+    return config
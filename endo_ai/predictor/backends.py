@@ -0,0 +1,244 @@
+"""
+Inference backends for the Classifier.
+
+The eager MultiLabelClassificationNet can be exported to TorchScript or ONNX. Exports are
+cached next to the checkpoint and keyed by the hash of the weights file, so a new checkpoint
+never reuses a stale export. A backend model is a callable mapping a normalized NCHW float
+batch to logits, like the eager model:
+
+    "eager"        the (Lightning) module itself
+    "torchscript"  TorchScript module traced and frozen on the inference device (the frozen
+                   weights are constants which .to(device) does not move, so every
+                   device type has its own export)
+    "onnxruntime"  ONNX Runtime session with the CPU execution provider (optional dependency)
+    "compile"      torch.compile of the eager module
+"""
+
+import copy
+import functools
+import hashlib
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+from icecream import ic
+
+BACKENDS = ["eager", "torchscript", "onnxruntime", "compile"]
+
+EXPORT_SUFFIXES = {
+    "torchscript": ".ts.pt",
+    "onnxruntime": ".onnx",
+}
+
+
+def get_weights_hash(weights_path, length=16):
+    """
+    Returns the (shortened) sha256 hex digest of the weights file.
+    Digests are memoized per path, size and modification time.
+    """
+    stat = Path(weights_path).stat()
+    return _hash_file(str(weights_path), stat.st_size, stat.st_mtime_ns)[:length]
+
+
+@functools.lru_cache(maxsize=64)
+def _hash_file(weights_path, _size, _mtime_ns):
+    sha256 = hashlib.sha256()
+    with open(weights_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def get_export_path(weights_path, backend, weights_hash=None, device="cpu"):
+    """
+    Path of the cached export, next to the checkpoint:
+    <checkpoint dir>/<checkpoint stem>.<weights hash><suffix> for the CPU and
+    <checkpoint dir>/<checkpoint stem>.<weights hash>.<device type><suffix> for TorchScript
+    exports for other devices (ONNX Runtime runs on the CPU only).
+    """
+    assert backend in EXPORT_SUFFIXES, f"Backend {backend} has no export"
+    weights_path = Path(weights_path)
+    if weights_hash is None:
+        weights_hash = get_weights_hash(weights_path)
+    device_type = torch.device(device).type
+    device_part = f".{device_type}" if backend == "torchscript" and device_type != "cpu" else ""
+    return weights_path.with_name(
+        f"{weights_path.stem}.{weights_hash}{device_part}{EXPORT_SUFFIXES[backend]}"
+    )
+
+
+def get_example_input(config, batchsize=None):
+    """Random normalized batch in the input shape of the model"""
+    batchsize = batchsize or config["batchsize"]
+    return torch.randn(batchsize, 3, config["size_y"], config["size_x"])
+
+
+def get_eager_module(model):
+    """The plain torch module of a MultiLabelClassificationNet (without Lightning hooks)"""
+    return getattr(model, "model", model).cpu().eval()
+
+
+def export_torchscript(model, export_path, config, device="cpu"):
+    """Traces, freezes and saves the model as TorchScript for the device"""
+    module = get_eager_module(model)
+    if torch.device(device).type != "cpu":
+        # the eager model stays on the CPU
+        module = copy.deepcopy(module).to(device)
+    with torch.inference_mode(False), torch.no_grad():
+        traced = torch.jit.trace(module, get_example_input(config, batchsize=1).to(device))
+        traced = torch.jit.freeze(traced)
+    traced.save(str(export_path))
+    return export_path
+
+
+def export_onnx(model, export_path, config, opset_version=17):
+    """Exports the model to ONNX with a dynamic batch dimension"""
+    module = get_eager_module(model)
+    with torch.no_grad():
+        torch.onnx.export(
+            module,
+            (get_example_input(config, batchsize=1),),
+            str(export_path),
+            input_names=["input"],
+            output_names=["logits"],
+            dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+            opset_version=opset_version,
+            dynamo=False,
+        )
+    return export_path
+
+
+EXPORTERS = {
+    "torchscript": export_torchscript,
+    "onnxruntime": export_onnx,
+}
+
+
+def export_model(model, backend, weights_path, config, overwrite=False, device="cpu"):
+    """
+    Exports the model for the backend, reusing a cached export of the same weights
+    (and for TorchScript the same device type).
+
+    Returns:
+        Path: Path of the exported model.
+    """
+    export_path = get_export_path(weights_path, backend, device=device)
+    if export_path.exists() and not overwrite:
+        ic(f"Using cached {backend} export: {export_path}")
+        return export_path
+
+    ic(f"Exporting {backend} model to {export_path}")
+    # write to a temporary file first, so a crashed export is never picked up from the cache
+    tmp_path = export_path.with_name(export_path.name + ".tmp")
+    if backend == "torchscript":
+        export_torchscript(model, tmp_path, config, device=device)
+    else:
+        EXPORTERS[backend](model, tmp_path, config)
+    tmp_path.replace(export_path)
+    return export_path
+
+
+class OnnxRuntimeModel:
+    """Callable wrapping an ONNX Runtime session, takes and returns torch tensors"""
+
+    def __init__(self, onnx_path, intra_op_threads=None, inter_op_threads=None):
+        try:
+            import onnxruntime  # pylint: disable=import-outside-toplevel
+        except ImportError as e:
+            raise ImportError(
+                "The onnxruntime backend requires the onnxruntime package (pip install onnxruntime)"
+            ) from e
+
+        options = onnxruntime.SessionOptions()
+        if intra_op_threads:
+            options.intra_op_num_threads = int(intra_op_threads)
+        if inter_op_threads:
+            options.inter_op_num_threads = int(inter_op_threads)
+        self.session = onnxruntime.InferenceSession(
+            str(onnx_path), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch):
+        inputs = np.ascontiguousarray(batch.detach().cpu().numpy(), dtype=np.float32)
+        (logits,) = self.session.run(None, {self.input_name: inputs})
+        return torch.from_numpy(logits)
+
+
+def load_backend(model, backend, weights_path=None, config=None, device="cpu"):
+    """
+    Returns the model for the backend. Exports (or loads the cached export) if needed.
+
+    Args:
+        model (MultiLabelClassificationNet): Eager model loaded from weights_path.
+        backend (str): One of BACKENDS.
+        weights_path (str | Path): Checkpoint of the model, required for exported backends.
+        config (dict): Inference config (input size, threads).
+        device (str | torch.device): Inference device, TorchScript is exported and
+            loaded for it.
+    """
+    assert backend in BACKENDS, f"Unknown backend {backend}, choose from {BACKENDS}"
+    if backend == "eager":
+        return model
+
+    if backend == "compile":
+        return torch.compile(get_eager_module(model))
+
+    assert weights_path is not None, f"Backend {backend} requires the weights path"
+    export_path = export_model(model, backend, weights_path, config, device=device)
+
+    if backend == "torchscript":
+        return torch.jit.load(str(export_path), map_location=device)
+
+    return OnnxRuntimeModel(
+        export_path,
+        intra_op_threads=config.get("intra_op_threads"),
+        inter_op_threads=config.get("inter_op_threads"),
+    )
+
+
+def compare_backends(model, backends, weights_path, config, n_batches=5, device="cpu"):
+    """
+    Parity check and throughput comparison of backends against the eager model.
+
+    Every backend predicts the same random batches. Reports the maximum absolute
+    difference of the sigmoid outputs to eager and the frames per second.
+
+    Returns:
+        dict: backend -> {"max_abs_diff": float, "fps": float}
+    """
+    # pylint: disable=import-outside-toplevel
+    from .utils import prepare_model
+
+    torch.manual_seed(0)
+    batches = [get_example_input(config) for _ in range(n_batches)]
+    memory_format = torch.channels_last if torch.device(device).type == "cpu" else torch.contiguous_format
+
+    results = {}
+    reference = None
+    for backend in ["eager"] + [b for b in backends if b != "eager"]:
+        backend_model = load_backend(model, backend, weights_path, config, device=device)
+        if isinstance(backend_model, torch.nn.Module):
+            backend_model = prepare_model(backend_model, device)
+
+        outputs = []
+        with torch.inference_mode():
+            # warm up (compilation, allocator, oneDNN primitive cache)
+            backend_model(batches[0].to(device, memory_format=memory_format))
+            start = time.perf_counter()
+            for batch in batches:
+                logits = backend_model(batch.to(device, memory_format=memory_format))
+                outputs.append(torch.sigmoid(logits).cpu())
+            elapsed = time.perf_counter() - start
+
+        outputs = torch.cat(outputs)
+        if reference is None:
+            reference = outputs
+        results[backend] = {
+            "max_abs_diff": float((outputs - reference).abs().max()),
+            "fps": len(outputs) / elapsed,
+        }
+        ic(f"{backend}: {results[backend]}")
+
+    return results
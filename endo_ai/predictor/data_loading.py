@@ -0,0 +1,154 @@
+"""
+Multi-process frame loading which is safe inside daemonized task workers (e.g. celery prefork).
+
+Workers are started with an explicit "forkserver" / "spawn" context, so they never inherit
+the (threaded, CUDA initialized) state of the parent via fork. Python refuses to start child
+processes from daemonic processes, which celery pool processes are, so the daemon flag is
+lifted while the workers are started.
+
+The workers are persistent: the loader is cached per process and config and is reused for
+all following videos. The paths and crops of a video are passed through a mutable sampler,
+so a new video only sends indices through the worker queues instead of a new dataset.
+Batches come back as tensors in shared memory (torch.multiprocessing).
+"""
+
+import multiprocessing
+from contextlib import contextmanager
+
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset, Sampler
+
+from .inference_dataset import FramePreprocessor
+
+# config keys which influence the preprocessing in the workers
+PREPROCESSING_KEYS = ["mean", "std", "size_x", "size_y", "axes", "fast_crop", "preprocessing"]
+
+_frame_loaders = {}
+
+
+def get_multiprocessing_context(method=None):
+    """
+    Returns a multiprocessing context for DataLoader workers.
+    Defaults to "forkserver" where available, else "spawn". "fork" is not safe in
+    celery workers and not accepted.
+    """
+    if method is None:
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    assert method in ["forkserver", "spawn"], f"Unsupported start method for workers: {method}"
+    return multiprocessing.get_context(method)
+
+
+@contextmanager
+def allow_child_processes():
+    """
+    Temporarily clears the daemon flag of the current process so it may start
+    child processes (multiprocessing forbids children of daemonic processes).
+    """
+    process = multiprocessing.current_process()
+    # pylint: disable=protected-access
+    daemon = process._config.get("daemon", False)
+    process._config["daemon"] = False
+    try:
+        yield
+    finally:
+        process._config["daemon"] = daemon
+
+
+class FrameSampler(Sampler):
+    """Sampler yielding (path, crop) items. Items are replaced for every video."""
+
+    def __init__(self):
+        super().__init__()
+        self.items = []
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class FrameLoaderDataset(Dataset):
+    """Loads and preprocesses a frame given a (path, crop) item of the FrameSampler"""
+
+    def __init__(self, config):
+        self.config = {key: config[key] for key in PREPROCESSING_KEYS if key in config}
+        self.preprocessor = FramePreprocessor(self.config)
+
+    def __getitem__(self, item):
+        path, crop = item
+        with Image.open(path) as pil_image:
+            pil_image = pil_image.convert("RGB")
+        return self.preprocessor(pil_image, crop)
+
+
+class FrameLoader:
+    """
+    DataLoader with persistent worker processes which can be reused across videos.
+
+    Args:
+        config (dict): Inference config (see predict.sample_config). Uses num_workers,
+            batchsize and the optional "multiprocessing_context" ("forkserver" / "spawn").
+        pin_memory (bool): Pin the batches for asynchronous host -> GPU copies.
+    """
+
+    def __init__(self, config, pin_memory=False):
+        assert config["num_workers"] > 0, "FrameLoader requires num_workers > 0"
+        self.sampler = FrameSampler()
+        self.loader = DataLoader(
+            dataset=FrameLoaderDataset(config),
+            batch_size=config["batchsize"],
+            sampler=self.sampler,
+            num_workers=config["num_workers"],
+            multiprocessing_context=get_multiprocessing_context(
+                config.get("multiprocessing_context")
+            ),
+            persistent_workers=True,
+            pin_memory=pin_memory,
+        )
+
+    def __len__(self):
+        return len(self.loader)
+
+    def iter_batches(self, paths, crops):
+        """Yields the preprocessed batches of the given frames in order"""
+        assert len(paths) == len(crops), "paths and crops must have the same length"
+        self.sampler.items = list(zip(paths, crops))
+
+        # workers are started (only once) when the iterator is created
+        with allow_child_processes():
+            iterator = iter(self.loader)
+        yield from iterator
+
+    def close(self):
+        """Shuts the worker processes down"""
+        # pylint: disable=protected-access
+        iterator = self.loader._iterator
+        if iterator is not None:
+            iterator._shutdown_workers()
+            self.loader._iterator = None
+
+
+def get_loader_key(config, pin_memory):
+    key = [config["batchsize"], config["num_workers"], config.get("multiprocessing_context"), pin_memory]
+    key += [repr(config.get(k)) for k in PREPROCESSING_KEYS]
+    return tuple(key)
+
+
+def get_frame_loader(config, pin_memory=False):
+    """
+    Returns the FrameLoader for the config, reusing the workers of an earlier call
+    with the same preprocessing and loader settings.
+    """
+    key = get_loader_key(config, pin_memory)
+    if key not in _frame_loaders:
+        _frame_loaders[key] = FrameLoader(config, pin_memory=pin_memory)
+    return _frame_loaders[key]
+
+
+def close_frame_loaders():
+    """Shuts down the workers of all cached FrameLoaders"""
+    for loader in _frame_loaders.values():
+        loader.close()
+    _frame_loaders.clear()
+
@@ -0,0 +1,214 @@
+"""
+Temporal filters for frame predictions (frames x labels), selectable per label.
+
+All filters keep the frame indices (centred windows, output has as many rows as the
+input) and run along axis 0 over all label columns at once:
+    box:<window_s>          centred moving average (cumulative sum, O(N))
+    ema:<half_life_s>       exponential moving average, run forward and backward
+                            (scipy.signal.lfilter, O(N)) so it does not lag
+    median:<window_s>       centred running median (scipy.ndimage.median_filter,
+                            O(N log window) per label: a running median of real values
+                            needs O(log window) comparisons per frame, the only filter
+                            which is not linear in the number of frames)
+    hysteresis:<low>:<high> binarization with two thresholds: a label switches on above
+                            high and only switches off below low (O(N))
+
+A filter spec assigns a chain to labels, e.g.
+    "default=box:1;blood=median:1,hysteresis:0.3:0.7;water_jet=ema:0.5,hysteresis:0.4:0.6"
+Labels without a chain use "default", labels the model does not have are rejected.
+A chain without hysteresis is binarized with the threshold.
+"""
+
+import numpy as np
+from scipy import ndimage, signal
+
+DEFAULT_FILTER_SPEC = "default=box:1"
+
+
+def _window_frames(window_s, fps):
+    return max(1, int(round(window_s * fps)))
+
+
+def _by_label(predictions):
+    """labels x frames float64 copy, so the filters run over contiguous memory"""
+    predictions = np.asarray(predictions, dtype=np.float64)
+    return np.ascontiguousarray(predictions.T if predictions.ndim == 2 else predictions[None])
+
+
+def _by_frame(by_label, like):
+    """Back to the layout of the input (frames x labels view or 1d)"""
+    return by_label.T if np.ndim(like) == 2 else by_label[0]
+
+
+def box_filter(predictions, window_s=1, fps=50):
+    """Centred moving average, the window shrinks at the start and end of the video"""
+    by_label = _by_label(predictions)
+    window = _window_frames(window_s, fps)
+    n_frames = by_label.shape[1]
+    half = window // 2
+
+    cumsum = np.zeros((by_label.shape[0], n_frames + 1))
+    np.cumsum(by_label, axis=1, out=cumsum[:, 1:])
+    smooth = np.empty_like(by_label)
+
+    # frames with a complete window
+    first_edge_stop = min(half, n_frames)
+    last_edge_start = max(n_frames - window + half + 1, first_edge_stop)
+    if last_edge_start > first_edge_stop:
+        smooth[:, half:last_edge_start] = (cumsum[:, window:] - cumsum[:, :-window]) / window
+
+    edges = np.r_[0:first_edge_stop, last_edge_start:n_frames]
+    lower = np.clip(edges - half, 0, n_frames)
+    upper = np.clip(edges - half + window, 0, n_frames)
+    smooth[:, edges] = (cumsum[:, upper] - cumsum[:, lower]) / (upper - lower)
+    return _by_frame(smooth, predictions)
+
+
+def ema_filter(predictions, half_life_s=0.5, fps=50):
+    """Exponential moving average, forward and backward pass (zero phase)"""
+    by_label = _by_label(predictions)
+    alpha = 1 - 0.5 ** (1 / max(half_life_s * fps, 1e-9))
+    b, a = [alpha], [1, alpha - 1]
+
+    def run(x):
+        # start in the steady state of the first value instead of 0
+        zi = (1 - alpha) * x[:, :1]
+        return signal.lfilter(b, a, x, axis=1, zi=zi)[0]
+
+    forward = run(by_label)
+    smooth = np.ascontiguousarray(run(forward[:, ::-1])[:, ::-1])
+    return _by_frame(smooth, predictions)
+
+
+def median_filter(predictions, window_s=1, fps=50):
+    """Centred running median, the signal is mirrored at the start and end of the video"""
+    by_label = _by_label(predictions)
+    window = _window_frames(window_s, fps)
+    smooth = np.empty_like(by_label)
+    # per label: the 1d median filter of scipy is O(N log window), the nd filter is not
+    for row, smooth_row in zip(by_label, smooth):
+        ndimage.median_filter(row, size=window, mode="mirror", output=smooth_row)
+    return _by_frame(smooth, predictions)
+
+
+def hysteresis_threshold(predictions, low=0.3, high=0.7):
+    """
+    Dual threshold binarization: True from a value > high until the next value < low.
+    Frames before the first value outside [low, high] are False.
+    """
+    assert low <= high, "The low threshold must not exceed the high threshold"
+    by_label = _by_label(predictions)
+    above = by_label > high
+    decided = above | (by_label < low)
+
+    # index of the last decided frame at or before every frame
+    last_decided = np.where(decided, np.arange(by_label.shape[1]), -1)
+    np.maximum.accumulate(last_decided, axis=1, out=last_decided)
+
+    state = np.take_along_axis(above, np.maximum(last_decided, 0), axis=1)
+    state &= last_decided >= 0
+    return _by_frame(state, predictions)
+
+
+FILTERS = {
+    "box": box_filter,
+    "ema": ema_filter,
+    "median": median_filter,
+}
+BINARIZERS = {
+    "hysteresis": hysteresis_threshold,
+}
+
+
+def parse_filter_chain(chain):
+    """ "median:1,hysteresis:0.3:0.7" -> [("median", [1.0]), ("hysteresis", [0.3, 0.7])]"""
+    steps = []
+    for step in chain.split(","):
+        name, *params = step.strip().split(":")
+        assert name in FILTERS or name in BINARIZERS, (
+            f"Unknown filter {name}, choose from {list(FILTERS) + list(BINARIZERS)}"
+        )
+        steps.append((name, [float(p) for p in params]))
+
+    binarizers = [i for i, (name, _) in enumerate(steps) if name in BINARIZERS]
+    assert not binarizers or binarizers == [len(steps) - 1], (
+        f"A binarization step must be the last step of the chain: {chain}"
+    )
+    return steps
+
+
+def check_spec_labels(chains, labels):
+    """Raises if the parsed spec has a chain for a label which is not in labels"""
+    unknown = sorted(set(chains) - {"default"} - set(labels))
+    assert not unknown, f"Unknown labels in the filter spec: {unknown}, choose from {list(labels)}"
+
+
+def parse_filter_spec(spec, labels=None):
+    """
+    Parses a filter spec ("label=chain;label=chain", see module docstring).
+
+    Args:
+        spec (str): Filter spec, defaults to DEFAULT_FILTER_SPEC.
+        labels (list, optional): Label names of the model, chains of other labels raise.
+
+    Returns:
+        dict: label (or "default") -> list of (filter name, params)
+    """
+    chains = {}
+    for part in (spec or DEFAULT_FILTER_SPEC).split(";"):
+        if not part.strip():
+            continue
+        label, _, chain = part.partition("=")
+        assert chain, f"Expected label=chain, got {part}"
+        chains[label.strip()] = parse_filter_chain(chain)
+    chains.setdefault("default", parse_filter_chain(DEFAULT_FILTER_SPEC.split("=")[1]))
+    if labels is not None:
+        check_spec_labels(chains, labels)
+    return chains
+
+
+def apply_filters(predictions, labels, spec=None, fps=50, threshold=0.5):
+    """
+    Filters and binarizes a (frames x labels) prediction matrix. Labels with the same
+    chain are filtered together.
+
+    Args:
+        predictions (np.ndarray): Predictions of shape (n_frames, n_labels).
+        labels (list): Label names in column order.
+        spec (str | dict, optional): Filter spec or parsed spec, defaults to box:1.
+        fps (float): Frames per second, converts the window lengths to frames.
+        threshold (float | np.ndarray): Threshold for chains without hysteresis, one
+            for all labels or one per label.
+
+    Returns:
+        tuple: smooth_predictions (float) and binary_predictions (bool), both of
+            shape (n_frames, n_labels).
+    """
+    if isinstance(spec, dict):
+        chains = spec
+        check_spec_labels(chains, labels)
+    else:
+        chains = parse_filter_spec(spec, labels)
+    predictions = np.asarray(predictions, dtype=np.float64)
+    thresholds = np.broadcast_to(np.asarray(threshold, dtype=np.float64), (len(labels),))
+    smooth_predictions = np.empty_like(predictions)
+    binary_predictions = np.empty(predictions.shape, dtype=bool)
+
+    groups = {}
+    for i, label in enumerate(labels):
+        chain = chains.get(label, chains["default"])
+        key = tuple((name, tuple(params)) for name, params in chain)
+        groups.setdefault(key, []).append(i)
+
+    for chain, columns in groups.items():
+        values = predictions[:, columns]
+        binary = None
+        for name, params in chain:
+            if name in FILTERS:
+                values = FILTERS[name](values, *params, fps=fps)
+            else:
+                binary = BINARIZERS[name](values, *params)
+        smooth_predictions[:, columns] = values
+        binary_predictions[:, columns] = values > thresholds[columns] if binary is None else binary
+
+    return smooth_predictions, binary_predictions
@@ -0,0 +1,132 @@
+"""
+Fingerprints of video predictions for incremental prediction runs.
+
+A fingerprint hashes everything the stored predictions and sequences of a video depend
+on: the content hash of the video, the ModelMeta (name and version), the preprocessing
+and inference config (input size, normalization, labels, backend, precision) and the
+prediction options (smoothing, threshold, filters, sparse sampling, test runs).
+predict_video stores it as predictions["fingerprint"] (and the hashed payload as
+predictions["fingerprint_payload"], so repostprocess_video can update the post-processing
+options without re-running inference); a batch run only recomputes videos whose stored
+fingerprint differs from the expected one. The device and throughput
+options (batch size, threads, workers) do not change the result and are not included.
+"""
+
+import hashlib
+import json
+
+from .data_loading import PREPROCESSING_KEYS
+from .filters import parse_filter_spec
+
+FINGERPRINT_VERSION = 1
+FINGERPRINT_KEY = "fingerprint"
+FINGERPRINT_PAYLOAD_KEY = "fingerprint_payload"
+# config keys which change the predictions
+FINGERPRINT_CONFIG_KEYS = PREPROCESSING_KEYS + ["labels", "backend", "precision"]
+# options which only change the post-processing of the stored prediction matrix
+POSTPROCESSING_OPTIONS = ["smooth_window_size_s", "binarize_threshold", "filters"]
+
+
+def get_fingerprint_options(
+    smooth_window_size_s=1,
+    binarize_threshold=0.5,
+    test_run=False,
+    n_test_frames=100,
+    from_video=False,
+    sparse_stride=None,
+    sparse_tolerance=1,
+    filters=None,
+):
+    """Prediction options of predict_video which change the stored result, normalized"""
+    if isinstance(filters, str):
+        filters = parse_filter_spec(filters)
+    return {
+        "smooth_window_size_s": None if filters else smooth_window_size_s,
+        "binarize_threshold": binarize_threshold,
+        "n_test_frames": n_test_frames if test_run else None,
+        "from_video": bool(from_video),
+        "sparse_stride": sparse_stride,
+        "sparse_tolerance": sparse_tolerance if sparse_stride else None,
+        "filters": filters,
+    }
+
+
+def get_fingerprint_payload(video_hash, model_meta_name, model_meta_version, config, options):
+    """
+    Args:
+        video_hash (str): Content hash of the video (video.video_hash).
+        model_meta_name (str): Name of the ModelMeta.
+        model_meta_version (int): Version of the ModelMeta.
+        config (dict): Classifier config, see video_prediction.get_inference_config.
+        options (dict): See get_fingerprint_options.
+
+    Returns:
+        dict: JSON serializable payload of the fingerprint.
+    """
+    fingerprint_config = {key: config.get(key) for key in FINGERPRINT_CONFIG_KEYS}
+    fingerprint_config["backend"] = fingerprint_config["backend"] or "eager"
+    fingerprint_config["precision"] = fingerprint_config["precision"] or "fp32"
+    # round trip, so a payload loaded from the database hashes the same
+    return json.loads(
+        json.dumps(
+            {
+                "fingerprint_version": FINGERPRINT_VERSION,
+                "video_hash": video_hash,
+                "model_meta": [model_meta_name, int(model_meta_version)],
+                "config": fingerprint_config,
+                "options": options,
+            },
+            default=str,
+        )
+    )
+
+
+def hash_fingerprint_payload(payload):
+    """Hex sha256 digest of a fingerprint payload"""
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def get_prediction_fingerprint(video_hash, model_meta_name, model_meta_version, config, options):
+    """Fingerprint of a prediction, see get_fingerprint_payload for the arguments"""
+    return hash_fingerprint_payload(
+        get_fingerprint_payload(video_hash, model_meta_name, model_meta_version, config, options)
+    )
+
+
+def with_postprocessing_options(
+    payload, smooth_window_size_s=1, binarize_threshold=0.5, filters=None
+):
+    """Payload of the same inference with other post-processing options"""
+    postprocessing = get_fingerprint_options(
+        smooth_window_size_s=smooth_window_size_s,
+        binarize_threshold=binarize_threshold,
+        filters=filters,
+    )
+    options = dict(payload["options"])
+    options.update({key: postprocessing[key] for key in POSTPROCESSING_OPTIONS})
+    return json.loads(json.dumps(dict(payload, options=options), default=str))
+
+
+def get_stale_videos(stored_fingerprints, expected_fingerprints, force=False):
+    """
+    Videos to recompute and the reason ("new", "stale" or "forced").
+
+    Args:
+        stored_fingerprints (dict): uuid -> stored fingerprint, None if never predicted.
+        expected_fingerprints (dict): uuid -> fingerprint of the current settings.
+        force (bool): Recompute all videos.
+
+    Returns:
+        dict: uuid -> reason, in the order of expected_fingerprints.
+    """
+    stale = {}
+    for uuid, expected in expected_fingerprints.items():
+        stored = stored_fingerprints.get(uuid)
+        if force:
+            stale[uuid] = "forced"
+        elif stored is None:
+            stale[uuid] = "new"
+        elif stored != expected:
+            stale[uuid] = "stale"
+    return stale
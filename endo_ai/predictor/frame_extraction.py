@@ -0,0 +1,230 @@
+"""
+Segment-parallel frame extraction.
+
+The video is split at keyframes into time ranges of about the same number of frames
+(keyframes are read from the packet index with ffprobe, nothing is decoded). Every range
+is decoded and JPEG encoded by its own ffmpeg process, which seeks to its first keyframe
+and writes exactly its frames with the final names (frame_%07d, numbered from 1 like
+endoreg_db's extract_frames, via -start_number). The list of frame paths is known from
+the plan, so initialize_frames gets it without scanning the frame directory.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from icecream import ic
+
+FRAME_NAME = "frame_{number:07d}.{ext}"
+
+
+def probe_keyframes(video_path):
+    """
+    Presentation times of all packets of the first video stream and which of them are
+    keyframes, from the packet index (no decoding).
+
+    Returns:
+        tuple: (pts seconds sorted ascending, keyframe mask, container start time)
+    """
+    command = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-select_streams",
+        "v:0",
+        "-show_entries",
+        "packet=pts_time,dts_time,flags:format=start_time",
+        "-of",
+        "json",
+        str(video_path),
+    ]
+    result = subprocess.run(command, capture_output=True, text=True, check=True)
+    probe = json.loads(result.stdout)
+
+    times, keyframes = [], []
+    for packet in probe.get("packets", []):
+        time = packet.get("pts_time", packet.get("dts_time"))
+        if time in (None, "N/A"):
+            continue
+        times.append(float(time))
+        keyframes.append("K" in packet.get("flags", ""))
+
+    start_time = probe.get("format", {}).get("start_time")
+    start_time = float(start_time) if start_time not in (None, "N/A") else 0.0
+
+    times = np.asarray(times, dtype=np.float64)
+    keyframes = np.asarray(keyframes, dtype=bool)
+    # packets come in decoding order, frames are numbered in presentation order
+    order = np.argsort(times, kind="stable")
+    return times[order], keyframes[order], start_time
+
+
+def plan_segments(times, keyframes, n_segments, start_time=0.0):
+    """
+    Splits the frames at keyframes into up to n_segments ranges of about equal length.
+
+    Args:
+        times (np.ndarray): Presentation times of all frames, ascending.
+        keyframes (np.ndarray): Keyframe mask per frame.
+        n_segments (int): Number of ranges to aim for.
+        start_time (float): Start time of the container, seek positions are relative to it.
+
+    Returns:
+        list: One dict per range with "start_frame" (0-based), "n_frames" and "seek"
+            (seconds, None for the first range).
+    """
+    n_frames = len(times)
+    if n_frames == 0:
+        return []
+
+    candidates = np.flatnonzero(keyframes)
+    candidates = candidates[candidates > 0]
+    splits = []
+    if len(candidates) and n_segments > 1:
+        targets = np.arange(1, n_segments) * n_frames / n_segments
+        nearest = np.abs(candidates[None, :] - targets[:, None]).argmin(axis=1)
+        splits = sorted(set(candidates[nearest].tolist()))
+
+    bounds = [0, *splits, n_frames]
+    segments = []
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        seek = None
+        if start > 0:
+            # halfway to the previous frame: robust against the rounding of pts_time,
+            # ffmpeg decodes from the keyframe and drops nothing before it
+            seek = (times[start - 1] + times[start]) / 2 - start_time
+        segments.append({"start_frame": int(start), "n_frames": int(stop - start), "seek": seek})
+    return segments
+
+
+def get_usable_cores():
+    """Cores this process may run on (CPU affinity), the core count as a fallback"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def get_frame_paths(frame_dir, start_frame, n_frames, ext="jpg"):
+    """Paths of n_frames frames from the 0-based start_frame, named like extract_frames"""
+    frame_dir = Path(frame_dir)
+    return [
+        frame_dir / FRAME_NAME.format(number=number, ext=ext)
+        for number in range(start_frame + 1, start_frame + n_frames + 1)
+    ]
+
+
+def get_segment_command(video_path, frame_dir, segment, quality=2, ext="jpg", threads=None):
+    command = ["ffmpeg", "-v", "error", "-nostdin", "-y"]
+    if threads:
+        command += ["-threads", str(threads)]
+    if segment["seek"] is not None:
+        command += ["-ss", f"{segment['seek']:.6f}"]
+    command += [
+        "-i",
+        Path(video_path).resolve().as_posix(),
+        "-map",
+        "0:v:0",
+        # one image per decoded frame, same numbering as extract_frames
+        "-fps_mode",
+        "passthrough",
+        "-frames:v",
+        str(segment["n_frames"]),
+        "-q:v",
+        str(quality),
+        "-start_number",
+        str(segment["start_frame"] + 1),
+        (Path(frame_dir).resolve() / f"frame_%07d.{ext}").as_posix(),
+    ]
+    return command
+
+
+def extract_segment(video_path, frame_dir, segment, quality=2, ext="jpg", threads=None):
+    """Extracts one range in its own ffmpeg process, returns its frame paths"""
+    command = get_segment_command(video_path, frame_dir, segment, quality, ext, threads)
+    result = subprocess.run(command, capture_output=True, text=True, check=False)
+    if result.returncode != 0:
+        raise Exception(f"Error extracting frames: {result.stderr}")
+
+    paths = get_frame_paths(frame_dir, segment["start_frame"], segment["n_frames"], ext)
+    # a short range (e.g. after a mis-seek) would leave gaps in the numbering
+    missing = [path for path in paths if not path.exists()]
+    assert not missing, (
+        f"Range from frame {segment['start_frame']} wrote "
+        f"{segment['n_frames'] - len(missing)} of {segment['n_frames']} frames, "
+        f"first missing: {missing[0].name}"
+    )
+    return paths
+
+
+def extract_frames_parallel(
+    video_path, frame_dir, n_workers=None, quality=2, ext="jpg", overwrite=False
+):
+    """
+    Extracts all frames of a video with one ffmpeg process per keyframe range.
+
+    Args:
+        video_path (str | Path): Video file.
+        frame_dir (str | Path): Output directory, frames are named frame_%07d.<ext>.
+        n_workers (int, optional): Parallel ffmpeg processes, defaults to the usable cores.
+        quality (int): JPEG quality (ffmpeg -q:v, 2 is the best).
+        ext (str): Image extension.
+        overwrite (bool): Extract again if frames exist.
+
+    Returns:
+        list: Frame paths in frame order (the manifest for initialize_frames).
+    """
+    frame_dir = Path(frame_dir)
+    frame_dir.mkdir(parents=True, exist_ok=True)
+    if not overwrite and next(frame_dir.glob(f"*.{ext}"), None) is not None:
+        return sorted(frame_dir.glob(f"*.{ext}"))
+
+    if not shutil.which("ffmpeg"):
+        raise EnvironmentError(
+            "FFmpeg could not be found. Ensure it is installed and in your PATH."
+        )
+
+    n_cores = get_usable_cores()
+    if n_workers is None:
+        n_workers = n_cores
+
+    times, keyframes, start_time = probe_keyframes(video_path)
+    segments = plan_segments(times, keyframes, n_workers, start_time=start_time)
+    assert segments, f"No video packets found in {video_path}"
+    ic(f"Extracting {len(times)} frames in {len(segments)} ranges to {frame_dir}")
+
+    # the processes share the cores, ffmpeg would start one thread per core each
+    threads = max(1, n_cores // len(segments))
+    with ThreadPoolExecutor(max_workers=len(segments)) as executor:
+        segment_paths = list(
+            executor.map(
+                lambda segment: extract_segment(
+                    video_path, frame_dir, segment, quality, ext, threads
+                ),
+                segments,
+            )
+        )
+    return [path for paths in segment_paths for path in paths]
+
+
+def extract_video_frames(video, n_workers=None, quality=2, ext="jpg", overwrite=False):
+    """
+    Drop-in for RawVideoFile / Video.extract_frames with segment-parallel extraction.
+
+    Returns:
+        list: Frame paths in frame order, pass them to video.initialize_frames.
+    """
+    paths = extract_frames_parallel(
+        video.file.path,
+        video.frame_dir,
+        n_workers=n_workers,
+        quality=quality,
+        ext=ext,
+        overwrite=overwrite,
+    )
+    video.state_frames_extracted = True
+    video.save(update_fields=["state_frames_extracted"])
+    return paths
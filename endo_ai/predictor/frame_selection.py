@@ -0,0 +1,99 @@
+"""
+Selection of frames for image annotation from the prediction matrix of a video.
+
+Frames of the target label (e.g. polyp) without excluded labels (e.g. outside) are
+bucketed by second and split by a second label (e.g. nbi: NICE classification on NBI
+frames, Paris classification on white light frames). Per bucket and split the frame
+with the highest target confidence (or a random frame) is picked, in one vectorized
+pass over the matrix.
+"""
+
+from pathlib import Path
+
+import numpy as np
+
+SELECTION_MODES = ["confidence", "random"]
+
+
+def get_frame_numbers(prediction_dict):
+    """
+    Frame numbers of the rows of a prediction dict (Classifier.get_prediction_dict),
+    parsed from the "frame_{index}.jpg" paths, or the row index without paths.
+    """
+    paths = prediction_dict.get("paths")
+    if not paths:
+        return np.arange(len(prediction_dict["predictions"]))
+    return np.array([int(Path(p).stem.split("_")[-1]) for p in paths], dtype=np.int64)
+
+
+def select_annotation_frames(
+    predictions,
+    labels,
+    fps,
+    frame_numbers=None,
+    target_label="polyp",
+    exclude_labels=("outside",),
+    split_label="nbi",
+    threshold=0.5,
+    frames_per_s=1,
+    mode="confidence",
+    seed=None,
+):
+    """
+    Picks up to frames_per_s frames per second of the target label, separately for
+    frames with and without split_label.
+
+    Args:
+        predictions (np.ndarray): Predictions of shape (n_frames, n_labels).
+        labels (list): Label names in column order.
+        fps (float): Frames per second of the video.
+        frame_numbers (np.ndarray, optional): Frame number of every row, defaults to
+            the row index.
+        target_label (str): Label which must be predicted.
+        exclude_labels (tuple): Labels which must not be predicted.
+        split_label (str, optional): Label splitting every bucket in two selections,
+            None for a single selection.
+        threshold (float): Threshold above which a label counts as predicted.
+        frames_per_s (float): Buckets per second.
+        mode (str): "confidence" picks the frame with the highest target prediction,
+            "random" a random frame of the bucket.
+        seed (int, optional): Seed for mode="random".
+
+    Returns:
+        dict: {"with_<split_label>": frame numbers, "without_<split_label>": frame
+            numbers} or {"all": frame numbers} without split_label, sorted ascending.
+    """
+    assert mode in SELECTION_MODES, f"Unknown mode {mode}, choose from {SELECTION_MODES}"
+    predictions = np.asarray(predictions)
+    label_index = {label: i for i, label in enumerate(labels)}
+    if frame_numbers is None:
+        frame_numbers = np.arange(len(predictions))
+    frame_numbers = np.asarray(frame_numbers, dtype=np.int64)
+
+    mask = predictions[:, label_index[target_label]] > threshold
+    for label in exclude_labels:
+        mask &= predictions[:, label_index[label]] <= threshold
+    rows = np.flatnonzero(mask)
+
+    bucket = np.floor(frame_numbers[rows] * frames_per_s / fps).astype(np.int64)
+    split = np.zeros(len(rows), dtype=np.int64)
+    if split_label:
+        split = (predictions[rows, label_index[split_label]] > threshold).astype(np.int64)
+
+    if mode == "confidence":
+        score = predictions[rows, label_index[target_label]]
+    else:
+        score = np.random.default_rng(seed).random(len(rows))
+
+    # sort by (split, bucket, -score), the first row of every (split, bucket) wins
+    order = np.lexsort((-score, bucket, split))
+    group = split[order] * (bucket.max(initial=0) + 1) + bucket[order]
+    first = np.r_[True, group[1:] != group[:-1]] if len(order) else np.zeros(0, dtype=bool)
+    selected = order[first]
+
+    if not split_label:
+        return {"all": np.sort(frame_numbers[rows[selected]])}
+    return {
+        f"with_{split_label}": np.sort(frame_numbers[rows[selected[split[selected] == 1]]]),
+        f"without_{split_label}": np.sort(frame_numbers[rows[selected[split[selected] == 0]]]),
+    }
@@ -5,12 +5,20 @@ from PIL import Image
 from torchvision import transforms
 from .preprocess import Cropper
 
-class InferenceDataset(Dataset):
-    def __init__(self, paths, crops, config):
-        self.paths = paths
-        self.crops = crops
-        self.cropper = Cropper()  # Assuming Cropper can work with NumPy arrays
+
+class FramePreprocessor:
+    """
+    Crops, resizes and normalizes RGB frames (PIL or numpy HWC uint8) to CHW float tensors.
+
+    With config["preprocessing"] == "batch" frames are only cropped and resized and returned
+    as uint8 HWC tensors; normalization then runs once per batch (see BatchPreprocessor).
+    """
+
+    def __init__(self, config):
         self.config = config
+        self.normalize = self.config.get("preprocessing", "item") == "item"
+        # fused crop / pad / resize unless disabled in the config
+        self.cropper = Cropper(fast=self.config.get("fast_crop", True))
 
         # Initialize the image transformations using torchvision
         self.transforms = transforms.Compose([
@@ -19,6 +27,52 @@ class InferenceDataset(Dataset):
             # Normalize the image using the provided mean and std
             transforms.Normalize(mean=self.config["mean"], std=self.config["std"])
         ])
+
+    def __call__(self, image, crop):
+        # Crop the image based on the provided crop parameters
+        cropped = self.cropper(
+            image,
+            crop,
+            scale=[
+                self.config["size_x"],
+                self.config["size_y"]
+            ]    
+        )
+
+        cropped = cropped.astype('uint8', copy=False)
+        if not self.normalize:
+            # uint8 HWC, a quarter of the bytes of the normalized float32 frame
+            return torch.from_numpy(cropped)
+
+        # Apply the transformations, ToTensor accepts the uint8 numpy array
+        # and already converts HWC to CHW format.
+        return self.transforms(cropped)
+
+
+class BatchPreprocessor:
+    """
+    Normalizes batches of uint8 HWC frames (B x H x W x 3) to float32 NCHW tensors,
+    equivalent to ToTensor + Normalize per frame. The result has channels_last strides.
+    """
+
+    def __init__(self, config, device=None):
+        mean = torch.tensor(config["mean"], dtype=torch.float32, device=device)
+        std = torch.tensor(config["std"], dtype=torch.float32, device=device)
+        # fold the 1/255 scaling of ToTensor into mean and std
+        self.mean = (mean * 255).view(1, 3, 1, 1)
+        self.std = (std * 255).view(1, 3, 1, 1)
+
+    def __call__(self, batch):
+        batch = batch.permute(0, 3, 1, 2).to(dtype=torch.float32)
+        return batch.sub_(self.mean).div_(self.std)
+
+
+class InferenceDataset(Dataset):
+    def __init__(self, paths, crops, config):
+        self.paths = paths
+        self.crops = crops
+        self.config = config
+        self.preprocessor = FramePreprocessor(config)
         
     def __len__(self):
         # Returns the total number of samples
@@ -33,26 +87,8 @@ class InferenceDataset(Dataset):
         # Get the corresponding crop for the current image
         crop = self.crops[idx]
 
-        # Crop the image based on the provided crop parameters and convert to numpy for cropping
-        cropped = self.cropper(
-            np.array(pil_image),  # Convert PIL image to numpy array for cropping
-            crop,
-            scale=[
-                self.config["size_x"],
-                self.config["size_y"]
-            ]    
-        )
-
-        # Convert cropped numpy array back to PIL image for torchvision transforms
-        cropped_pil = Image.fromarray(cropped.astype('uint8'), 'RGB')
-        
-        # Apply the transformations
-        img = self.transforms(cropped_pil)
-        
-        # Adjust the axis permutation based on your config is not needed anymore
-        # as transforms.ToTensor() already converts HWC to CHW format.
-
-        return img
+        # The cropper works on the PIL image, no full frame numpy copy needed
+        return self.preprocessor(pil_image, crop)
 
 
 
@@ -0,0 +1,202 @@
+"""
+Inference-only model construction from training checkpoints.
+
+MultiLabelClassificationNet (model_loader.py) is the Lightning training module: building it
+imports pytorch_lightning and sklearn and initializes the backbone with ImageNet weights
+(download or disk read) which the checkpoint then overwrites. InferenceNet builds the bare
+torchvision architecture without pretrained weights and without random initialization and
+assigns the memory-mapped tensors of the checkpoint. Only torch and torchvision are
+imported, and nothing is downloaded.
+"""
+
+import pickle
+import types
+from contextlib import contextmanager
+from pathlib import Path
+
+import torch
+from torch import nn
+from torchvision import models
+
+# constructor and classification head of the supported backbones
+ARCHITECTURES = {
+    "RegNetX800MF": (models.regnet_x_800mf, "fc"),
+    "EfficientNetB4": (models.efficientnet_b4, "classifier.1"),
+}
+
+
+_INIT_FUNCTIONS = [
+    "uniform_",
+    "normal_",
+    "trunc_normal_",
+    "constant_",
+    "ones_",
+    "zeros_",
+    "kaiming_uniform_",
+    "kaiming_normal_",
+    "xavier_uniform_",
+    "xavier_normal_",
+]
+
+
+@contextmanager
+def skip_init():
+    """
+    Turns the torch.nn.init functions into no-ops, for modules whose parameters are
+    overwritten by a state_dict anyway. Not thread safe.
+    """
+    originals = {name: getattr(nn.init, name) for name in _INIT_FUNCTIONS}
+    try:
+        for name in _INIT_FUNCTIONS:
+            setattr(nn.init, name, lambda tensor, *args, **kwargs: tensor)
+        yield
+    finally:
+        for name, function in originals.items():
+            setattr(nn.init, name, function)
+
+
+def build_backbone(model_type, n_classes):
+    """Torchvision backbone with a new n_classes head, without pretrained weights"""
+    assert model_type in ARCHITECTURES, f"Unknown model type {model_type}"
+    constructor, head_name = ARCHITECTURES[model_type]
+    backbone = constructor(weights=None)
+
+    parent_name, _, attribute = head_name.rpartition(".")
+    parent = backbone.get_submodule(parent_name) if parent_name else backbone
+    head = getattr(parent, attribute)
+    setattr(parent, attribute, nn.Linear(head.in_features, n_classes))
+    return backbone
+
+
+class _LightningStub(dict):
+    """Stand-in for Lightning containers (e.g. AttributeDict) of older checkpoints"""
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            self.update(state)
+
+
+class _CheckpointUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if module.split(".")[0] in ("pytorch_lightning", "lightning", "lightning_fabric"):
+            return _LightningStub
+        return super().find_class(module, name)
+
+
+# pickle module for torch.load which does not need Lightning installed
+_checkpoint_pickle = types.SimpleNamespace(
+    __name__="checkpoint_pickle", Unpickler=_CheckpointUnpickler, load=pickle.load
+)
+
+
+def load_checkpoint(checkpoint_path, mmap=True):
+    """
+    Loads a checkpoint on the CPU. Tensors are memory-mapped (zipfile format), so only
+    the pages which are used are read. Checkpoints with plain containers are loaded with
+    weights_only=True; Lightning classes of older checkpoints are replaced with dicts.
+    """
+    try:
+        return torch.load(checkpoint_path, map_location="cpu", mmap=mmap, weights_only=True)
+    except pickle.UnpicklingError:
+        return torch.load(
+            checkpoint_path,
+            map_location="cpu",
+            mmap=mmap,
+            weights_only=False,
+            pickle_module=_checkpoint_pickle,
+        )
+
+
+def load_safetensors(path):
+    """Loads state_dict and metadata of a converted safetensors file"""
+    try:
+        # pylint: disable=import-outside-toplevel
+        from safetensors import safe_open
+        from safetensors.torch import load_file
+    except ImportError as e:
+        raise ImportError("Loading .safetensors requires the safetensors package") from e
+
+    with safe_open(str(path), framework="pt") as f:
+        metadata = f.metadata() or {}
+    # safetensors files are memory-mapped by default
+    return load_file(str(path), device="cpu"), metadata
+
+
+def infer_model_type(state_dict):
+    if any(key.startswith("model.trunk_output.") for key in state_dict):
+        return "RegNetX800MF"
+    return "EfficientNetB4"
+
+
+class InferenceNet(nn.Module):
+    """
+    Inference twin of MultiLabelClassificationNet with the same module layout
+    (state_dict keys "model.*"), so training checkpoints load directly.
+    """
+
+    def __init__(self, labels, model_type="RegNetX800MF"):
+        super().__init__()
+        self.labels = labels
+        self.n_classes = len(labels)
+        self.model_type = model_type
+        self.model = build_backbone(model_type, self.n_classes)
+
+    def forward(self, x):  # pylint: disable=arguments-differ
+        return self.model(x)
+
+    @classmethod
+    def load_from_checkpoint(cls, checkpoint_path, map_location="cpu", mmap=True):
+        """
+        Builds the model for a Lightning checkpoint (.ckpt) or a converted .safetensors file.
+
+        Args:
+            checkpoint_path (str | Path): Checkpoint path.
+            map_location (str | torch.device): Device of the returned model.
+            mmap (bool): Memory-map the checkpoint instead of reading it into memory.
+        """
+        checkpoint_path = Path(checkpoint_path)
+        if checkpoint_path.suffix == ".safetensors":
+            state_dict, metadata = load_safetensors(checkpoint_path)
+            hyper_parameters = {
+                "labels": metadata.get("labels", "").split(",") if metadata.get("labels") else None,
+                "model_type": metadata.get("model_type"),
+            }
+        else:
+            checkpoint = load_checkpoint(checkpoint_path, mmap=mmap)
+            state_dict = checkpoint.get("state_dict", checkpoint)
+            hyper_parameters = dict(checkpoint.get("hyper_parameters", {}))
+
+        # only the network, e.g. drop the loss pos_weight of the training module
+        state_dict = {k: v for k, v in state_dict.items() if k.startswith("model.")}
+
+        model_type = hyper_parameters.get("model_type") or infer_model_type(state_dict)
+        labels = hyper_parameters.get("labels")
+        if not labels:
+            n_classes = next(
+                v.shape[0] for k, v in state_dict.items() if k.endswith("weight") and v.dim() == 2
+            )
+            labels = [str(i) for i in range(n_classes)]
+
+        # skip the random initialization, all tensors are assigned from the checkpoint
+        with skip_init():
+            model = cls(labels=list(labels), model_type=model_type)
+        model.load_state_dict(state_dict, strict=True, assign=True)
+
+        return model.to(map_location).eval()
+
+
+def convert_to_safetensors(checkpoint_path, target_path=None):
+    """
+    Converts a checkpoint to a .safetensors file (network weights, model type and labels).
+    Returns the path of the converted file.
+    """
+    # pylint: disable=import-outside-toplevel
+    from safetensors.torch import save_file
+
+    checkpoint_path = Path(checkpoint_path)
+    target_path = Path(target_path or checkpoint_path.with_suffix(".safetensors"))
+    model = InferenceNet.load_from_checkpoint(checkpoint_path)
+    state_dict = {k: v.contiguous() for k, v in model.state_dict().items()}
+    metadata = {"model_type": model.model_type, "labels": ",".join(model.labels)}
+    save_file(state_dict, str(target_path), metadata=metadata)
+    return target_path
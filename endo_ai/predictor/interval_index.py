@@ -0,0 +1,184 @@
+"""
+In-memory index of the label intervals of one video.
+
+Intervals are inclusive (start, stop) frame ranges like the sequences of
+post_process_predictions and the LabelVideoSegments of endoreg_db. Every label keeps
+sorted, merged start / stop arrays, so point and range queries are binary searches
+and queries over many frames are vectorized. The serialized form ({label: [[start,
+stop], ...]}) is the layout of video.sequences.
+"""
+
+import numpy as np
+
+
+def merge_intervals(starts, stops):
+    """Sorts inclusive intervals and merges overlapping or adjacent ones"""
+    starts = np.asarray(starts, dtype=np.int64)
+    stops = np.asarray(stops, dtype=np.int64)
+    if len(starts) == 0:
+        return starts, stops
+
+    order = np.argsort(starts, kind="stable")
+    starts, stops = starts[order], stops[order]
+    # running maximum of the stops, an interval starts a new group if it begins
+    # after the end of everything before it
+    reach = np.maximum.accumulate(stops)
+    new_group = np.ones(len(starts), dtype=bool)
+    new_group[1:] = starts[1:] > reach[:-1] + 1
+    group_ends = np.r_[np.flatnonzero(new_group)[1:] - 1, len(starts) - 1]
+    return starts[new_group], reach[group_ends]
+
+
+def mask_to_intervals(mask, offset=0):
+    """Inclusive (start, stop) arrays of the True runs of a boolean array"""
+    padded = np.zeros(len(mask) + 2, dtype=np.int8)
+    padded[1:-1] = mask
+    edges = np.flatnonzero(np.diff(padded))
+    return edges[0::2] + offset, edges[1::2] - 1 + offset
+
+
+class IntervalIndex:
+    """
+    Label intervals of one video. Build it once (from sequences, segments or a video)
+    and query it many times.
+    """
+
+    def __init__(self, intervals, n_frames=None):
+        """
+        Args:
+            intervals (dict): label -> iterable of inclusive (start, stop) tuples.
+            n_frames (int, optional): Number of frames of the video, needed to
+                enumerate frames without a label.
+        """
+        self.n_frames = n_frames
+        self.starts = {}
+        self.stops = {}
+        for label, sequences in intervals.items():
+            sequences = np.asarray(list(sequences), dtype=np.int64).reshape(-1, 2)
+            self.starts[label], self.stops[label] = merge_intervals(
+                sequences[:, 0], sequences[:, 1]
+            )
+
+    @property
+    def labels(self):
+        return list(self.starts)
+
+    @classmethod
+    def from_sequences(cls, sequences, n_frames=None):
+        """From filtered_sequences / video.sequences (label -> [(start, stop), ...])"""
+        return cls(sequences, n_frames=n_frames)
+
+    @classmethod
+    def from_segments(cls, segments, n_frames=None):
+        """From LabelVideoSegment / LabelRawVideoSegment objects (or anything with
+        label.name, start_frame_number and end_frame_number)"""
+        intervals = {}
+        for segment in segments:
+            intervals.setdefault(segment.label.name, []).append(
+                (segment.start_frame_number, segment.end_frame_number)
+            )
+        return cls(intervals, n_frames=n_frames)
+
+    @classmethod
+    def from_video(cls, video, n_frames=None):
+        """
+        From the stored sequences of a video, or its label video segments if no
+        sequences are stored. One query, no per-segment frame queries.
+        """
+        if video.sequences:
+            return cls.from_sequences(video.sequences, n_frames=n_frames)
+        segments = video.label_video_segments.select_related("label").only(
+            "start_frame_number", "end_frame_number", "label__name"
+        )
+        return cls.from_segments(segments, n_frames=n_frames)
+
+    def to_dict(self):
+        """Serializable form, in the layout of video.sequences"""
+        return {
+            label: [[int(start), int(stop)] for start, stop in zip(self.starts[label], stops)]
+            for label, stops in self.stops.items()
+        }
+
+    def contains(self, label, frames):
+        """
+        Whether the label is active at the given frame(s), O(log n) per frame.
+
+        Args:
+            label (str): Label name, unknown labels are never active.
+            frames (int | np.ndarray): Frame number or array of frame numbers.
+
+        Returns:
+            bool | np.ndarray: One value per frame.
+        """
+        frames_array = np.asarray(frames)
+        starts = self.starts.get(label)
+        if starts is None or len(starts) == 0:
+            active = np.zeros(frames_array.shape, dtype=bool)
+        else:
+            # last interval starting at or before the frame
+            position = np.searchsorted(starts, frames_array, side="right") - 1
+            stops = self.stops[label]
+            active = (position >= 0) & (frames_array <= stops[np.maximum(position, 0)])
+        return bool(active) if np.ndim(frames) == 0 else active
+
+    def active_labels(self, frame):
+        """Labels active at a frame"""
+        return [label for label in self.starts if self.contains(label, frame)]
+
+    def overlapping(self, label, start, stop):
+        """Intervals of the label which overlap the inclusive range [start, stop]"""
+        if label not in self.starts:
+            return []
+        starts, stops = self.starts[label], self.stops[label]
+        first = np.searchsorted(stops, start, side="left")
+        last = np.searchsorted(starts, stop, side="right")
+        return [(int(a), int(b)) for a, b in zip(starts[first:last], stops[first:last])]
+
+    def select(self, frames=None, include=(), exclude=(), any_of=()):
+        """
+        Boolean combination of labels: all of include, none of exclude and (if given)
+        at least one of any_of.
+
+        Args:
+            frames (np.ndarray, optional): Frame numbers to test, defaults to all
+                n_frames frames.
+
+        Returns:
+            np.ndarray: Boolean mask over frames.
+        """
+        if frames is None:
+            assert self.n_frames is not None, "n_frames is required to select all frames"
+            frames = np.arange(self.n_frames)
+        frames = np.asarray(frames)
+
+        mask = np.ones(frames.shape, dtype=bool)
+        for label in include:
+            mask &= self.contains(label, frames)
+        for label in exclude:
+            mask &= ~self.contains(label, frames)
+        if any_of:
+            mask &= np.logical_or.reduce([self.contains(label, frames) for label in any_of])
+        return mask
+
+    def select_paths(self, paths, include=(), exclude=(), any_of=()):
+        """
+        Frame paths matching select(). Intervals count prediction rows from 0 (the
+        frame numbers of sequences and segments), so paths[i] is tested as frame i,
+        regardless of the number in its file name (extracted frames start at 1).
+
+        Args:
+            paths (list): Frame paths in prediction order, see
+                video_prediction.get_sorted_frame_paths.
+
+        Returns:
+            list: The matching paths.
+        """
+        mask = self.select(np.arange(len(paths)), include=include, exclude=exclude, any_of=any_of)
+        return [path for path, selected in zip(paths, mask) if selected]
+
+    def intervals(self, include=(), exclude=(), any_of=()):
+        """Inclusive (start, stop) tuples of the frames matching select(), requires n_frames"""
+        starts, stops = mask_to_intervals(
+            self.select(include=include, exclude=exclude, any_of=any_of)
+        )
+        return list(zip(starts.tolist(), stops.tolist()))
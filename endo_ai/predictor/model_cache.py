@@ -0,0 +1,143 @@
+"""
+Process wide LRU cache of inference models.
+
+Loading a checkpoint (and exporting / quantizing it) costs seconds, which long lived workers
+and batch commands would otherwise pay for every video. Models are cached by
+(ModelMeta name, version, weights hash, device, backend, precision), so new weights under the
+same ModelMeta never hit a stale entry. The ModelMeta is resolved from the database on
+every lookup (video_prediction.get_inference_model), so a new version or new weights,
+e.g. from another process, are loaded on the next video and replace the superseded models
+of that ModelMeta. Least recently used models are evicted once the total parameter memory
+exceeds the limit (MODEL_CACHE_MAX_MB, default 2048).
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import torch
+from icecream import ic
+
+
+def get_model_nbytes(model):
+    """Memory of the parameters and buffers of a torch module, 0 for other models"""
+    if not isinstance(model, torch.nn.Module):
+        return 0
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class ModelCache:
+    """
+    Thread safe LRU cache of loaded models with a memory based eviction limit.
+
+    Args:
+        max_bytes (int, optional): Evict least recently used models above this total size.
+            The most recently used model is always kept. None disables the limit.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self._models = OrderedDict()
+        self._nbytes = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_time_s = 0.0
+        self.last_load_time_s = None
+
+    def get(self, key, load_fn, warmup_fn=None):
+        """
+        Returns the model for the key, loading (and warming up) it on a miss.
+
+        Args:
+            key (tuple): Cache key, see get_model_key.
+            load_fn (callable): Returns the model.
+            warmup_fn (callable, optional): Called with the new model, e.g. to run a first
+                forward pass so allocations and kernel selection happen before the first video.
+        """
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                self.hits += 1
+                return self._models[key]
+
+            self.misses += 1
+            start = time.perf_counter()
+            model = load_fn()
+            if warmup_fn is not None:
+                warmup_fn(model)
+            self.last_load_time_s = time.perf_counter() - start
+            self.load_time_s += self.last_load_time_s
+
+            self._models[key] = model
+            self._nbytes[key] = get_model_nbytes(model)
+            self._evict()
+            return model
+
+    def _evict(self):
+        if self.max_bytes is None:
+            return
+        while len(self._models) > 1 and sum(self._nbytes.values()) > self.max_bytes:
+            key, _model = self._models.popitem(last=False)
+            del self._nbytes[key]
+            self.evictions += 1
+            ic(f"Evicted model from cache: {key}")
+
+    def invalidate(self, meta_name=None, meta_version=None):
+        """
+        Drops cached models of a ModelMeta (all versions if meta_version is None),
+        or all models if meta_name is None. Returns the number of dropped models.
+        """
+        with self._lock:
+            keys = [
+                key
+                for key in self._models
+                if (meta_name is None or key[0] == meta_name)
+                and (meta_version is None or key[1] == meta_version)
+            ]
+            return self._drop(keys)
+
+    def drop_superseded(self, key):
+        """
+        Drops cached models of the ModelMeta of key with another version or weights hash
+        (any device, backend and precision). Returns the number of dropped models.
+        """
+        with self._lock:
+            keys = [
+                cached
+                for cached in self._models
+                if cached[0] == key[0] and cached[1:3] != key[1:3]
+            ]
+            return self._drop(keys)
+
+    def _drop(self, keys):
+        with self._lock:
+            for key in keys:
+                del self._models[key]
+                del self._nbytes[key]
+            return len(keys)
+
+    def stats(self):
+        """Counters for monitoring"""
+        with self._lock:
+            n_requests = self.hits + self.misses
+            return {
+                "entries": len(self._models),
+                "nbytes": sum(self._nbytes.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / n_requests if n_requests else 0.0,
+                "evictions": self.evictions,
+                "load_time_s": self.load_time_s,
+                "last_load_time_s": self.last_load_time_s,
+            }
+
+
+def get_model_key(meta_name, meta_version, weights_hash, device, backend="eager", precision="fp32"):
+    return (meta_name, meta_version, weights_hash, str(device), backend, precision)
+
+
+model_cache = ModelCache(max_bytes=int(os.environ.get("MODEL_CACHE_MAX_MB", 2048)) * 1024**2)
@@ -1,5 +1,7 @@
 import numpy as np
 
+from .filters import apply_filters
+
 
 def concat_pred_dicts(pred_dicts):
     """Shoulkd be a list of dictionaries with the same keys"""
@@ -61,3 +63,289 @@ def find_true_pred_sequences(predictions):
     outside_sequences = [(int(start), int(stop)) for start, stop in outside_sequences]
 
     return outside_sequences
+
+
+def make_smooth_preds_2d(predictions, window_size_s=1, fps=50):
+    """
+    Moving average of all labels at once (frames x labels), computed with a cumulative sum.
+    Matches make_smooth_preds of every column ("valid" mode, n_frames - window_size + 1 rows)
+    up to floating point rounding.
+    """
+    window_size = int(window_size_s * fps)
+    assert window_size > 0, "The smoothing window must contain at least one frame"
+
+    if window_size > np.shape(predictions)[0]:
+        # np.convolve swaps the inputs if the window is longer than the signal
+        return np.column_stack(
+            [make_smooth_preds(column, window_size_s, fps) for column in np.transpose(predictions)]
+        )
+
+    # labels x frames, so the cumulative sums run over contiguous memory
+    by_label = np.ascontiguousarray(np.transpose(predictions), dtype=np.float64)
+    cumsum = np.zeros((by_label.shape[0], by_label.shape[1] + 1))
+    np.cumsum(by_label, axis=1, out=cumsum[:, 1:])
+    smooth = cumsum[:, window_size:] - cumsum[:, :-window_size]
+    smooth /= window_size
+    # frames x labels view, every label column is contiguous
+    return smooth.T
+
+
+def get_threshold_vector(labels, thresholds=0.5):
+    """
+    Per label thresholds as an array in the order of labels.
+
+    Args:
+        labels (list): Label names.
+        thresholds (float | dict | list): One threshold for all labels, a dict label ->
+            threshold (missing labels use 0.5) or one threshold per label.
+    """
+    if isinstance(thresholds, dict):
+        return np.array([thresholds.get(label, 0.5) for label in labels], dtype=np.float64)
+    thresholds = np.broadcast_to(np.asarray(thresholds, dtype=np.float64), (len(labels),))
+    return thresholds.copy()
+
+
+def find_runs_2d(binary_predictions):
+    """
+    Runs of True values in every column of a binary (frames x labels) matrix.
+
+    Returns:
+        tuple: label index, start and inclusive stop of every run as arrays,
+            sorted by label and then by start.
+    """
+    binary_predictions = np.asarray(binary_predictions, dtype=bool)
+    n_labels = binary_predictions.shape[1]
+
+    # labels x frames, padded with False so every run has a rising and a falling edge
+    padded = np.zeros((n_labels, binary_predictions.shape[0] + 2), dtype=np.int8)
+    padded[:, 1:-1] = binary_predictions.T
+    edges = np.diff(padded, axis=1)
+
+    # nonzero returns the edges sorted by label, then by frame, so rising and falling
+    # edges alternate within every label
+    edge_labels, edge_frames = np.nonzero(edges)
+    return edge_labels[0::2], edge_frames[0::2], edge_frames[1::2] - 1
+
+
+def split_runs(run_labels, starts, stops, n_labels):
+    """Runs of find_runs_2d as one list of (start, stop) tuples (python ints) per label"""
+    bounds = np.searchsorted(run_labels, np.arange(n_labels + 1)).tolist()
+    starts, stops = starts.tolist(), stops.tolist()
+    return [
+        list(zip(starts[bounds[i] : bounds[i + 1]], stops[bounds[i] : bounds[i + 1]]))
+        for i in range(n_labels)
+    ]
+
+
+def find_true_pred_sequences_2d(binary_predictions, min_seq_len=None):
+    """
+    find_true_pred_sequences for all columns of a binary (frames x labels) matrix at once.
+
+    Args:
+        binary_predictions (np.ndarray): Boolean array of shape (n_frames, n_labels).
+        min_seq_len (int, optional): Only keep sequences with stop - start > min_seq_len.
+
+    Returns:
+        list: One list of (start, stop) tuples per label.
+    """
+    run_labels, starts, stops = find_runs_2d(binary_predictions)
+    if min_seq_len is not None:
+        keep = stops - starts > min_seq_len
+        run_labels, starts, stops = run_labels[keep], starts[keep], stops[keep]
+    return split_runs(run_labels, starts, stops, np.shape(binary_predictions)[1])
+
+
+def rle_encode(binary_predictions):
+    """
+    Run-length encodes a boolean array as the starts and lengths of its True runs.
+
+    Returns:
+        dict: {"start": [...], "length": [...], "n_frames": n} (python ints)
+    """
+    binary_predictions = np.asarray(binary_predictions, dtype=bool)
+    return rle_encode_2d(binary_predictions[:, None], ["_"])["_"]
+
+
+def rle_encode_2d(binary_predictions, labels):
+    """rle_encode for every column of a (frames x labels) boolean matrix, in one pass"""
+    run_labels, starts, stops = find_runs_2d(binary_predictions)
+    n_frames = int(np.shape(binary_predictions)[0])
+    bounds = np.searchsorted(run_labels, np.arange(len(labels) + 1)).tolist()
+    lengths = (stops - starts + 1).tolist()
+    starts = starts.tolist()
+    return {
+        label: {
+            "start": starts[bounds[i] : bounds[i + 1]],
+            "length": lengths[bounds[i] : bounds[i + 1]],
+            "n_frames": n_frames,
+        }
+        for i, label in enumerate(labels)
+    }
+
+
+def rle_decode(rle):
+    """Boolean array of a rle_encode result"""
+    starts = np.asarray(rle["start"], dtype=np.int64)
+    ends = starts + np.asarray(rle["length"], dtype=np.int64)
+    changes = np.zeros(rle["n_frames"] + 1, dtype=np.int64)
+    np.add.at(changes, starts, 1)
+    np.add.at(changes, ends, -1)
+    return np.cumsum(changes[:-1]) > 0
+
+
+def post_process_matrix(
+    predictions,
+    window_size_s=1,
+    fps=50,
+    min_seq_len_s=0.5,
+    thresholds=0.5,
+    filters=None,
+    labels=None,
+):
+    """
+    Smoothing, binarization and sequence extraction of a (frames x labels) prediction
+    matrix, vectorized over all labels.
+
+    Args:
+        predictions (np.ndarray): Predictions of shape (n_frames, n_labels).
+        window_size_s (float): Size of the smoothing window in seconds.
+        fps (float): Frames per second.
+        min_seq_len_s (float): Minimum sequence length in seconds of the filtered sequences.
+        thresholds (float | np.ndarray): Threshold for all labels or one per label.
+        filters (str | dict, optional): Per label filter spec (filters.py) replacing the
+            "valid" moving average of window_size_s. Filtered predictions keep the
+            frame indices. Requires labels.
+        labels (list, optional): Label names in column order, for filters.
+
+    Returns:
+        tuple: smooth_predictions, binary_predictions (n_smooth_frames x n_labels),
+            raw_sequences, filtered_sequences (one list of (start, stop) per label).
+    """
+    if filters is not None:
+        assert labels is not None, "Per label filters require the labels"
+        smooth_predictions, binary_predictions = apply_filters(
+            predictions, labels, filters, fps=fps, threshold=thresholds
+        )
+    else:
+        smooth_predictions = make_smooth_preds_2d(predictions, window_size_s, fps)
+        binary_predictions = smooth_predictions > np.asarray(thresholds)
+    n_labels = binary_predictions.shape[1]
+
+    run_labels, starts, stops = find_runs_2d(binary_predictions)
+    keep = stops - starts > int(min_seq_len_s * fps)
+
+    raw_sequences = split_runs(run_labels, starts, stops, n_labels)
+    filtered_sequences = split_runs(run_labels[keep], starts[keep], stops[keep], n_labels)
+    return smooth_predictions, binary_predictions, raw_sequences, filtered_sequences
+
+
+class StreamingPostProcessor:
+    """
+    Online version of post_process_matrix for predictions arriving in batches
+    (e.g. Classifier.pipe(..., batch_callback=processor.update)).
+
+    Keeps the last window_size - 1 predictions for the moving average and the open run
+    of every label, so memory does not grow with the video length. Sequences are
+    emitted as soon as they are closed; after finish() they equal the filtered
+    sequences of post_process_matrix (same "valid" smoothing indices), or with
+    min_seq_len_s=None the unfiltered sequences of find_true_pred_sequences_2d.
+    """
+
+    def __init__(
+        self,
+        labels,
+        window_size_s=1,
+        fps=50,
+        min_seq_len_s=0.5,
+        thresholds=0.5,
+        on_sequence=None,
+    ):
+        """
+        Args:
+            labels (list): Label names in the column order of the predictions.
+            window_size_s (float): Size of the smoothing window in seconds.
+            fps (float): Frames per second.
+            min_seq_len_s (float, optional): Sequences with
+                stop - start <= min_seq_len_s * fps are dropped. None keeps all sequences.
+            thresholds (float | dict | list): See get_threshold_vector.
+            on_sequence (callable, optional): Called with (label, start, stop) for every
+                emitted sequence.
+        """
+        self.labels = list(labels)
+        self.window_size = int(window_size_s * fps)
+        assert self.window_size > 0, "The smoothing window must contain at least one frame"
+        self.min_seq_len = int(min_seq_len_s * fps) if min_seq_len_s is not None else None
+        self.thresholds = get_threshold_vector(self.labels, thresholds)
+        self.on_sequence = on_sequence
+
+        n_labels = len(self.labels)
+        # the last window_size - 1 predictions
+        self._window = np.zeros((0, n_labels))
+        self._previous = np.zeros(n_labels, dtype=bool)
+        self._open_start = np.full(n_labels, -1, dtype=np.int64)
+        self.n_frames = 0
+        self.n_smooth = 0
+        self.sequences = {label: [] for label in self.labels}
+
+    def update(self, predictions):
+        """
+        Consumes the next predictions (n_frames x n_labels).
+
+        Returns:
+            list: (label, start, stop) of the sequences closed by these predictions.
+        """
+        predictions = np.asarray(predictions, dtype=np.float64)
+        assert predictions.ndim == 2 and predictions.shape[1] == len(self.labels)
+        self.n_frames += len(predictions)
+
+        frames = np.concatenate([self._window, predictions])
+        if len(frames) < self.window_size:
+            self._window = frames
+            return []
+        self._window = frames[len(frames) - self.window_size + 1 :].copy()
+
+        # moving average of every complete window ("valid" mode)
+        cumsum = np.zeros((len(frames) + 1, len(self.labels)))
+        np.cumsum(frames, axis=0, out=cumsum[1:])
+        smooth = (cumsum[self.window_size :] - cumsum[: -self.window_size]) / self.window_size
+        binary = smooth > self.thresholds
+
+        # edges against the last binary row of the previous update, rising and falling
+        # edges alternate per label
+        edges = np.diff(np.vstack([self._previous, binary]).astype(np.int8), axis=0)
+        edge_labels, edge_rows = np.nonzero(edges.T)
+        offset = self.n_smooth
+        self._previous = binary[-1]
+        self.n_smooth += len(binary)
+
+        closed = []
+        for label_idx, row in zip(edge_labels.tolist(), edge_rows.tolist()):
+            if edges[row, label_idx] > 0:
+                self._open_start[label_idx] = offset + row
+            else:
+                closed += self._close(label_idx, offset + row - 1)
+        return closed
+
+    def finish(self):
+        """
+        Closes the runs which are still open at the end of the video.
+
+        Returns:
+            list: (label, start, stop) of the sequences closed at the end.
+        """
+        closed = []
+        for label_idx in np.flatnonzero(self._open_start >= 0).tolist():
+            closed += self._close(label_idx, self.n_smooth - 1)
+        return closed
+
+    def _close(self, label_idx, stop):
+        start = int(self._open_start[label_idx])
+        self._open_start[label_idx] = -1
+        if self.min_seq_len is not None and stop - start <= self.min_seq_len:
+            return []
+
+        label = self.labels[label_idx]
+        self.sequences[label].append((start, int(stop)))
+        if self.on_sequence is not None:
+            self.on_sequence(label, start, int(stop))
+        return [(label, start, int(stop))]
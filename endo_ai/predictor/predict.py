@@ -9,8 +9,24 @@ from torch import nn
 import numpy as np
 from tqdm import tqdm
 from icecream import ic
-from .inference_dataset import InferenceDataset
-from .postprocess import concat_pred_dicts, make_smooth_preds, find_true_pred_sequences
+from .inference_dataset import InferenceDataset, BatchPreprocessor
+from .video_stream_dataset import VideoStreamDataset
+from .data_loading import get_frame_loader, FrameLoaderDataset
+from .staged_executor import StagedExecutor
+from .sparse_sampling import predict_sparse
+from .postprocess import (
+    concat_pred_dicts,
+    get_threshold_vector,
+    post_process_matrix,
+    rle_encode_2d,
+)
+from .prediction_io import (
+    PREDICTION_SUFFIX,
+    get_frame_range,
+    get_path_pattern,
+    write_predictions,
+)
+from .utils import get_device, configure_cpu_threads, prepare_model
 
 sample_config = {
     # mean and std for normalization
@@ -21,8 +37,31 @@ sample_config = {
     "size_y": 716,
     # how to wrangle axes of the image before putting them in the network
     "axes": [2, 0, 1],  # 2,1,0 for opencv
+    # fused crop / pad / resize (preprocess.crop_resize_img), False for the PIL reference path
+    "fast_crop": True,
+    # "item": normalize every frame in the dataset (float32 transport)
+    # "batch": ship uint8 frames and normalize once per batch on the device
+    "preprocessing": "item",
     "batchsize": 16,
-    "num_workers": 0,  # always 1 for Windows systems # FIXME: fix celery crash if multiprocessing
+    # > 0 decodes and preprocesses frames in persistent worker processes (data_loading.py),
+    # started with "forkserver" (or "spawn") so they are safe inside celery workers
+    "num_workers": 0,
+    "multiprocessing_context": None,
+    # with num_workers == 0: decode / preprocess in this many threads, overlapping
+    # the forward pass (staged_executor.py), None or 0 to load frames serially
+    "pipeline_threads": None,
+    "prefetch_batches": 2,
+    # "cpu", "cuda", "cuda:0", ... or None / "auto" to use CUDA if available
+    "device": None,
+    # "eager", "torchscript", "onnxruntime" or "compile", see backends.py
+    "backend": "eager",
+    # "fp32", "int8_static" or "bf16" (eager backend, CPU only), see quantization.py
+    "precision": "fp32",
+    # torch thread pools for CPU inference, None keeps the torch defaults
+    "intra_op_threads": None,
+    "inter_op_threads": None,
+    # use the batchsize / intra_op_threads tuned for this host, see autotune.py
+    "autotune": False,
     # maybe add sigmoid after prediction?
     "activation": nn.Sigmoid(),
     "labels": [
@@ -45,55 +84,241 @@ sample_config = {
 
 
 class Classifier:
-    def __init__(self, model=None, config=None, verbose=False):
+    def __init__(self, model=None, config=None, verbose=False, device=None):
         if config is None:
             config = sample_config.copy()
         self.config = config
-        self.model = model
         self.verbose = verbose
 
-    def pipe(self, paths, crops, verbose=None):
+        # explicit argument > config (ModelMeta / CLI) > auto detection
+        self.device = get_device(device or self.config.get("device"))
+        if self.device.type == "cpu":
+            configure_cpu_threads(
+                self.config.get("intra_op_threads"),
+                self.config.get("inter_op_threads"),
+            )
+
+        if model is not None:
+            model = prepare_model(model, self.device)
+        self.model = model
+
+        # per stage utilization of the last pipelined pipe() call
+        self.stage_utilization = None
+
+    def pipe(self, paths, crops, verbose=None, output="list", batch_callback=None):
         """
         Processes input data through the model pipeline and returns predictions.
         Args:
             paths (list): List of file paths to the input data.
             crops (list): List of crop regions for the input data.
             verbose (bool, optional): If True, prints detailed logs. Defaults to None.
+            output (str): "list" for a list of lists, "array" for a float32 numpy array
+                (n_frames x n_labels, columns in the order of self.label_index).
+            batch_callback (callable, optional): Called with the float32 predictions of
+                every batch as they are computed, e.g. StreamingPostProcessor.update.
         Returns:
-            list: Predictions generated by the model.
+            list | np.ndarray: Predictions generated by the model.
         """
 
         if verbose is None:
             verbose = self.verbose
 
+        if self.config["num_workers"] > 0:
+            loader = get_frame_loader(self.config, pin_memory=self.device.type == "cuda")
+            if verbose:
+                ic(f"Using {self.config['num_workers']} persistent loader workers")
+            return self.predict_batches(
+                loader.iter_batches(paths, crops),
+                n_frames=len(paths),
+                output=output,
+                batch_callback=batch_callback,
+            )
+
+        if self.config.get("pipeline_threads"):
+            executor = StagedExecutor(
+                FrameLoaderDataset(self.config).__getitem__,
+                batchsize=self.config["batchsize"],
+                n_threads=self.config["pipeline_threads"],
+                prefetch_batches=self.config.get("prefetch_batches", 2),
+            )
+            predictions = self.predict_batches(
+                executor.iter_batches(zip(paths, crops)),
+                n_frames=len(paths),
+                output=output,
+                batch_callback=batch_callback,
+            )
+            self.stage_utilization = executor.report()
+            if verbose:
+                ic(f"Stage utilization: {self.stage_utilization}")
+            return predictions
+
         dataset = InferenceDataset(paths, crops, self.config)
         if verbose:
             ic("Dataset created")
 
+        return self.predict_dataset(
+            dataset, num_workers=0, output=output, batch_callback=batch_callback
+        )
+
+    def pipe_sparse(
+        self, paths, crops, stride=25, tolerance=1, threshold=0.5, output="list"
+    ):
+        """
+        Predicts every stride-th frame and refines the label transitions by bisection
+        (see sparse_sampling.predict_sparse). The paths must be in temporal order.
+        Args:
+            paths (list): List of frame paths in temporal order.
+            crops (list): List of crop regions for the frames.
+            stride (int): Distance between the coarse samples in frames.
+            tolerance (int): Maximum error of a recovered boundary in frames.
+            threshold (float): Threshold used to binarize the predictions.
+            output (str): "list" or "array", like pipe().
+        Returns:
+            list | np.ndarray: Predictions for every frame, like pipe().
+        """
+        predictions, n_evaluated = predict_sparse(
+            self, paths, crops, stride=stride, tolerance=tolerance, threshold=threshold
+        )
+        if self.verbose:
+            ic(f"Sparse prediction: {n_evaluated} of {len(paths)} frames classified")
+
+        if output == "array":
+            return predictions
+        return predictions.tolist()
+
+    def pipe_video(
+        self, video_path, crop, max_frames=None, verbose=None, output="list", batch_callback=None
+    ):
+        """
+        Decodes the frames of a video file and returns the predictions of all frames,
+        without extracting the frames to disk first.
+        Args:
+            video_path (str | Path): Path to the video file.
+            crop (list): Crop region applied to every frame.
+            max_frames (int, optional): Only predict the first max_frames frames.
+            verbose (bool, optional): If True, prints detailed logs. Defaults to None.
+            output (str): "list" or "array", like pipe().
+            batch_callback (callable, optional): See pipe().
+        Returns:
+            list | np.ndarray: Predictions generated by the model, one per decoded frame.
+        """
+        if verbose is None:
+            verbose = self.verbose
+
+        dataset = VideoStreamDataset(video_path, crop, self.config, max_frames=max_frames)
+        if verbose:
+            ic(f"Video stream created: {dataset.width}x{dataset.height}")
+
+        # decoding runs in the ffmpeg process, parallel to the model
+        return self.predict_dataset(
+            dataset, num_workers=0, output=output, batch_callback=batch_callback
+        )
+
+    def predict_dataset(self, dataset, num_workers=0, output="list", batch_callback=None):
+        """
+        Runs the model over a (map-style or iterable) dataset of preprocessed frames.
+        Returns:
+            list | np.ndarray: Predictions generated by the model, see pipe().
+        """
+        # pinned host memory only pays off for host -> GPU copies
+        use_cuda = self.device.type == "cuda"
+
+        try:
+            n_frames = len(dataset)
+        except TypeError:
+            # e.g. video containers without frame count
+            n_frames = None
+
         dl = DataLoader(
             dataset=dataset,
             batch_size=self.config["batchsize"],
-            num_workers=self.config["num_workers"],
+            num_workers=num_workers,
             shuffle=False,
-            pin_memory=True,
+            pin_memory=use_cuda,
         )
-        if verbose:
+        if self.verbose:
             ic("Dataloader created")
 
+        return self.predict_batches(
+            dl, n_frames=n_frames, output=output, batch_callback=batch_callback
+        )
+
+    def predict_batches(self, batches, n_frames=None, output="list", batch_callback=None):
+        """
+        Runs the model over an iterable of preprocessed batches.
+        Args:
+            batches (iterable): Batches of preprocessed frames.
+            n_frames (int, optional): Total number of frames. With output="array"
+                the result array is preallocated and filled in place per batch.
+            output (str): "list" or "array", see pipe().
+            batch_callback (callable, optional): See pipe().
+        Returns:
+            list | np.ndarray: Predictions generated by the model.
+        """
+        assert output in ["list", "array"], f"Unknown output {output}"
+        use_cuda = self.device.type == "cuda"
+        memory_format = torch.contiguous_format if use_cuda else torch.channels_last
+
+        batch_preprocessor = None
+        if self.config.get("preprocessing", "item") == "batch":
+            batch_preprocessor = BatchPreprocessor(self.config, device=self.device)
+
+        n_labels = len(self.config["labels"])
+        total = None
+        if n_frames is not None:
+            total = -(-n_frames // self.config["batchsize"])
+
         predictions = []
+        if output == "array" and n_frames is not None:
+            predictions = np.empty((n_frames, n_labels), dtype=np.float32)
+        offset = 0
 
         with torch.inference_mode():
             if self.verbose:
                 ic("Starting inference")
-            for batch in tqdm(dl):
-                prediction = self.model(batch.cuda())
-                prediction = (
-                    self.config["activation"](prediction).cpu().tolist()
-                )  # .numpy().tolist()
-                predictions += prediction
+            for batch in tqdm(batches, total=total):
+                batch = batch.to(self.device, non_blocking=use_cuda)
+                if batch_preprocessor is not None:
+                    batch = batch_preprocessor(batch)
+                batch = batch.contiguous(memory_format=memory_format)
+                prediction = self.config["activation"](self.model(batch))
+
+                if output == "list":
+                    predictions += prediction.cpu().tolist()
+                elif isinstance(predictions, np.ndarray):
+                    # write straight into the preallocated rows
+                    rows = predictions[offset : offset + len(prediction)]
+                    assert len(rows) == len(prediction), f"More than {n_frames} frames"
+                    torch.from_numpy(rows).copy_(prediction)
+                else:
+                    predictions.append(prediction.float().cpu().numpy())
+                offset += len(prediction)
+
+                if batch_callback is not None:
+                    batch_callback(prediction.float().cpu().numpy())
+
+        if output == "array":
+            if isinstance(predictions, np.ndarray):
+                # frame counts of containers can be too high
+                predictions = predictions[:offset]
+            else:
+                predictions = (
+                    np.concatenate(predictions)
+                    if predictions
+                    else np.empty((0, n_labels), dtype=np.float32)
+                )
 
         return predictions
 
+    @property
+    def label_index(self):
+        """Column index of every label in array predictions"""
+        return {label: i for i, label in enumerate(self.config["labels"])}
+
+    def split_labels(self, predictions):
+        """Label -> prediction column (view) of array predictions (n_frames x n_labels)"""
+        return {label: predictions[:, i] for label, i in self.label_index.items()}
+
     def __call__(self, image, crop=None):
         return self.pipe([image], [crop])
 
@@ -161,14 +386,68 @@ class Classifier:
         if self.verbose:
             ic(f"Saved predictions to {json_target_path}")
 
+    def save_predictions(
+        self, predictions, paths, frame_indices, target_path: str = None, dtype="float32"
+    ):
+        """
+        Saves predictions in the binary prediction format (prediction_io.py), with a
+        frame path pattern instead of per-frame paths where the paths follow one.
+        Smaller and faster to read than get_prediction_json, which remains available
+        for interoperability.
+
+        Args:
+            predictions (np.ndarray | list): Predictions of shape (n_frames, n_labels).
+            paths (list): Paths corresponding to the predictions.
+            frame_indices (list): Evenly spaced frame indices of the predictions.
+            target_path (str, optional): Output path. Defaults to "predictions.preds".
+            dtype (str): "float32" or "float16".
+        """
+        if not target_path:
+            target_path = f"predictions{PREDICTION_SUFFIX}"
+
+        frame_start, frame_step = get_frame_range(frame_indices)
+        paths = [str(p) for p in paths]
+        path_pattern = get_path_pattern(paths, frame_indices)
+        if path_pattern is None:
+            ic("Frame paths do not follow a common pattern, storing the path list")
+
+        target_path = write_predictions(
+            target_path,
+            np.asarray(predictions),
+            self.config["labels"],
+            frame_start=frame_start,
+            frame_step=frame_step,
+            path_pattern=path_pattern,
+            dtype=dtype,
+            paths=paths,
+        )
+
+        if self.verbose:
+            ic(f"Saved predictions to {target_path}")
+        return target_path
+
     def post_process_predictions(
-        self, pred_dicts, window_size_s=1, fps=50, min_seq_len_s=0.5
+        self,
+        pred_dicts,
+        window_size_s=1,
+        fps=50,
+        min_seq_len_s=0.5,
+        thresholds=0.5,
+        filters=None,
     ):
         """
-        pred_dicts: list of dictionaries with the same keys
+        pred_dicts: list of dictionaries with the same keys, or array predictions
+            (n_frames x n_labels, see pipe(output="array"))
         window_size_s: size of the window in seconds for smoothing
         fps: frames per second
         min_seq_len_s: minimum length of a sequence in seconds
+        thresholds: binarization threshold for all labels, a dict label -> threshold
+            or one threshold per label
+        filters: per label filter spec (filters.py, e.g. "default=box:1;blood=median:1,
+            hysteresis:0.3:0.7") instead of the moving average of window_size_s
+
+        All labels are processed at once on the (frames x labels) matrix
+        (postprocess.post_process_matrix).
 
         Returns:
         predictions: concatenated predictions
@@ -178,30 +457,28 @@ class Classifier:
         filtered_sequences: filtered sequences
         """
         # Concatenate the predictions
-        predictions = concat_pred_dicts(pred_dicts)
-
-        smooth_predictions = {key: [] for key in predictions.keys()}
-        for key in predictions.keys():
-            smooth_predictions[key] = make_smooth_preds(
-                predictions[key], window_size_s=window_size_s, fps=fps
-            )
-
-        binary_predictions = {}
-        for key in smooth_predictions.keys():
-            binary_predictions[key] = np.array(
-                [p > 0.5 for p in smooth_predictions[key]]
-            )
-
-        raw_sequences = {}
-        for key, value in binary_predictions.items():
-            raw_sequences[key] = find_true_pred_sequences(value)
+        if isinstance(pred_dicts, np.ndarray):
+            predictions = self.split_labels(pred_dicts)
+            matrix = pred_dicts
+        else:
+            predictions = concat_pred_dicts(pred_dicts)
+            matrix = np.column_stack(list(predictions.values()))
+
+        labels = list(predictions.keys())
+        smooth_matrix, binary_matrix, raw, filtered = post_process_matrix(
+            matrix,
+            window_size_s=window_size_s,
+            fps=fps,
+            min_seq_len_s=min_seq_len_s,
+            thresholds=get_threshold_vector(labels, thresholds),
+            filters=filters,
+            labels=labels,
+        )
 
-        filtered_sequences = {}
-        min_seq_len = int(min_seq_len_s * fps)
-        for key, sequences in raw_sequences.items():
-            filtered_sequences[key] = [
-                s for s in sequences if s[1] - s[0] > min_seq_len
-            ]
+        smooth_predictions = {key: smooth_matrix[:, i] for i, key in enumerate(labels)}
+        binary_predictions = {key: binary_matrix[:, i] for i, key in enumerate(labels)}
+        raw_sequences = dict(zip(labels, raw))
+        filtered_sequences = dict(zip(labels, filtered))
 
         return (
             predictions,
@@ -212,7 +489,15 @@ class Classifier:
         )
 
     def post_process_predictions_serializable(
-        self, pred_dicts, window_size_s=1, fps=50, min_seq_len_s=0.5
+        self,
+        pred_dicts,
+        window_size_s=1,
+        fps=50,
+        min_seq_len_s=0.5,
+        binary_format="list",
+        include_frame_values=True,
+        thresholds=0.5,
+        filters=None,
     ):
         """
         Post-processes prediction dictionaries to make them serializable.
@@ -220,45 +505,60 @@ class Classifier:
         elements are serializable (e.g., converting numpy arrays to lists), and
         organizes the results into a dictionary of dictionaries.
         Args:
-            pred_dicts (list): List of prediction dictionaries.
+            pred_dicts (list): List of prediction dictionaries (or array predictions).
             window_size_s (int, optional): Window size in seconds. Defaults to 1.
             fps (int, optional): Frames per second. Defaults to 50.
             min_seq_len_s (float, optional): Minimum sequence length in seconds. Defaults to 0.5.
+            binary_format (str, optional): "list" for a boolean per frame, "rle" for the
+                run-length encoding of every label ({"start", "length", "n_frames"},
+                see postprocess.rle_decode). Defaults to "list".
+            include_frame_values (bool, optional): Include the per frame "predictions"
+                and "smooth_predictions". Defaults to True.
+            thresholds, filters: See post_process_predictions.
         Returns:
             dict: A dictionary containing processed prediction results with the following keys:
-                - "predictions": Processed predictions.
-                - "smooth_predictions": Smoothed predictions.
+                - "predictions": Processed predictions (if include_frame_values).
+                - "smooth_predictions": Smoothed predictions (if include_frame_values).
                 - "binary_predictions": Binary predictions.
                 - "raw_sequences": Raw sequences.
                 - "filtered_sequences": Filtered sequences.
         """
+        assert binary_format in ["list", "rle"], f"Unknown binary format {binary_format}"
 
-        result = self.post_process_predictions(
-            pred_dicts, window_size_s, fps, min_seq_len_s
+        (
+            predictions,
+            smooth_predictions,
+            binary_predictions,
+            raw_sequences,
+            filtered_sequences,
+        ) = self.post_process_predictions(
+            pred_dicts, window_size_s, fps, min_seq_len_s, thresholds, filters
         )
 
-        for i, _dict in enumerate(result):
-            _keys = list(_dict.keys())
-            for key in _keys:
-                # if numpy array
-                if hasattr(_dict[key], "tolist"):
-                    result[i][key] = _dict[key].tolist()
-
-                # check if list of tuples
-                # if so, make sure each tuple has 2 elements and split to two lists (start, stop)
-                if all(isinstance(x, tuple) for x in _dict[key]):
-                    if all(len(x) == 2 for x in _dict[key]):
-                        result[i][f"{key}_start"] = [int(x[0]) for x in _dict[key]]
-                        result[i][f"{key}_stop"] = [int(x[1]) for x in _dict[key]]
-                        del result[i][key]
-
-        # make dict of dicts
-        result_dict = {
-            "predictions": result[0],
-            "smooth_predictions": result[1],
-            "binary_predictions": result[2],
-            "raw_sequences": result[3],
-            "filtered_sequences": result[4],
-        }
+        def to_lists(_dict):
+            return {key: value.tolist() for key, value in _dict.items()}
+
+        def split_sequences(_dict):
+            # list of (start, stop) tuples -> two lists "<label>_start", "<label>_stop"
+            result = {}
+            for key, sequences in _dict.items():
+                result[f"{key}_start"] = [int(x[0]) for x in sequences]
+                result[f"{key}_stop"] = [int(x[1]) for x in sequences]
+            return result
+
+        result_dict = {}
+        if include_frame_values:
+            result_dict["predictions"] = to_lists(predictions)
+            result_dict["smooth_predictions"] = to_lists(smooth_predictions)
+
+        if binary_format == "rle":
+            labels = list(binary_predictions.keys())
+            binary_matrix = np.column_stack(list(binary_predictions.values()))
+            result_dict["binary_predictions"] = rle_encode_2d(binary_matrix, labels)
+        else:
+            result_dict["binary_predictions"] = to_lists(binary_predictions)
+
+        result_dict["raw_sequences"] = split_sequences(raw_sequences)
+        result_dict["filtered_sequences"] = split_sequences(filtered_sequences)
 
         return result_dict
@@ -0,0 +1,258 @@
+"""
+Compact binary storage of frame predictions.
+
+Layout of a prediction file (little endian):
+    8 bytes    magic b"EAIPRED\\0"
+    uint32     format version
+    uint32     header length in bytes
+    header     utf-8 JSON: labels, dtype, frame_start, frame_step, n_frames,
+               path_pattern or paths (optional) and metadata
+    padding    up to the next multiple of 64 bytes
+    matrix     n_frames x n_labels, float16 or float32, C order
+
+Row i holds the predictions of frame index frame_start + i * frame_step. Instead of a
+path per frame an optional path pattern (e.g. "/frames/frame_{index:07d}.jpg") is stored,
+paths which do not follow a pattern are stored as an explicit list.
+PredictionFile memory-maps the matrix, so labels and frame ranges are read on demand.
+"""
+
+import json
+import re
+import struct
+from pathlib import Path
+
+import numpy as np
+
+MAGIC = b"EAIPRED\0"
+FORMAT_VERSION = 1
+PREDICTION_SUFFIX = ".preds"
+DTYPES = ["float16", "float32"]
+
+_PREAMBLE = struct.Struct("<8sII")
+_ALIGNMENT = 64
+
+
+def _escape(text):
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def get_path_pattern(paths, frame_indices):
+    """
+    Returns a str.format pattern with an {index} field which reproduces every path
+    from its frame index, or None if the paths do not follow a common pattern.
+    Zero-padded numbers (frame_0000001.jpg, see frame_extraction.FRAME_NAME) give a
+    fixed width field like {index:07d}.
+    """
+    if not paths:
+        return None
+    first_path = str(paths[0])
+    first_index = int(frame_indices[0])
+
+    # the last digit run with the value of the first frame index, e.g. the frame number
+    # in the file name rather than a number in the directory
+    for match in reversed(list(re.finditer(r"\d+", first_path))):
+        if int(match.group()) != first_index:
+            continue
+        head, digits, tail = first_path[: match.start()], match.group(), first_path[match.end() :]
+        fields = ["{index}"]
+        if len(digits) > 1:
+            fields.insert(0, f"{{index:0{len(digits)}d}}")
+        for field in fields:
+            pattern = _escape(head) + field + _escape(tail)
+            if all(
+                pattern.format(index=int(index)) == str(path)
+                for path, index in zip(paths, frame_indices)
+            ):
+                return pattern
+        return None
+    return None
+
+
+def get_frame_range(frame_indices):
+    """Returns (frame_start, frame_step) of evenly spaced ascending frame indices"""
+    frame_indices = np.asarray(frame_indices)
+    if len(frame_indices) < 2:
+        return int(frame_indices[0]) if len(frame_indices) else 0, 1
+    steps = np.diff(frame_indices)
+    assert steps[0] > 0 and np.all(steps == steps[0]), (
+        "Frame indices must be ascending and evenly spaced"
+    )
+    return int(frame_indices[0]), int(steps[0])
+
+
+def write_predictions(
+    target_path,
+    predictions,
+    labels,
+    frame_start=0,
+    frame_step=1,
+    path_pattern=None,
+    dtype="float32",
+    metadata=None,
+    paths=None,
+):
+    """
+    Writes a prediction matrix to a binary prediction file.
+
+    Args:
+        target_path (str | Path): Output path, by convention with the suffix ".preds".
+        predictions (np.ndarray): Predictions of shape (n_frames, n_labels).
+        labels (list): Label names, one per column.
+        frame_start (int): Frame index of the first row.
+        frame_step (int): Frame index increment between rows.
+        path_pattern (str, optional): Frame path pattern with an {index} field.
+        dtype (str): Storage dtype, "float16" halves the size.
+        metadata (dict, optional): JSON serializable extra information.
+        paths (list, optional): Frame paths, one per row, if there is no path pattern.
+
+    Returns:
+        Path: The written file.
+    """
+    assert dtype in DTYPES, f"Unknown dtype {dtype}, choose from {DTYPES}"
+    predictions = np.ascontiguousarray(predictions, dtype=np.dtype(dtype).newbyteorder("<"))
+    assert predictions.ndim == 2 and predictions.shape[1] == len(labels), (
+        f"Expected predictions of shape (n_frames, {len(labels)}), got {predictions.shape}"
+    )
+    if paths is not None:
+        assert len(paths) == predictions.shape[0], "Expected one path per frame"
+        paths = [str(p) for p in paths]
+
+    header = {
+        "labels": list(labels),
+        "dtype": dtype,
+        "frame_start": int(frame_start),
+        "frame_step": int(frame_step),
+        "n_frames": int(predictions.shape[0]),
+        "path_pattern": path_pattern,
+        "paths": None if path_pattern else paths,
+        "metadata": metadata or {},
+    }
+    header_bytes = json.dumps(header).encode("utf-8")
+    offset = _PREAMBLE.size + len(header_bytes)
+    padding = b"\0" * (-offset % _ALIGNMENT)
+
+    target_path = Path(target_path)
+    tmp_path = target_path.with_name(target_path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        f.write(padding)
+        f.write(predictions.tobytes())
+    tmp_path.replace(target_path)
+    return target_path
+
+
+def read_header(path):
+    """Returns the header dict and the byte offset of the matrix"""
+    with open(path, "rb") as f:
+        magic, version, header_length = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+        assert magic == MAGIC, f"{path} is not a prediction file"
+        assert version <= FORMAT_VERSION, (
+            f"{path} has format version {version}, this reader supports {FORMAT_VERSION}"
+        )
+        header = json.loads(f.read(header_length).decode("utf-8"))
+    offset = _PREAMBLE.size + header_length
+    return header, offset + (-offset % _ALIGNMENT)
+
+
+class PredictionFile:
+    """
+    Memory-mapped reader of a binary prediction file. Slicing returns views of the
+    mapped matrix, only the touched pages are read from disk.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.header, offset = read_header(self.path)
+        self.labels = self.header["labels"]
+        self.frame_start = self.header["frame_start"]
+        self.frame_step = self.header["frame_step"]
+        self.path_pattern = self.header.get("path_pattern")
+        self.paths = self.header.get("paths")
+        self.metadata = self.header.get("metadata", {})
+        self.label_index = {label: i for i, label in enumerate(self.labels)}
+
+        n_frames = self.header["n_frames"]
+        dtype = np.dtype(self.header["dtype"]).newbyteorder("<")
+        if n_frames:
+            self.predictions = np.memmap(
+                self.path,
+                dtype=dtype,
+                mode="r",
+                offset=offset,
+                shape=(n_frames, len(self.labels)),
+            )
+        else:
+            self.predictions = np.empty((0, len(self.labels)), dtype=dtype)
+
+    def __len__(self):
+        return self.predictions.shape[0]
+
+    @property
+    def frame_indices(self):
+        return self.frame_start + self.frame_step * np.arange(len(self))
+
+    def row(self, frame_index):
+        """Row of a frame index"""
+        row, remainder = divmod(frame_index - self.frame_start, self.frame_step)
+        assert remainder == 0 and 0 <= row < len(self), f"Frame {frame_index} not in file"
+        return row
+
+    def _first_row_from(self, frame_index):
+        """First row whose frame index is >= frame_index"""
+        return max(0, -(-(frame_index - self.frame_start) // self.frame_step))
+
+    def get_label(self, label):
+        """Predictions of one label (view, stored dtype)"""
+        return self.predictions[:, self.label_index[label]]
+
+    def select(self, labels=None, start=None, stop=None):
+        """
+        Predictions of the given labels for the frame indices start <= index < stop.
+
+        Args:
+            labels (list, optional): Label names, defaults to all labels.
+            start (int, optional): First frame index.
+            stop (int, optional): Frame index after the last one.
+
+        Returns:
+            np.ndarray: float32 array of shape (n_selected_frames, len(labels)).
+        """
+        start_row = 0 if start is None else self._first_row_from(start)
+        stop_row = len(self) if stop is None else self._first_row_from(stop)
+        rows = self.predictions[start_row:stop_row]
+        if labels is not None:
+            rows = rows[:, [self.label_index[label] for label in labels]]
+        return np.asarray(rows, dtype=np.float32)
+
+    @property
+    def has_paths(self):
+        return bool(self.path_pattern) or self.paths is not None
+
+    def get_path(self, frame_index):
+        """Frame path of a frame index, requires a stored path pattern or path list"""
+        assert self.has_paths, f"{self.path} has no frame paths"
+        if self.path_pattern:
+            return self.path_pattern.format(index=frame_index)
+        return self.paths[self.row(frame_index)]
+
+    def to_json_dict(self):
+        """Dict in the layout of Classifier.get_prediction_dict"""
+        frame_indices = self.frame_indices.tolist()
+        return {
+            "labels": self.labels,
+            "paths": [self.get_path(i) for i in frame_indices] if self.has_paths else None,
+            "frame_indices": frame_indices,
+            "predictions": np.asarray(self.predictions, dtype=np.float32).tolist(),
+        }
+
+    def export_json(self, target_path):
+        """Writes the predictions as JSON for tools which cannot read the binary format"""
+        with open(target_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_json_dict(), f)
+        return Path(target_path)
+
+
+def is_prediction_file(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
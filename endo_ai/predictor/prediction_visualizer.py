@@ -4,29 +4,57 @@ import json
 from PIL import Image
 import argparse
 
+from endo_ai.predictor.prediction_io import PredictionFile, is_prediction_file
+
 
 # Load the JSON file
 @st.cache_data
-def load_data(file_path):
+def load_json(file_path):
     with open(file_path, 'r') as f:
         data = json.load(f)
     return data
 
+# Memory-map a binary prediction file (prediction_io.py)
+@st.cache_resource
+def load_prediction_file(file_path):
+    return PredictionFile(file_path)
+
+def load_data(file_path):
+    """
+    Returns labels, a function returning the predictions of a label, a function returning
+    the frame path of a frame position and the number of frames, for binary and JSON
+    prediction files
+    """
+    if is_prediction_file(file_path):
+        prediction_file = load_prediction_file(file_path)
+        frame_indices = prediction_file.frame_indices
+        return (
+            prediction_file.labels,
+            prediction_file.get_label,
+            lambda i: prediction_file.get_path(int(frame_indices[i])),
+            len(prediction_file),
+        )
+
+    data = load_json(file_path)
+    return (
+        data['labels'],
+        lambda label: [pred[data['labels'].index(label)] for pred in data['predictions']],
+        lambda i: data['paths'][i],
+        len(data['paths']),
+    )
+
 # Streamlit App
 def main(file_path):
     st.title("Visualize Predictions")
 
     # Load the data
-    data = load_data(file_path)
+    labels, get_label_predictions, get_frame_path, n_frames = load_data(file_path)
 
     # Dropdown to select label
-    selected_label = st.selectbox('Select Label', options=data['labels'])
-
-    # Get the index of the selected label
-    label_index = data['labels'].index(selected_label)
+    selected_label = st.selectbox('Select Label', options=labels)
 
     # Extract predictions for the selected label
-    selected_predictions = [pred[label_index] for pred in data['predictions']]
+    selected_predictions = get_label_predictions(selected_label)
 
     # Line plot for the selected label's prediction values
     st.subheader(f"Line plot for {selected_label}")
@@ -41,15 +69,15 @@ def main(file_path):
 
 
     # Slider to select frame
-    frame_idx = st.slider('Select a frame', 0, len(data['paths']) - 1)
+    frame_idx = st.slider('Select a frame', 0, n_frames - 1)
 
     # Display the frame
-    image_path = data['paths'][frame_idx]
+    image_path = get_frame_path(frame_idx)
     image = Image.open(image_path)
     st.image(image, caption=f"Frame {frame_idx}", use_column_width=True)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Visualize Predictions")
-    parser.add_argument("--file", type=str, help="Path to JSON file containing predictions", required=True)
+    parser.add_argument("--file", type=str, help="Path to the prediction file (.preds or JSON)", required=True)
     args = parser.parse_args()
     main(args.file)
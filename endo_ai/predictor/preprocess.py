@@ -1,6 +1,16 @@
+import math
 import numpy as np
 from PIL import Image, ImageOps  # Import the required modules from Pillow
 
+# Support (in source pixels at scale 1) of the Pillow resampling filters
+RESAMPLE_SUPPORT = {
+    Image.Resampling.BOX: 0.5,
+    Image.Resampling.BILINEAR: 1.0,
+    Image.Resampling.HAMMING: 1.0,
+    Image.Resampling.BICUBIC: 2.0,
+    Image.Resampling.LANCZOS: 3.0,
+}
+
 def crop_img(img, crop):
     """
     Crops the image based on the specified dimensions and adds padding to maintain aspect ratio.
@@ -33,9 +43,123 @@ def crop_img(img, crop):
     return img_padded
 
 
+def crop_resize_img(img, crop, scale, scale_method=Image.Resampling.LANCZOS, out=None):
+    """
+    Fused version of crop_img followed by resize: crops the image, pads it to a square
+    and resizes it to scale, without creating the padded image.
+
+    The crop is resampled once, straight into the output buffer. Only the few output
+    rows (or columns) whose filter support reaches into the padding are computed from
+    small padded strips, so the result matches crop_img + resize up to rounding (+-1).
+
+    Parameters:
+        img: RGB PIL Image object or numpy array (HWC, uint8) of the image.
+        crop: Tuple of (ymin, ymax, xmin, xmax) specifying the crop area.
+        scale: Tuple specifying the new size (width, height).
+        scale_method: Resampling method used for scaling (default is Image.Resampling.LANCZOS).
+        out: Optional uint8 numpy array (height, width, 3) the result is written to.
+
+    Returns:
+        Numpy array of the processed image.
+    """
+    ymin, ymax, xmin, xmax = crop
+    if isinstance(img, np.ndarray):
+        if 0 <= ymin < ymax <= img.shape[0] and 0 <= xmin < xmax <= img.shape[1]:
+            # copy only the crop into the PIL image
+            region = Image.fromarray(np.ascontiguousarray(img[ymin:ymax, xmin:xmax], dtype=np.uint8), 'RGB')
+        else:
+            # Pillow fills crop areas outside the image with black
+            region = Image.fromarray(img.astype('uint8'), 'RGB').crop((xmin, ymin, xmax, ymax))
+    else:
+        region = img.crop((xmin, ymin, xmax, ymax))
+
+    width, height = region.size
+    size_x, size_y = scale
+    if out is None:
+        out = np.empty((size_y, size_x, 3), dtype=np.uint8)
+
+    support = RESAMPLE_SUPPORT.get(scale_method)
+    if width == height:
+        # nothing to pad
+        out[...] = np.asarray(region.resize(scale, resample=scale_method))
+        return out
+    if support is None:
+        # e.g. NEAREST, no filter support to reason about
+        out[...] = np.asarray(crop_img(region, (0, height, 0, width)).resize(scale, resample=scale_method))
+        return out
+
+    # Geometry along the padded axis (rows if the crop is wider than high, else columns)
+    pad_rows = width > height
+    length, out_length = (height, size_y) if pad_rows else (width, size_x)
+    side = max(width, height)
+    pad = (side - length) // 2
+    step = side / out_length
+    filter_support = support * max(step, 1.0)
+
+    def _box(start, stop):
+        # box along the padded axis, the other axis is used completely
+        return (0, start, width, stop) if pad_rows else (start, 0, stop, height)
+
+    def _slice(start, stop):
+        return (slice(start, stop), slice(None)) if pad_rows else (slice(None), slice(start, stop))
+
+    def _resample(start, stop):
+        # output rows [start, stop) read the padded image in [src_start, src_stop)
+        if stop <= start:
+            return
+        src_start = max(0, math.floor(start * step - filter_support) - 2)
+        src_stop = min(side, math.ceil(stop * step + filter_support) + 2)
+        if src_start >= pad and src_stop <= pad + length:
+            # only pixels of the crop are sampled, resample the crop directly
+            source, offset = region, pad
+        else:
+            # small strip of the padded image around the crop border
+            n = src_stop - src_start
+            source = Image.new(region.mode, (width, n) if pad_rows else (n, height))
+            lo, hi = max(src_start, pad), min(src_stop, pad + length)
+            if hi > lo:
+                source.paste(
+                    region.crop(_box(lo - pad, hi - pad)),
+                    (0, lo - src_start) if pad_rows else (lo - src_start, 0),
+                )
+            offset = src_start
+        source_length = source.size[1] if pad_rows else source.size[0]
+        out[_slice(start, stop)] = np.asarray(
+            source.resize(
+                (size_x, stop - start) if pad_rows else (stop - start, size_y),
+                resample=scale_method,
+                box=_box(start * step - offset, min(stop * step - offset, source_length)),
+            )
+        )
+
+    # output rows before zero_stop / after zero_start only sample the (black) padding,
+    # rows in [first, last) only sample pixels of the crop
+    zero_stop = max(0, math.floor((pad - filter_support - 1) / step))
+    zero_start = min(out_length, math.ceil((pad + length + filter_support + 1) / step))
+    first = math.ceil((pad + filter_support + 1) / step)
+    last = math.floor((pad + length - filter_support - 1) / step)
+    if first >= last:
+        # crop too small for the fused path
+        out[...] = np.asarray(crop_img(region, (0, height, 0, width)).resize(scale, resample=scale_method))
+        return out
+
+    out[_slice(0, zero_stop)] = 0
+    _resample(zero_stop, first)
+    _resample(first, last)
+    _resample(last, zero_start)
+    out[_slice(zero_start, out_length)] = 0
+
+    return out
+
+
 class Cropper:
-    def __init__(self):
-        pass
+    def __init__(self, fast=False):
+        """
+        Parameters:
+            fast: If True, crop, padding and resize are fused into a single
+                resampling step (see crop_resize_img).
+        """
+        self.fast = fast
 
     def __call__(self, img, crop=None, scale=None, scale_method=Image.Resampling.LANCZOS):
         """
@@ -50,6 +174,9 @@ class Cropper:
         Returns:
             Numpy array of the processed image.
         """
+        if self.fast and crop is not None and scale is not None:
+            return crop_resize_img(img, crop, scale, scale_method=scale_method)
+
         # Convert numpy array to PIL Image if necessary
         if isinstance(img, np.ndarray):
             img = Image.fromarray(img.astype('uint8'), 'RGB')
@@ -0,0 +1,197 @@
+"""
+Reduced precision variants of the classification model for CPU inference.
+
+    "fp32"          the unchanged model
+    "int8_static"   FX graph mode static INT8 quantization of the whole network (x86 engine),
+                    calibrated on stored frames and saved next to the checkpoint
+    "bf16"          bfloat16 autocast, requires a CPU with native bf16 support (AVX512-BF16 / AMX)
+
+Dynamic quantization is not offered: it only covers nn.Linear, which in the RegNet
+classifiers is the single head, and leaves the convolutions (almost all of the compute)
+in fp32. Reduced precision variants run on the CPU only (see CPU_PRECISIONS).
+
+A variant is only used in production after it was validated against fp32
+(see the validate_precision command), which writes a passed report next to the checkpoint.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import torch
+from torch import nn
+from icecream import ic
+
+from .backends import get_eager_module, get_example_input, get_weights_hash
+from .inference_dataset import InferenceDataset
+
+PRECISIONS = ["fp32", "int8_static", "bf16"]
+# variants with CPU kernels only (quantized x86 ops, CPU autocast)
+CPU_PRECISIONS = ["int8_static", "bf16"]
+
+
+def cpu_supports_bf16():
+    """True if oneDNN can run bfloat16 kernels natively on this CPU"""
+    return torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported()  # pylint: disable=protected-access
+
+
+def get_variant_path(weights_path, precision, suffix):
+    """<checkpoint dir>/<checkpoint stem>.<weights hash>.<precision><suffix>"""
+    weights_path = Path(weights_path)
+    weights_hash = get_weights_hash(weights_path)
+    return weights_path.with_name(f"{weights_path.stem}.{weights_hash}.{precision}{suffix}")
+
+
+def get_validation_path(weights_path, precision):
+    return get_variant_path(weights_path, precision, ".validated.json")
+
+
+def write_validation_report(weights_path, precision, report):
+    """Writes the validation report, a passed report activates the variant for these weights"""
+    path = get_validation_path(weights_path, precision)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def is_validated(weights_path, precision):
+    if precision == "fp32":
+        return True
+    path = get_validation_path(weights_path, precision)
+    if not path.exists():
+        return False
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("passed", False)
+
+
+def get_calibration_batches(paths, crops, config, n_frames=256):
+    """Preprocessed batches of n_frames frames drawn evenly from the given frames"""
+    indices = np.linspace(0, len(paths) - 1, num=min(n_frames, len(paths))).astype(int)
+    indices = np.unique(indices)
+    dataset = InferenceDataset(
+        [paths[i] for i in indices],
+        [crops[i] for i in indices],
+        dict(config, preprocessing="item"),
+    )
+    loader = torch.utils.data.DataLoader(dataset, batch_size=config["batchsize"])
+    return list(loader)
+
+
+class Bf16AutocastModel(nn.Module):
+    """Runs the wrapped module under CPU bfloat16 autocast and returns float32 logits"""
+
+    def __init__(self, module):
+        super().__init__()
+        self.module = module
+
+    def forward(self, x):
+        with torch.autocast("cpu", dtype=torch.bfloat16):
+            return self.module(x).float()
+
+
+def quantize_static(model, calibration_batches, config):
+    """
+    FX graph mode static INT8 quantization, calibrated on the given batches.
+    Returns a frozen TorchScript module.
+    """
+    # pylint: disable=import-outside-toplevel
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    assert calibration_batches, "Static quantization requires calibration frames"
+    torch.backends.quantized.engine = "x86"
+
+    module = get_eager_module(model)
+    example = get_example_input(config, batchsize=1)
+    prepared = prepare_fx(module, get_default_qconfig_mapping("x86"), (example,))
+    with torch.no_grad():
+        for batch in calibration_batches:
+            prepared(batch)
+    quantized = convert_fx(prepared)
+
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(quantized, example))
+    return traced
+
+
+def build_precision_model(model, precision, weights_path, config, calibration_batches=None):
+    """
+    Builds (and for int8_static saves) the variant of the model.
+    Used by the validation, production code loads variants with load_precision_model.
+    """
+    assert precision in PRECISIONS, f"Unknown precision {precision}, choose from {PRECISIONS}"
+    if precision == "fp32":
+        return model
+    if precision == "bf16":
+        if not cpu_supports_bf16():
+            raise RuntimeError("This CPU has no native bfloat16 support")
+        return Bf16AutocastModel(get_eager_module(model))
+
+    quantized = quantize_static(model, calibration_batches, config)
+    path = get_variant_path(weights_path, precision, ".ts.pt")
+    quantized.save(str(path))
+    ic(f"Saved {precision} model to {path}")
+    return quantized
+
+
+def load_precision_model(model, precision, weights_path):
+    """
+    Returns the validated variant of the model for CPU inference (prepare it for the CPU,
+    video_prediction.get_inference_config sets the device of reduced precisions).
+    Raises if the variant was not validated for these weights.
+    """
+    assert precision in PRECISIONS, f"Unknown precision {precision}, choose from {PRECISIONS}"
+    if precision == "fp32":
+        return model
+
+    if not is_validated(weights_path, precision):
+        raise RuntimeError(
+            f"Precision {precision} is not validated for {weights_path}, run validate_precision first"
+        )
+
+    if precision == "int8_static":
+        torch.backends.quantized.engine = "x86"
+        return torch.jit.load(
+            str(get_variant_path(weights_path, precision, ".ts.pt")), map_location="cpu"
+        )
+    return build_precision_model(model, precision, weights_path, config=None)
+
+
+def compare_sequences(reference, candidate, n_frames, boundary_tolerance):
+    """
+    Compares per label filtered sequences (label -> list of (start, stop)) of a variant
+    with the fp32 reference.
+
+    A label passes if the number of segments is unchanged and no segment boundary
+    moved by more than boundary_tolerance frames.
+
+    Returns:
+        dict: label -> {"n_reference", "n_candidate", "max_boundary_shift",
+            "frame_disagreement", "passed"}
+    """
+    report = {}
+    for label, ref_sequences in reference.items():
+        cand_sequences = candidate.get(label, [])
+
+        max_shift = 0
+        if len(ref_sequences) == len(cand_sequences):
+            for (ref_start, ref_stop), (start, stop) in zip(ref_sequences, cand_sequences):
+                max_shift = max(max_shift, abs(ref_start - start), abs(ref_stop - stop))
+        else:
+            max_shift = None
+
+        ref_mask = np.zeros(n_frames, dtype=bool)
+        cand_mask = np.zeros(n_frames, dtype=bool)
+        for start, stop in ref_sequences:
+            ref_mask[start : stop + 1] = True
+        for start, stop in cand_sequences:
+            cand_mask[start : stop + 1] = True
+
+        report[label] = {
+            "n_reference": len(ref_sequences),
+            "n_candidate": len(cand_sequences),
+            "max_boundary_shift": max_shift,
+            "frame_disagreement": float((ref_mask != cand_mask).mean()) if n_frames else 0.0,
+            "passed": max_shift is not None and max_shift <= boundary_tolerance,
+        }
+    return report
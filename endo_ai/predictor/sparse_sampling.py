@@ -0,0 +1,153 @@
+"""
+Sparse temporal sampling for video prediction.
+
+Most labels change only a few times per procedure, so instead of classifying every
+frame we classify every n-th frame, find the label transitions in this coarse signal
+and bisect only the intervals around the transitions until the boundary is known
+to within a given tolerance. Frames which were not classified get the mean
+prediction of the classified frames of their run (the frames between two label
+transitions).
+
+The bisection runs on the raw per-frame predictions, the smoothing (or filters) of
+the production post-processing is applied afterwards to the filled matrix, exactly
+like to a dense one. The filled runs are flat, while the moving average of the dense
+predictions also averages their frame-to-frame noise, so the smoothed boundaries can
+differ from the dense ones by the raw boundary error (tolerance) plus the shift this
+noise causes (a few frames for a window of 50; see the test comparing both).
+Filling with the run mean instead of the closest classified frame halves that shift.
+Bisecting the smoothed signal itself would need a full window of frames per probe,
+which defeats the sampling.
+"""
+
+import numpy as np
+
+from .postprocess import find_true_pred_sequences
+
+
+def get_coarse_indices(n_frames, stride):
+    """Every stride-th frame index, always including the last frame"""
+    indices = list(range(0, n_frames, stride))
+    if indices[-1] != n_frames - 1:
+        indices.append(n_frames - 1)
+    return indices
+
+
+def find_transition_intervals(coarse_indices, coarse_binary):
+    """
+    Finds the intervals between two coarse samples which contain a label transition.
+
+    Args:
+        coarse_indices (list): Frame indices of the coarse samples.
+        coarse_binary (np.array): Boolean array (n_coarse x n_labels).
+
+    Returns:
+        set of tuples: (first frame, last frame, label index) for every
+            interval whose end points disagree for the label.
+    """
+    intervals = set()
+    n_coarse = len(coarse_indices)
+    for label_idx in range(coarse_binary.shape[1]):
+        for start, stop in find_true_pred_sequences(coarse_binary[:, label_idx]):
+            # rising edge between the previous sample and start
+            if start > 0:
+                intervals.add(
+                    (coarse_indices[start - 1], coarse_indices[start], label_idx)
+                )
+            # falling edge between stop and the next sample
+            if stop < n_coarse - 1:
+                intervals.add(
+                    (coarse_indices[stop], coarse_indices[stop + 1], label_idx)
+                )
+    return intervals
+
+
+def fill_predictions(n_frames, evaluated, threshold=0.5):
+    """
+    Expands the predictions of the evaluated frames to all frames. Every frame gets,
+    per label, the mean prediction of the evaluated frames in the run of the closest
+    evaluated frame at or before it (runs are split where the binarized label changes).
+
+    Args:
+        n_frames (int): Number of frames.
+        evaluated (dict): Frame index -> prediction (row of n_labels floats).
+        threshold (float): Threshold used to binarize the predictions.
+
+    Returns:
+        np.ndarray: float32 predictions (n_frames x n_labels).
+    """
+    indices = np.array(sorted(evaluated.keys()))
+    values = np.stack([np.asarray(evaluated[i], dtype=np.float32) for i in indices])
+
+    # run id per evaluated frame and label, a new run starts at every transition
+    binary = values > threshold
+    run_ids = np.zeros(binary.shape, dtype=np.int64)
+    run_ids[1:] = np.cumsum(binary[1:] != binary[:-1], axis=0)
+    run_means = np.empty_like(values)
+    for label_idx in range(values.shape[1]):
+        runs = run_ids[:, label_idx]
+        means = np.bincount(runs, weights=values[:, label_idx]) / np.bincount(runs)
+        run_means[:, label_idx] = means[runs]
+
+    positions = np.searchsorted(indices, np.arange(n_frames), side="right") - 1
+    return run_means[positions]
+
+
+def predict_sparse(classifier, paths, crops, stride=25, tolerance=1, threshold=0.5):
+    """
+    Predicts a sequence of frames with sparse sampling and boundary refinement.
+
+    Args:
+        classifier (Classifier): Classifier used for the forward passes.
+        paths (list): Frame paths in temporal order.
+        crops (list): Crop regions for the frames.
+        stride (int): Distance between the coarse samples in frames. Runs which are
+            shorter than the stride can be missed, so this should not exceed the
+            minimum sequence length used in post processing.
+        tolerance (int): Maximum error of a recovered boundary in frames (>= 1).
+            With tolerance 1 boundaries are frame accurate.
+        threshold (float): Threshold used to binarize the predictions.
+
+    Returns:
+        tuple: (float32 predictions for every frame (n_frames x n_labels), number of
+            classified frames)
+    """
+    assert stride >= 1, "stride must be >= 1"
+    assert tolerance >= 1, "tolerance must be >= 1"
+
+    n_frames = len(paths)
+    evaluated = {}
+
+    def evaluate(indices):
+        indices = sorted(set(indices) - evaluated.keys())
+        if indices:
+            predictions = classifier.pipe(
+                [paths[i] for i in indices], [crops[i] for i in indices], output="array"
+            )
+            # rows of the batch array, no per-value conversion
+            evaluated.update(zip(indices, predictions))
+
+    coarse_indices = get_coarse_indices(n_frames, stride)
+    evaluate(coarse_indices)
+
+    coarse_binary = np.stack([evaluated[i] for i in coarse_indices]) > threshold
+    intervals = find_transition_intervals(coarse_indices, coarse_binary)
+
+    # bisect all open intervals in parallel, one batched forward pass per round
+    intervals = {(a, b, label) for a, b, label in intervals if b - a > tolerance}
+    while intervals:
+        evaluate([(a + b) // 2 for a, b, _label in intervals])
+
+        refined = set()
+        for a, b, label in intervals:
+            middle = (a + b) // 2
+            if (evaluated[middle][label] > threshold) == (
+                evaluated[a][label] > threshold
+            ):
+                a = middle
+            else:
+                b = middle
+            if b - a > tolerance:
+                refined.add((a, b, label))
+        intervals = refined
+
+    return fill_predictions(n_frames, evaluated, threshold=threshold), len(evaluated)
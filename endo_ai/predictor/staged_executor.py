@@ -0,0 +1,151 @@
+"""
+Pipelined execution of frame loading and the forward pass.
+
+Frames are read, decoded and preprocessed by a thread pool (PIL and the resampling release
+the GIL), collated into batches by a feeder thread and handed to the model thread through a
+bounded queue, so decode and forward pass overlap. Batches are emitted in input order.
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+_DONE = object()
+
+
+class _Stopped(Exception):
+    """Raised in the feeder thread when the consumer stopped early"""
+
+
+class StageStats:
+    """Accumulated busy time of a pipeline stage"""
+
+    def __init__(self, name, n_workers=1):
+        self.name = name
+        self.n_workers = n_workers
+        self.busy_s = 0.0
+        self.n_items = 0
+        self._lock = threading.Lock()
+
+    def add(self, seconds, n_items=1):
+        with self._lock:
+            self.busy_s += seconds
+            self.n_items += n_items
+
+    def utilization(self, wall_s):
+        """Fraction of the wall time the workers of this stage were busy"""
+        if wall_s <= 0:
+            return 0.0
+        return min(self.busy_s / (wall_s * self.n_workers), 1.0)
+
+
+class StagedExecutor:
+    """
+    Loads items in a thread pool and yields collated batches in order.
+
+    Args:
+        load_fn (callable): Loads and preprocesses one item, returns a tensor.
+        batchsize (int): Number of items per batch.
+        n_threads (int): Number of decode threads.
+        prefetch_batches (int): Maximum number of batches decoded ahead of the model.
+
+    After a run, stats holds the StageStats of the "decode", "collate" and "model" stages
+    (model busy time is the time the consumer was not waiting for a batch) and wall_s the
+    duration of the run.
+    """
+
+    def __init__(self, load_fn, batchsize, n_threads=4, prefetch_batches=2):
+        assert n_threads >= 1, "n_threads must be >= 1"
+        assert prefetch_batches >= 1, "prefetch_batches must be >= 1"
+        self.load_fn = load_fn
+        self.batchsize = batchsize
+        self.n_threads = n_threads
+        self.prefetch_batches = prefetch_batches
+        self.stats = {}
+        self.wall_s = 0.0
+
+    def _timed_load(self, item):
+        start = time.perf_counter()
+        result = self.load_fn(item)
+        self.stats["decode"].add(time.perf_counter() - start)
+        return result
+
+    def _feed(self, items, pool, batches, stop):
+        """Submits the items to the pool, collates the results in order and queues the batches"""
+        try:
+            pending = deque()
+            chunks = (items[i : i + self.batchsize] for i in range(0, len(items), self.batchsize))
+            for chunk in chunks:
+                # keep the pool busy with up to prefetch_batches batches ahead
+                pending.append([pool.submit(self._timed_load, item) for item in chunk])
+                if len(pending) > self.prefetch_batches:
+                    self._put(batches, self._collate(pending.popleft()), stop)
+            while pending:
+                self._put(batches, self._collate(pending.popleft()), stop)
+            self._put(batches, _DONE, stop)
+        except _Stopped:
+            pass
+        except Exception as e:  # pylint: disable=broad-except
+            # re-raised in the model thread
+            self._put(batches, e, stop, block_on_stop=False)
+
+    def _collate(self, futures):
+        tensors = [future.result() for future in futures]
+        start = time.perf_counter()
+        batch = torch.stack(tensors)
+        self.stats["collate"].add(time.perf_counter() - start, len(tensors))
+        return batch
+
+    @staticmethod
+    def _put(batches, value, stop, block_on_stop=True):
+        while True:
+            if stop.is_set():
+                if block_on_stop:
+                    raise _Stopped()
+                return
+            try:
+                batches.put(value, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def iter_batches(self, items):
+        """Yields the batches of the loaded items in input order"""
+        items = list(items)
+        self.stats = {
+            "decode": StageStats("decode", self.n_threads),
+            "collate": StageStats("collate"),
+            "model": StageStats("model"),
+        }
+        batches = queue.Queue(maxsize=self.prefetch_batches)
+        stop = threading.Event()
+
+        start = time.perf_counter()
+        pool = ThreadPoolExecutor(max_workers=self.n_threads)
+        feeder = threading.Thread(
+            target=self._feed, args=(items, pool, batches, stop), daemon=True
+        )
+        feeder.start()
+        try:
+            while True:
+                batch = batches.get()
+                returned = time.perf_counter()
+                if batch is _DONE:
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+                yield batch
+                self.stats["model"].add(time.perf_counter() - returned, len(batch))
+        finally:
+            stop.set()
+            feeder.join()
+            pool.shutdown(cancel_futures=True)
+            self.wall_s = time.perf_counter() - start
+
+    def report(self):
+        """Per stage utilization of the last run, e.g. {"decode": 0.95, "model": 0.4, ...}"""
+        return {name: stats.utilization(self.wall_s) for name, stats in self.stats.items()}
@@ -1,5 +1,6 @@
 """Utility functions for the predictor module"""
 
+import torch
 from torchvision import transforms
 
 
@@ -10,3 +11,64 @@ def get_unorm(ds_config: dict):
         std=[1 / s for s in ds_config["std"]],
     )
     return unorm
+
+
+def get_device(device=None) -> torch.device:
+    """
+    Resolve the device used for inference.
+
+    Args:
+        device (str | torch.device, optional): "cpu", "cuda", "cuda:1", ... or
+            "auto"/None to use CUDA if available and fall back to CPU otherwise.
+
+    Returns:
+        torch.device: The resolved device.
+    """
+    if device is None or device == "auto":
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    device = torch.device(device)
+    if device.type == "cuda" and not torch.cuda.is_available():
+        raise RuntimeError(f"Device {device} requested but CUDA is not available")
+
+    return device
+
+
+def configure_cpu_threads(intra_op_threads=None, inter_op_threads=None):
+    """
+    Configure the torch thread pools for CPU inference.
+
+    Args:
+        intra_op_threads (int, optional): Threads used inside a single operator
+            (convolutions, matmuls). Defaults to the torch default (one per core).
+        inter_op_threads (int, optional): Threads used to run independent operators
+            in parallel. Can only be set once per process, before any parallel work.
+    """
+    if intra_op_threads:
+        torch.set_num_threads(int(intra_op_threads))
+
+    if inter_op_threads and torch.get_num_interop_threads() != int(inter_op_threads):
+        try:
+            torch.set_num_interop_threads(int(inter_op_threads))
+        except RuntimeError:
+            # torch only allows this before the inter-op pool was started,
+            # e.g. a second video in the same worker process
+            pass
+
+
+def prepare_model(model, device):
+    """
+    Move the model to the device and switch it to eval mode.
+    On CPU the model is converted to channels_last, which is the
+    memory format the oneDNN convolution kernels are fastest with.
+    Models which are not torch modules (e.g. an ONNX Runtime session) are returned as is.
+    """
+    if not isinstance(model, torch.nn.Module):
+        return model
+
+    device = get_device(device)
+    model = model.to(device)
+    if device.type == "cpu":
+        model = model.to(memory_format=torch.channels_last)
+    model.eval()
+    return model
@@ -0,0 +1,146 @@
+"""
+Process pool predicting many videos in parallel.
+
+Every worker process sets up Django and loads the inference model once (into the process
+wide model cache, see model_cache.py), then claims one video at a time from the shared
+task queue (imap_unordered with chunksize 1, so fast workers take more videos) and stores
+its results itself. A failing video is reported with its traceback and does not stop the
+worker or the pool. Workers are started with "forkserver" / "spawn" like the frame loader
+workers (data_loading.py), never with "fork".
+"""
+
+import os
+import time
+import traceback
+from functools import partial
+
+from icecream import ic
+
+from .data_loading import get_multiprocessing_context
+
+
+def run_task(task_fn, item):
+    """
+    Runs task_fn(item) and catches every exception, so one failing item never takes
+    down its worker.
+
+    Returns:
+        dict: {"item", "ok", "result", "error", "seconds", "pid"}
+    """
+    start = time.perf_counter()
+    try:
+        result, error = task_fn(item), None
+    except Exception:  # pylint: disable=broad-except
+        result, error = None, traceback.format_exc()
+    return {
+        "item": item,
+        "ok": error is None,
+        "result": result,
+        "error": error,
+        "seconds": time.perf_counter() - start,
+        "pid": os.getpid(),
+    }
+
+
+def run_pool(items, task_fn, workers=1, initializer=None, initargs=(), method=None):
+    """
+    Runs task_fn over items in a pool of worker processes and yields one result dict
+    (see run_task) per item in completion order.
+
+    Args:
+        items (iterable): Picklable task arguments, e.g. video uuids.
+        task_fn (callable): Module level (picklable) function called with one item.
+        workers (int): Number of worker processes. 1 runs in this process.
+        initializer (callable, optional): Called once per worker before its first task,
+            e.g. to load the model.
+        initargs (tuple): Arguments of the initializer.
+        method (str, optional): "forkserver" or "spawn", see get_multiprocessing_context.
+    """
+    items = list(items)
+    task = partial(run_task, task_fn)
+    if workers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for item in items:
+            yield task(item)
+        return
+
+    context = get_multiprocessing_context(method)
+    with context.Pool(
+        processes=min(workers, max(len(items), 1)),
+        initializer=initializer,
+        initargs=initargs,
+    ) as pool:
+        yield from pool.imap_unordered(task, items, chunksize=1)
+
+
+def summarize_results(results, wall_seconds):
+    """
+    Throughput summary of run_pool results. Tasks may return a dict with "n_frames".
+
+    Returns:
+        dict: n_videos, n_failed, failed (item -> last traceback line), wall_seconds,
+            n_frames, videos_per_hour, frames_per_s.
+    """
+    succeeded = [r for r in results if r["ok"]]
+    failed = {
+        r["item"]: r["error"].strip().splitlines()[-1] for r in results if not r["ok"]
+    }
+    n_frames = sum(
+        r["result"].get("n_frames", 0) for r in succeeded if isinstance(r["result"], dict)
+    )
+    wall_seconds = max(wall_seconds, 1e-9)
+    return {
+        "n_videos": len(succeeded),
+        "n_failed": len(failed),
+        "failed": failed,
+        "wall_seconds": wall_seconds,
+        "n_frames": n_frames,
+        "videos_per_hour": len(succeeded) * 3600 / wall_seconds,
+        "frames_per_s": n_frames / wall_seconds,
+    }
+
+
+def get_worker_threads(workers, intra_op_threads=None):
+    """Intra-op threads per worker: the explicit value, else the usable cores split evenly"""
+    if intra_op_threads:
+        return intra_op_threads
+    if hasattr(os, "sched_getaffinity"):
+        n_cores = len(os.sched_getaffinity(0))
+    else:
+        n_cores = os.cpu_count()
+    return max(1, n_cores // max(workers, 1))
+
+
+def init_prediction_worker(model_meta_name, model_meta_version, config_overrides):
+    """
+    Pool initializer: sets up Django (the settings module is inherited through the
+    environment) and loads the model of the ModelMeta into the model cache of the worker.
+    """
+    # pylint: disable=import-outside-toplevel
+    import django
+
+    django.setup()
+
+    from endoreg_db.models import ModelMeta
+
+    from .video_prediction import get_inference_config, get_inference_model
+
+    model_meta = ModelMeta.get_by_name(model_meta_name, model_meta_version)
+    get_inference_model(model_meta, get_inference_config(model_meta, **config_overrides))
+    ic(f"Worker {os.getpid()} loaded {model_meta}")
+
+
+def predict_raw_video_file_task(uuid, predict_kwargs):
+    """Pool task: predicts one RawVideoFile, see video_prediction.predict_video"""
+    # pylint: disable=import-outside-toplevel
+    from django.db import close_old_connections
+    from endoreg_db.models import RawVideoFile
+
+    from .video_prediction import predict_video
+
+    # long lived workers may hold connections the database has closed meanwhile
+    close_old_connections()
+    raw_video_file = RawVideoFile.objects.get(uuid=uuid)  # pylint: disable=no-member
+    predict_video(raw_video_file, **predict_kwargs)
+    return {"n_frames": len((raw_video_file.predictions or {}).get("predictions", []))}
@@ -0,0 +1,533 @@
+"""
+Prediction of RawVideoFile / Video objects with the endo-ai Classifier.
+
+This is the endo-ai side of ``AbstractVideoFile.predict_video`` from endoreg-db
+(see the TODO there about moving it upstream). Keeping it next to the Classifier
+lets the management commands pass inference options like the device through.
+"""
+
+from pathlib import Path
+import numpy as np
+import torch
+from icecream import ic
+
+from .inference_model import InferenceNet
+from .backends import load_backend, get_weights_hash, get_example_input
+from .quantization import CPU_PRECISIONS, load_precision_model
+from .model_cache import model_cache, get_model_key
+from .utils import get_device, prepare_model
+from .autotune import autotune as run_autotune, apply_tuning, get_tuning_path
+from .predict import Classifier
+from .filters import apply_filters, parse_filter_spec
+from .frame_extraction import get_frame_paths
+from .fingerprint import (
+    FINGERPRINT_KEY,
+    FINGERPRINT_PAYLOAD_KEY,
+    get_fingerprint_options,
+    get_fingerprint_payload,
+    hash_fingerprint_payload,
+    with_postprocessing_options,
+)
+from .postprocess import (
+    make_smooth_preds_2d,
+    find_true_pred_sequences_2d,
+    StreamingPostProcessor,
+)
+
+# inference options which may be set on the ModelMeta
+INFERENCE_OPTIONS = [
+    "device",
+    "intra_op_threads",
+    "inter_op_threads",
+    "preprocessing",
+    "pipeline_threads",
+    "backend",
+    "precision",
+    "autotune",
+]
+
+
+def get_inference_config(model_meta, **overrides):
+    """
+    Build the Classifier config for a ModelMeta.
+
+    Inference options which are not (yet) part of the ModelMeta schema
+    (e.g. "device" or "preprocessing") are read from the ModelMeta if present and can be
+    overridden, e.g. from the command line. Overrides with value None are ignored.
+    Reduced precision variants (quantization.CPU_PRECISIONS) always run on the CPU.
+    """
+    config = model_meta.get_inference_dataset_config()
+
+    for key in INFERENCE_OPTIONS:
+        value = getattr(model_meta, key, None)
+        if value is not None:
+            config[key] = value
+
+    for key, value in overrides.items():
+        if value is not None:
+            config[key] = value
+
+    if config.get("precision") in CPU_PRECISIONS:
+        device = config.get("device")
+        if device not in (None, "auto") and torch.device(device).type != "cpu":
+            ic(f"Precision {config['precision']} runs on the CPU, ignoring device {device}")
+        config["device"] = "cpu"
+
+    return config
+
+
+def load_inference_model(model_meta, config):
+    """
+    Loads the checkpoint of the ModelMeta and returns the model for the backend and
+    precision of the config, prepared for the configured device.
+    """
+    weights_path = model_meta.weights.path
+    ic(f"Model path: {weights_path}")
+
+    ai_model_instance = InferenceNet.load_from_checkpoint(
+        checkpoint_path=weights_path,
+        map_location="cpu",
+    )
+
+    backend = config.get("backend", "eager")
+    precision = config.get("precision", "fp32")
+    device = get_device(config.get("device"))
+    if precision != "fp32":
+        assert backend == "eager", "Reduced precision variants require the eager backend"
+        assert device.type == "cpu", f"Precision {precision} runs on the CPU only"
+        inference_model = load_precision_model(ai_model_instance, precision, weights_path)
+    else:
+        inference_model = load_backend(
+            ai_model_instance, backend, weights_path=weights_path, config=config, device=device
+        )
+    return prepare_model(inference_model, device)
+
+
+def get_inference_model(model_meta, config):
+    """
+    Returns the inference model of the ModelMeta from the process wide model cache,
+    loading and warming it up on the first use.
+    """
+    device = get_device(config.get("device"))
+    key = get_model_key(
+        model_meta.name,
+        model_meta.version,
+        get_weights_hash(model_meta.weights.path),
+        device,
+        backend=config.get("backend", "eager"),
+        precision=config.get("precision", "fp32"),
+    )
+
+    def warmup(model):
+        memory_format = torch.channels_last if device.type == "cpu" else torch.contiguous_format
+        example = get_example_input(config, batchsize=1)
+        with torch.inference_mode():
+            model(example.to(device, memory_format=memory_format))
+
+    # the caller resolves the ModelMeta from the database per video: a new version or new
+    # weights (set by another process) show up as a new key, the old models are dropped
+    n_dropped = model_cache.drop_superseded(key)
+    if n_dropped:
+        ic(f"Dropped {n_dropped} superseded cached models of {model_meta.name}")
+    model = model_cache.get(
+        key, lambda: load_inference_model(model_meta, config), warmup_fn=warmup
+    )
+    ic(f"Model cache: {model_cache.stats()}")
+    return model
+
+
+def tune_inference_config(model_meta, config, model, overwrite=False, **probe_kwargs):
+    """
+    Sets batchsize and intra_op_threads of the config from the cached tuning of this
+    host, ModelMeta, backend and precision (CONF_DIR/autotune), probing the model first
+    if no tuning is cached.
+
+    Returns:
+        dict: The tuning result, see autotune.autotune.
+    """
+    tuning_path = get_tuning_path(
+        model_meta.name,
+        model_meta.version,
+        backend=config.get("backend", "eager"),
+        precision=config.get("precision", "fp32"),
+    )
+    tuning = run_autotune(model, config, tuning_path, overwrite=overwrite, **probe_kwargs)
+    apply_tuning(config, tuning)
+    return tuning
+
+
+def get_sorted_frame_paths(video):
+    """
+    Returns the frame paths of the video sorted by frame index.
+    Frame names are expected in format "frame_{index}.jpg".
+    """
+    paths = video.get_frame_paths()
+    indices = [int(p.stem.split("_")[1]) for p in paths]
+    path_index_tuples = list(zip(paths, indices))
+    # sort ascending by index
+    path_index_tuples.sort(key=lambda x: x[1])
+    paths, indices = zip(*path_index_tuples)
+    return list(paths), list(indices)
+
+
+def predict_video(
+    video,
+    model_meta_name: str,
+    model_meta_version=None,
+    smooth_window_size_s: float = 1,
+    binarize_threshold: float = 0.5,
+    test_run: bool = False,
+    n_test_frames: int = 100,
+    device=None,
+    intra_op_threads=None,
+    inter_op_threads=None,
+    from_video: bool = False,
+    sparse_stride=None,
+    sparse_tolerance: int = 1,
+    preprocessing=None,
+    pipeline_threads=None,
+    backend=None,
+    precision=None,
+    filters=None,
+    autotune=None,
+    tuning=None,
+    stream_segments: bool = False,
+):
+    """
+    Predict the frames of a RawVideoFile or Video and store the resulting
+    label sequences as label video segments.
+    Frames must be extracted before prediction, unless from_video is set.
+
+    Args:
+        video: RawVideoFile or Video object.
+        model_meta_name (str): Name of the ModelMeta to use.
+        model_meta_version (int, optional): Version of the ModelMeta. Defaults to the latest.
+        smooth_window_size_s (float): Size of the smoothing window in seconds.
+        binarize_threshold (float): Threshold for binarization.
+        test_run (bool): Only predict the first n_test_frames frames.
+        n_test_frames (int): Number of frames used in test runs.
+        device (str, optional): Inference device ("cpu", "cuda", ...). Overrides the ModelMeta.
+        intra_op_threads (int, optional): Torch intra-op threads for CPU inference.
+        inter_op_threads (int, optional): Torch inter-op threads for CPU inference.
+        from_video (bool): Decode the frames straight from the video file instead of
+            reading extracted frames. Frames do not need to be extracted.
+        sparse_stride (int, optional): Only classify every sparse_stride-th frame and
+            refine the label transitions by bisection. None classifies every frame.
+        sparse_tolerance (int): Maximum boundary error in frames for sparse prediction.
+        preprocessing (str, optional): "item" or "batch", see predict.sample_config.
+        pipeline_threads (int, optional): Decode threads overlapping the forward pass.
+        backend (str, optional): Inference backend, see backends.BACKENDS. Defaults to eager.
+        precision (str, optional): Reduced precision variant, see quantization.PRECISIONS.
+            Only variants validated with the validate_precision command are accepted,
+            they run on the CPU regardless of device.
+        filters (str, optional): Per label filter spec, see filters.py, e.g.
+            "default=box:1;blood=median:1,hysteresis:0.3:0.7". Replaces the moving
+            average of smooth_window_size_s; binarize_threshold applies to chains
+            without hysteresis.
+        autotune (bool, optional): Use the tuned batch size and thread count of this
+            host (see autotune.py), probing once if none is cached. An explicit
+            intra_op_threads takes precedence.
+        tuning (dict, optional): Tuning result to apply instead of autotune, e.g. probed
+            once by the parent of worker processes (see tune_inference_config).
+            An explicit intra_op_threads takes precedence.
+        stream_segments (bool): Smooth and binarize the predictions batch by batch while
+            the video is classified and store every label video segment as soon as it
+            closes (StreamingPostProcessor), instead of after the whole video. The
+            segments are the same as without streaming. Not with filters or sparse_stride.
+    """
+    assert not (from_video and sparse_stride), "Sparse prediction requires extracted frames"
+    assert not (stream_segments and (filters or sparse_stride)), (
+        "Streaming segments requires the moving average and dense prediction"
+    )
+    from endoreg_db.models import ModelMeta  # pylint: disable=import-outside-toplevel
+
+    model_meta = ModelMeta.get_by_name(model_meta_name, model_meta_version)
+    ic(f"Model: {model_meta.model}, Model Meta: {model_meta}")
+    # fail on invalid filter specs (e.g. a misspelled label) before the inference
+    if filters:
+        filters = parse_filter_spec(filters, model_meta.get_inference_dataset_config()["labels"])
+
+    prediction_meta_model = video.get_prediction_meta_model()
+    video_prediction_meta, _created = prediction_meta_model.objects.get_or_create(
+        video=video, model_meta=model_meta
+    )
+    video_prediction_meta.save()
+
+    crop_template = video.get_crop_template()
+
+    if test_run:
+        ic(f"Running in test mode, using only the first {n_test_frames} frames")
+
+    ds_config = get_inference_config(
+        model_meta,
+        device=device,
+        intra_op_threads=intra_op_threads,
+        inter_op_threads=inter_op_threads,
+        preprocessing=preprocessing,
+        pipeline_threads=pipeline_threads,
+        backend=backend,
+        precision=precision,
+        autotune=autotune,
+    )
+
+    fingerprint_payload = get_fingerprint_payload(
+        video.video_hash,
+        model_meta.name,
+        model_meta.version,
+        ds_config,
+        get_fingerprint_options(
+            smooth_window_size_s=smooth_window_size_s,
+            binarize_threshold=binarize_threshold,
+            test_run=test_run,
+            n_test_frames=n_test_frames,
+            from_video=from_video,
+            sparse_stride=sparse_stride,
+            sparse_tolerance=sparse_tolerance,
+            filters=filters,
+        ),
+    )
+
+    inference_model = get_inference_model(model_meta, ds_config)
+    if tuning is not None:
+        apply_tuning(ds_config, tuning)
+    elif ds_config.get("autotune"):
+        tuning = tune_inference_config(model_meta, ds_config, inference_model)
+    if tuning is not None:
+        if intra_op_threads is not None:
+            ds_config["intra_op_threads"] = intra_op_threads
+        ic(f"Tuned batchsize: {tuning['batchsize']}, threads: {ds_config.get('intra_op_threads')}")
+    classifier = Classifier(inference_model, config=ds_config, verbose=True)
+    ic(
+        f"Inference device: {classifier.device}, backend: {ds_config.get('backend', 'eager')}, "
+        f"precision: {ds_config.get('precision', 'fp32')}"
+    )
+
+    labels = classifier.config["labels"]
+    processor = None
+    if stream_segments:
+        # segments of an earlier prediction / post-processing with this ModelMeta
+        delete_label_segments(video, video_prediction_meta)
+        processor = StreamingPostProcessor(
+            labels,
+            window_size_s=smooth_window_size_s,
+            fps=video.get_fps(),
+            min_seq_len_s=None,
+            thresholds=binarize_threshold,
+            on_sequence=get_segment_writer(video, video_prediction_meta),
+        )
+    batch_callback = processor.update if processor is not None else None
+
+    if from_video:
+        video_path = Path(video.file.path)
+        ic(f"Decoding frames from {video_path}")
+        predictions = classifier.pipe_video(
+            video_path,
+            crop_template,
+            max_frames=n_test_frames if test_run else None,
+            output="array",
+            batch_callback=batch_callback,
+        )
+        assert len(predictions), f"No frames decoded from {video_path}"
+
+        # the paths (numbered from 1) extract_frames would give these frames, so both
+        # modes describe the same frame alike; nothing is written to disk
+        frame_paths = get_frame_paths(video.frame_dir, 0, len(predictions))
+        string_paths = [p.resolve().as_posix() for p in frame_paths]
+    else:
+        frame_dir = Path(video.frame_dir)
+        assert video.state_frames_extracted, "Frames not extracted"
+
+        paths, _indices = get_sorted_frame_paths(video)
+        ic(f"Found {len(paths)} images in {frame_dir}")
+        if test_run:
+            paths = paths[:n_test_frames]
+        assert paths, f"No images found in {frame_dir}"
+
+        string_paths = [p.resolve().as_posix() for p in paths]
+        crops = [crop_template for _ in paths]
+        if sparse_stride:
+            predictions = classifier.pipe_sparse(
+                string_paths,
+                crops,
+                stride=sparse_stride,
+                tolerance=sparse_tolerance,
+                threshold=binarize_threshold,
+                output="array",
+            )
+        else:
+            predictions = classifier.pipe(
+                string_paths, crops, output="array", batch_callback=batch_callback
+            )
+
+    # raw sigmoid matrix per (video, ModelMeta) in the prediction_array field of the
+    # prediction meta (endoreg-db>=0.6.4), for repostprocess_video
+    video_prediction_meta.save_prediction_array(predictions.astype(np.float32, copy=False))
+
+    # endoreg-db reads the per frame lists of the JSON fields (e.g. outside censoring and
+    # anonymization), the sequences are computed on the array
+    prediction_list = predictions.tolist()
+    video.predictions = classifier.get_prediction_dict(prediction_list, string_paths)
+    # skipped by incremental runs while nothing changes, see fingerprint.py
+    video.predictions[FINGERPRINT_KEY] = hash_fingerprint_payload(fingerprint_payload)
+    video.predictions[FINGERPRINT_PAYLOAD_KEY] = fingerprint_payload
+    video.readable_predictions = [classifier.readable(p) for p in prediction_list]
+
+    if processor is not None and processor.n_smooth:
+        processor.finish()
+        sequences = processor.sequences
+        video.sequences = sequences
+    else:
+        # without streaming, or a video shorter than the smoothing window
+        sequences = postprocess_video(
+            video,
+            video_prediction_meta,
+            predictions,
+            labels,
+            smooth_window_size_s=smooth_window_size_s,
+            binarize_threshold=binarize_threshold,
+            filters=filters,
+        )
+
+    video.state_initial_prediction_required = False
+    video.state_initial_prediction_completed = True
+    video.save()
+
+    return sequences
+
+
+def postprocess_video(
+    video,
+    video_prediction_meta,
+    predictions,
+    labels,
+    smooth_window_size_s=1,
+    binarize_threshold=0.5,
+    filters=None,
+):
+    """
+    Smooths (or filters) and binarizes the prediction matrix of a video, stores the
+    sequences and replaces the label video segments of the prediction meta.
+
+    Returns:
+        dict: label -> list of inclusive (start, stop) frame ranges.
+    """
+    fps = video.get_fps()
+    ic(f"FPS: {fps}, Smooth Window Size: {smooth_window_size_s}")
+
+    if filters:
+        ic(f"Filters: {filters}")
+        _smooth_predictions, binary_predictions = apply_filters(
+            predictions, labels, filters, fps=fps, threshold=binarize_threshold
+        )
+    else:
+        smooth_predictions = make_smooth_preds_2d(
+            predictions, window_size_s=smooth_window_size_s, fps=fps
+        )
+        binary_predictions = smooth_predictions > binarize_threshold
+
+    sequences = dict(zip(labels, find_true_pred_sequences_2d(binary_predictions)))
+
+    video.sequences = sequences
+    # segments of an earlier prediction / post-processing with this ModelMeta
+    delete_label_segments(video, video_prediction_meta)
+    video.sequences_to_label_video_segments(
+        video_prediction_meta=video_prediction_meta
+    )
+    return sequences
+
+
+def delete_label_segments(video, video_prediction_meta):
+    video.get_label_segment_model().objects.filter(
+        video=video, prediction_meta=video_prediction_meta
+    ).delete()
+
+
+def get_segment_writer(video, video_prediction_meta):
+    """
+    StreamingPostProcessor.on_sequence callback creating the label video segment of
+    every closed sequence, like video.sequences_to_label_video_segments.
+    """
+    from endoreg_db.models import Label  # pylint: disable=import-outside-toplevel
+
+    segment_model = video.get_label_segment_model()
+    label_objects = {}
+
+    def write_segment(label, start, stop):
+        if label not in label_objects:
+            label_objects[label] = Label.objects.get(name=label)
+        segment_model.objects.create(
+            video=video,
+            prediction_meta=video_prediction_meta,
+            label=label_objects[label],
+            start_frame_number=start,
+            end_frame_number=stop,
+        )
+        ic(f"Segment {label}: {start}-{stop}")
+
+    return write_segment
+
+
+def repostprocess_video(
+    video,
+    model_meta_name: str,
+    model_meta_version=None,
+    smooth_window_size_s: float = 1,
+    binarize_threshold: float = 0.5,
+    filters=None,
+):
+    """
+    Recomputes smoothing, binarization, sequences and label video segments of a video
+    from the prediction matrix stored by predict_video, without running the model.
+
+    Args:
+        video: RawVideoFile or Video object.
+        model_meta_name (str): Name of the ModelMeta of the stored prediction.
+        model_meta_version (int, optional): Version of the ModelMeta. Defaults to the latest.
+        smooth_window_size_s (float): Size of the smoothing window in seconds.
+        binarize_threshold (float): Threshold for binarization.
+        filters (str, optional): Per label filter spec, see predict_video.
+
+    Returns:
+        dict: label -> list of inclusive (start, stop) frame ranges.
+    """
+    from endoreg_db.models import ModelMeta  # pylint: disable=import-outside-toplevel
+
+    model_meta = ModelMeta.get_by_name(model_meta_name, model_meta_version)
+    labels = model_meta.get_inference_dataset_config()["labels"]
+    filters = parse_filter_spec(filters, labels) if filters else None
+    video_prediction_meta = video.get_prediction_meta_model().objects.get(
+        video=video, model_meta=model_meta
+    )
+    predictions = video_prediction_meta.get_prediction_array()
+    assert predictions is not None, (
+        f"No stored predictions of {model_meta} for {video.uuid}, run predict_video first"
+    )
+    assert predictions.shape[1] == len(labels), (
+        f"Stored predictions have {predictions.shape[1]} columns, "
+        f"{model_meta} has {len(labels)} labels"
+    )
+
+    sequences = postprocess_video(
+        video,
+        video_prediction_meta,
+        predictions,
+        labels,
+        smooth_window_size_s=smooth_window_size_s,
+        binarize_threshold=binarize_threshold,
+        filters=filters,
+    )
+
+    # the video stores the fingerprint of its latest prediction, maybe of another ModelMeta
+    payload = (video.predictions or {}).get(FINGERPRINT_PAYLOAD_KEY)
+    if payload and payload["model_meta"] == [model_meta.name, int(model_meta.version)]:
+        payload = with_postprocessing_options(
+            payload,
+            smooth_window_size_s=smooth_window_size_s,
+            binarize_threshold=binarize_threshold,
+            filters=filters,
+        )
+        video.predictions[FINGERPRINT_PAYLOAD_KEY] = payload
+        video.predictions[FINGERPRINT_KEY] = hash_fingerprint_payload(payload)
+
+    video.save()
+    return sequences
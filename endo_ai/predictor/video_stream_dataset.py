@@ -0,0 +1,131 @@
+"""
+Iterable dataset which decodes frames straight from the video container.
+
+Frames are decoded by an ffmpeg subprocess into raw RGB24 and read from its stdout,
+so prediction does not need extracted JPEG frames on disk
+(no JPEG encode / decode round trip per frame).
+"""
+
+import json
+import shutil
+import subprocess
+from pathlib import Path
+
+import numpy as np
+from torch.utils.data import IterableDataset, get_worker_info
+
+from .inference_dataset import FramePreprocessor
+
+
+def probe_video(video_path):
+    """
+    Returns width, height and (if available) the number of frames
+    of the first video stream using ffprobe.
+    """
+    command = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-select_streams",
+        "v:0",
+        "-show_entries",
+        "stream=width,height,nb_frames",
+        "-of",
+        "json",
+        str(video_path),
+    ]
+    result = subprocess.run(command, capture_output=True, text=True, check=True)
+    stream = json.loads(result.stdout)["streams"][0]
+
+    nb_frames = stream.get("nb_frames")
+    n_frames = int(nb_frames) if nb_frames and nb_frames.isdigit() else None
+
+    return int(stream["width"]), int(stream["height"]), n_frames
+
+
+class VideoStreamDataset(IterableDataset):
+    """
+    Yields preprocessed frames of a video in decoding order.
+
+    Args:
+        video_path (str | Path): Path to the video file.
+        crop (list): Crop region (ymin, ymax, xmin, xmax) applied to every frame.
+        config (dict): Inference config (see predict.sample_config).
+        max_frames (int, optional): Only decode the first max_frames frames.
+
+    The ffmpeg process decodes in parallel to the model, so the dataset is meant
+    to be used with num_workers=0.
+    """
+
+    def __init__(self, video_path, crop, config, max_frames=None):
+        self.video_path = Path(video_path)
+        self.crop = crop
+        self.config = config
+        self.max_frames = max_frames
+        self.preprocessor = FramePreprocessor(config)
+
+        self.width, self.height, self.n_frames = probe_video(self.video_path)
+        if max_frames is not None and self.n_frames is not None:
+            self.n_frames = min(self.n_frames, max_frames)
+
+    def get_ffmpeg_command(self):
+        command = [
+            "ffmpeg",
+            "-v",
+            "error",
+            "-nostdin",
+            "-i",
+            self.video_path.resolve().as_posix(),
+            "-map",
+            "0:v:0",
+            # one output frame per decoded frame, same numbering as extract_frames
+            "-fps_mode",
+            "passthrough",
+        ]
+        if self.max_frames is not None:
+            command += ["-frames:v", str(self.max_frames)]
+        command += ["-f", "rawvideo", "-pix_fmt", "rgb24", "pipe:1"]
+        return command
+
+    def iter_frames(self):
+        """Yields decoded RGB frames as numpy arrays (HWC, uint8)"""
+        if not shutil.which("ffmpeg"):
+            raise EnvironmentError(
+                "FFmpeg could not be found. Ensure it is installed and in your PATH."
+            )
+
+        frame_size = self.width * self.height * 3
+        process = subprocess.Popen(
+            self.get_ffmpeg_command(),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=frame_size,
+        )
+        try:
+            while True:
+                buffer = process.stdout.read(frame_size)
+                if len(buffer) < frame_size:
+                    break
+                yield np.frombuffer(buffer, dtype=np.uint8).reshape(
+                    self.height, self.width, 3
+                )
+        finally:
+            process.stdout.close()
+            if process.poll() is None:
+                process.kill()
+            _stdout, stderr = process.communicate()
+
+        if process.returncode not in (0, None, -9):
+            raise Exception(f"Error decoding video: {stderr.decode(errors='replace')}")
+
+    def __iter__(self):
+        if get_worker_info() is not None and get_worker_info().num_workers > 1:
+            raise RuntimeError("VideoStreamDataset must be used with num_workers <= 1")
+
+        for frame in self.iter_frames():
+            yield self.preprocessor(frame, self.crop)
+
+    def __len__(self):
+        if self.n_frames is None:
+            raise TypeError("Number of frames unknown for this container")
+        return self.n_frames
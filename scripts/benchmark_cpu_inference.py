@@ -0,0 +1,104 @@
+"""
+Benchmark CPU inference throughput (frames/sec) of the classification model (RegNetX800MF).
+
+Runs the model on synthetic 716x716 batches for a grid of batch sizes and thread counts,
+using the same device setup as Classifier.pipe (channels_last, inference_mode).
+Use the results to size GPU-less worker nodes.
+
+Usage:
+    python scripts/benchmark_cpu_inference.py
+    python scripts/benchmark_cpu_inference.py --checkpoint ./data/models/colo_segmentation_RegNetX800MF_6.ckpt
+    python scripts/benchmark_cpu_inference.py --batchsizes 1,8,16,32 --threads 4,8,16
+"""
+
+import argparse
+import platform
+import time
+
+import torch
+from torch import nn
+from torchvision import models
+
+from endo_ai.predictor.predict import sample_config
+from endo_ai.predictor.utils import configure_cpu_threads, prepare_model
+
+
+def build_model(checkpoint=None, n_labels=len(sample_config["labels"])):
+    """
+    Loads the model from a checkpoint (InferenceNet). Without a checkpoint
+    the bare RegNetX800MF architecture with random weights is used,
+    which has the same compute cost and needs no download.
+    """
+    if checkpoint:
+        from endo_ai.predictor.inference_model import InferenceNet
+
+        return InferenceNet.load_from_checkpoint(
+            checkpoint_path=checkpoint,
+            map_location="cpu",
+        )
+
+    model = models.regnet_x_800mf(weights=None)
+    model.fc = nn.Linear(model.fc.in_features, n_labels)
+    return model
+
+
+def benchmark(model, batchsize, size_x, size_y, n_batches, n_warmup, channels_last=True):
+    """Returns the throughput in frames/sec for one batch size"""
+    memory_format = torch.channels_last if channels_last else torch.contiguous_format
+    batch = torch.randn(batchsize, 3, size_y, size_x).to(memory_format=memory_format)
+
+    with torch.inference_mode():
+        for _ in range(n_warmup):
+            model(batch)
+
+        start = time.perf_counter()
+        for _ in range(n_batches):
+            model(batch)
+        elapsed = time.perf_counter() - start
+
+    return batchsize * n_batches / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CPU inference throughput")
+    parser.add_argument("--checkpoint", type=str, default=None, help="Path to a model checkpoint")
+    parser.add_argument("--batchsizes", type=str, default="1,8,16", help="Comma separated batch sizes")
+    parser.add_argument("--threads", type=str, default=None, help="Comma separated intra-op thread counts")
+    parser.add_argument("--size_x", type=int, default=sample_config["size_x"])
+    parser.add_argument("--size_y", type=int, default=sample_config["size_y"])
+    parser.add_argument("--n_batches", type=int, default=5, help="Timed batches per setting")
+    parser.add_argument("--n_warmup", type=int, default=1, help="Warmup batches per setting")
+    parser.add_argument("--no_channels_last", action="store_true", help="Benchmark contiguous format")
+    args = parser.parse_args()
+
+    batchsizes = [int(b) for b in args.batchsizes.split(",")]
+    threads = [int(t) for t in args.threads.split(",")] if args.threads else [torch.get_num_threads()]
+    channels_last = not args.no_channels_last
+
+    model = build_model(args.checkpoint)
+    model = prepare_model(model, "cpu")
+    if not channels_last:
+        model = model.to(memory_format=torch.contiguous_format)
+
+    print(f"Host: {platform.node()} ({platform.processor() or platform.machine()})")
+    print(f"Torch: {torch.__version__}, channels_last: {channels_last}")
+    print(f"Input: {args.size_x}x{args.size_y}")
+    print(f"{'threads':>8} {'batchsize':>10} {'frames/s':>10} {'h per 150k frames':>18}")
+
+    for n_threads in threads:
+        configure_cpu_threads(intra_op_threads=n_threads)
+        for batchsize in batchsizes:
+            fps = benchmark(
+                model,
+                batchsize,
+                args.size_x,
+                args.size_y,
+                n_batches=args.n_batches,
+                n_warmup=args.n_warmup,
+                channels_last=channels_last,
+            )
+            print(f"{n_threads:>8} {batchsize:>10} {fps:>10.2f} {150_000 / fps / 3600:>18.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark the per-frame latency of the reference Cropper (crop, pad, resize with PIL copies)
+against the fused fast path (crop_resize_img), and of the full InferenceDataset item.
+
+Usage:
+    python scripts/benchmark_cropper.py
+    python scripts/benchmark_cropper.py --n_frames 100 --crop 0,1080,550,1900
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from endo_ai.predictor.inference_dataset import InferenceDataset
+from endo_ai.predictor.predict import sample_config
+from endo_ai.predictor.preprocess import Cropper
+
+
+def time_per_call(func, n):
+    """Returns the mean latency of func() in milliseconds"""
+    func()  # warmup
+    start = time.perf_counter()
+    for _ in range(n):
+        func()
+    return (time.perf_counter() - start) / n * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Cropper latency per frame")
+    parser.add_argument("--n_frames", type=int, default=50, help="Timed frames per variant")
+    parser.add_argument("--width", type=int, default=1920, help="Frame width")
+    parser.add_argument("--height", type=int, default=1080, help="Frame height")
+    parser.add_argument("--crop", type=str, default="0,1080,550,1900", help="ymin,ymax,xmin,xmax")
+    args = parser.parse_args()
+
+    crop = [int(c) for c in args.crop.split(",")]
+    scale = [sample_config["size_x"], sample_config["size_y"]]
+
+    rng = np.random.default_rng(0)
+    frame = (rng.random((args.height, args.width, 3)) * 255).astype("uint8")
+
+    reference = Cropper()
+    fast = Cropper(fast=True)
+
+    print(f"Frame: {args.width}x{args.height}, crop: {crop}, output: {scale[0]}x{scale[1]}")
+    print(f"{'variant':<28} {'ms/frame':>10}")
+
+    results = {
+        "Cropper (reference)": time_per_call(lambda: reference(frame, crop, scale=scale), args.n_frames),
+        "Cropper (fast)": time_per_call(lambda: fast(frame, crop, scale=scale), args.n_frames),
+    }
+
+    # complete dataset item: JPEG decode, crop / resize, ToTensor, Normalize
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = (Path(tmp_dir) / "frame_0000001.jpg").as_posix()
+        Image.fromarray(frame).save(path, quality=95)
+
+        for fast_crop in [False, True]:
+            config = dict(sample_config, fast_crop=fast_crop)
+            ds = InferenceDataset([path], [crop], config)
+            name = f"InferenceDataset ({'fast' if fast_crop else 'reference'})"
+            results[name] = time_per_call(lambda: ds[0], args.n_frames)
+
+    for name, latency in results.items():
+        print(f"{name:<28} {latency:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
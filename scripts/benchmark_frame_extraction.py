@@ -0,0 +1,117 @@
+"""
+Benchmark segment-parallel frame extraction (endo_ai.predictor.frame_extraction) on a
+synthetic long video against the single ffmpeg process of endoreg_db's extract_frames.
+Every run must produce the same frames: the frame count and the checksums of a sample of
+frames are compared with the single process reference.
+
+The synthetic video (ffmpeg testsrc2, H.264 with a keyframe every --gop frames) is
+generated once and cached in the temp directory.
+
+Usage:
+    python scripts/benchmark_frame_extraction.py                       # 10 min, 50 fps, 720p
+    python scripts/benchmark_frame_extraction.py --minutes 60 --workers 1,2,4,8,16
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+from endo_ai.predictor.frame_extraction import extract_frames_parallel
+
+
+def make_video(path, minutes, fps, size, gop):
+    if path.exists():
+        return path
+    command = [
+        "ffmpeg",
+        "-v",
+        "error",
+        "-y",
+        "-f",
+        "lavfi",
+        "-i",
+        f"testsrc2=size={size}:rate={fps}",
+        "-t",
+        str(minutes * 60),
+        "-c:v",
+        "libx264",
+        "-preset",
+        "veryfast",
+        "-g",
+        str(gop),
+        "-pix_fmt",
+        "yuv420p",
+        str(path),
+    ]
+    subprocess.run(command, check=True)
+    return path
+
+
+def extract_single_process(video_path, frame_dir):
+    """The extract_frames command of endoreg_db"""
+    command = [
+        "ffmpeg",
+        "-v",
+        "error",
+        "-i",
+        str(video_path),
+        "-q:v",
+        "2",
+        os.path.join(frame_dir, "frame_%07d.jpg"),
+    ]
+    subprocess.run(command, check=True)
+    return sorted(Path(frame_dir).glob("*.jpg"))
+
+
+def checksums(paths, n_samples=50):
+    step = max(1, len(paths) // n_samples)
+    return [hashlib.md5(p.read_bytes()).hexdigest() for p in paths[::step]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark segment-parallel frame extraction")
+    parser.add_argument("--minutes", type=float, default=10, help="Length of the video")
+    parser.add_argument("--fps", type=int, default=50, help="Frames per second")
+    parser.add_argument("--size", type=str, default="1280x720", help="Frame size")
+    parser.add_argument("--gop", type=int, default=100, help="Frames between keyframes")
+    parser.add_argument("--workers", type=str, default="1,2,4,8", help="Comma separated")
+    args = parser.parse_args()
+
+    tmp_dir = Path(tempfile.gettempdir())
+    video_path = tmp_dir / f"synthetic_{args.minutes}min_{args.fps}fps_{args.size}_g{args.gop}.mp4"
+    make_video(video_path, args.minutes, args.fps, args.size, args.gop)
+    print(f"{video_path}, CPU cores: {os.cpu_count()}")
+
+    with tempfile.TemporaryDirectory() as frame_dir:
+        start = time.perf_counter()
+        reference = extract_single_process(video_path, frame_dir)
+        baseline = time.perf_counter() - start
+        reference_checksums = checksums(reference)
+    print(f"{'engine':<22} {'frames':>8} {'seconds':>9} {'frames/s':>9} {'speedup':>8} {'same':>5}")
+    print(
+        f"{'single process':<22} {len(reference):>8} {baseline:>9.1f} "
+        f"{len(reference) / baseline:>9.1f} {1:>8.2f} {'-':>5}"
+    )
+
+    for n_workers in [int(w) for w in args.workers.split(",")]:
+        frame_dir = Path(tempfile.mkdtemp())
+        try:
+            start = time.perf_counter()
+            paths = extract_frames_parallel(video_path, frame_dir, n_workers=n_workers)
+            elapsed = time.perf_counter() - start
+            same = len(paths) == len(reference) and checksums(paths) == reference_checksums
+        finally:
+            shutil.rmtree(frame_dir)
+        print(
+            f"{f'{n_workers} ranges':<22} {len(paths):>8} {elapsed:>9.1f} "
+            f"{len(paths) / elapsed:>9.1f} {baseline / elapsed:>8.2f} {str(same):>5}"
+        )
+
+
+if __name__ == "__main__":
+    main()
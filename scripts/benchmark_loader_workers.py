@@ -0,0 +1,69 @@
+"""
+Benchmark frame loading throughput (JPEG decode, crop, resize, normalization) over the
+number of persistent loader workers (endo_ai.predictor.data_loading.FrameLoader).
+Scaling should be close to linear up to the number of physical cores.
+
+Usage:
+    python scripts/benchmark_loader_workers.py
+    python scripts/benchmark_loader_workers.py --workers 1,2,4,8 --n_frames 512
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from endo_ai.predictor.data_loading import close_frame_loaders, get_frame_loader
+from endo_ai.predictor.predict import sample_config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark loader worker scaling")
+    parser.add_argument("--workers", type=str, default="1,2,4", help="Comma separated worker counts")
+    parser.add_argument("--n_frames", type=int, default=256, help="Frames per run")
+    parser.add_argument("--batchsize", type=int, default=16, help="Batch size")
+    parser.add_argument("--preprocessing", type=str, default="item", choices=["item", "batch"])
+    parser.add_argument("--crop", type=str, default="0,1080,550,1900", help="ymin,ymax,xmin,xmax")
+    args = parser.parse_args()
+
+    crop = [int(c) for c in args.crop.split(",")]
+    rng = np.random.default_rng(0)
+
+    print(f"CPU cores: {os.cpu_count()}, {args.n_frames} frames, preprocessing: {args.preprocessing}")
+    print(f"{'workers':>8} {'frames/s':>10} {'speedup':>8}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = (Path(tmp_dir) / "frame_0000001.jpg").as_posix()
+        Image.fromarray((rng.random((1080, 1920, 3)) * 255).astype("uint8")).save(path)
+        paths = [path] * args.n_frames
+        crops = [crop] * args.n_frames
+
+        baseline = None
+        for num_workers in [int(w) for w in args.workers.split(",")]:
+            config = dict(
+                sample_config,
+                num_workers=num_workers,
+                batchsize=args.batchsize,
+                preprocessing=args.preprocessing,
+            )
+            loader = get_frame_loader(config)
+            # first pass starts the workers, the timed pass reuses them like a second video
+            for _batch in loader.iter_batches(paths[: args.batchsize], crops[: args.batchsize]):
+                pass
+
+            start = time.perf_counter()
+            for _batch in loader.iter_batches(paths, crops):
+                pass
+            fps = args.n_frames / (time.perf_counter() - start)
+            baseline = baseline or fps
+            print(f"{num_workers:>8} {fps:>10.1f} {fps / baseline:>8.2f}")
+
+            close_frame_loaders()
+
+
+if __name__ == "__main__":
+    main()
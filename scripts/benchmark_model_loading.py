@@ -0,0 +1,123 @@
+"""
+Benchmark the cold start (imports + model construction + weights) of the Lightning
+MultiLabelClassificationNet.load_from_checkpoint against the inference-only InferenceNet
+(memory-mapped checkpoint, converted safetensors).
+
+Every variant runs in a fresh interpreter so imports and page cache effects are included
+as in a new worker. Without --checkpoint a synthetic RegNetX800MF checkpoint in the
+Lightning layout is written (the Lightning variant then needs pytorch_lightning and
+downloads the ImageNet weights on first use).
+
+Usage:
+    python scripts/benchmark_model_loading.py --checkpoint ./data/models/colo_segmentation_RegNetX800MF_6.ckpt
+    python scripts/benchmark_model_loading.py --repeats 5
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import torch
+
+from endo_ai.predictor.inference_model import InferenceNet, convert_to_safetensors
+from endo_ai.predictor.predict import sample_config
+
+LOAD_SNIPPETS = {
+    "lightning load_from_checkpoint": (
+        "from endo_ai.predictor.model_loader import MultiLabelClassificationNet\n"
+        "model = MultiLabelClassificationNet.load_from_checkpoint(checkpoint_path=PATH, map_location='cpu')\n"
+    ),
+    "InferenceNet (mmap)": (
+        "from endo_ai.predictor.inference_model import InferenceNet\n"
+        "model = InferenceNet.load_from_checkpoint(PATH)\n"
+    ),
+    "InferenceNet (no mmap)": (
+        "from endo_ai.predictor.inference_model import InferenceNet\n"
+        "model = InferenceNet.load_from_checkpoint(PATH, mmap=False)\n"
+    ),
+    "InferenceNet (safetensors)": (
+        "from endo_ai.predictor.inference_model import InferenceNet\n"
+        "model = InferenceNet.load_from_checkpoint(SAFETENSORS_PATH)\n"
+    ),
+}
+
+TIMING_TEMPLATE = """
+import json, time
+start = time.perf_counter()
+PATH = {path!r}
+SAFETENSORS_PATH = {safetensors_path!r}
+{snippet}
+print(json.dumps({{"seconds": time.perf_counter() - start}}))
+"""
+
+
+def write_synthetic_checkpoint(path):
+    """RegNetX800MF checkpoint with the state_dict layout of MultiLabelClassificationNet"""
+    labels = sample_config["labels"]
+    model = InferenceNet(labels=labels, model_type="RegNetX800MF")
+    state_dict = dict(model.state_dict())
+    state_dict["criterion.pos_weight"] = torch.tensor([2.0] * len(labels))
+    torch.save(
+        {
+            "state_dict": state_dict,
+            "hyper_parameters": {"labels": labels, "model_type": "RegNetX800MF"},
+        },
+        path,
+    )
+
+
+def time_cold_start(snippet, checkpoint, safetensors_path):
+    code = TIMING_TEMPLATE.format(
+        path=str(checkpoint), safetensors_path=str(safetensors_path), snippet=snippet
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=False
+    )
+    if result.returncode != 0:
+        return None, result.stderr.strip().splitlines()[-1]
+    return json.loads(result.stdout.strip().splitlines()[-1])["seconds"], None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cold start model loading")
+    parser.add_argument("--checkpoint", type=str, default=None, help="Checkpoint (.ckpt)")
+    parser.add_argument("--repeats", type=int, default=3, help="Cold starts per variant")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        checkpoint = Path(args.checkpoint) if args.checkpoint else Path(tmp_dir) / "synthetic.ckpt"
+        if not args.checkpoint:
+            write_synthetic_checkpoint(checkpoint)
+
+        safetensors_path = Path(tmp_dir) / "converted.safetensors"
+        try:
+            convert_to_safetensors(checkpoint, safetensors_path)
+        except ImportError:
+            safetensors_path = None
+
+        print(f"Checkpoint: {checkpoint} ({checkpoint.stat().st_size / 1024**2:.1f} MiB)")
+        print(f"{'variant':<32} {'best s':>8} {'mean s':>8}")
+        for name, snippet in LOAD_SNIPPETS.items():
+            if "SAFETENSORS_PATH" in snippet and safetensors_path is None:
+                print(f"{name:<32} skipped (safetensors not installed)")
+                continue
+
+            seconds = []
+            error = None
+            for _ in range(args.repeats):
+                elapsed, error = time_cold_start(snippet, checkpoint, safetensors_path)
+                if elapsed is None:
+                    break
+                seconds.append(elapsed)
+
+            if error:
+                print(f"{name:<32} failed: {error}")
+            else:
+                print(f"{name:<32} {min(seconds):>8.2f} {sum(seconds) / len(seconds):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark the post processing of a (frames x labels) prediction matrix: the former per
+label loop (np.convolve, list comprehension thresholding, find_true_pred_sequences) against
+the vectorized postprocess.post_process_matrix. Checks that the sequences are identical.
+
+Usage:
+    python scripts/benchmark_postprocess.py                   # 1M frames, 14 labels
+    python scripts/benchmark_postprocess.py --n_frames 200000 --repeats 5
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from endo_ai.predictor.postprocess import (
+    find_true_pred_sequences,
+    make_smooth_preds,
+    post_process_matrix,
+)
+from endo_ai.predictor.predict import sample_config
+
+
+def per_label_post_process(predictions, window_size_s, fps, min_seq_len_s, threshold):
+    """The per label loop of the former Classifier.post_process_predictions"""
+    raw_sequences, filtered_sequences = [], []
+    min_seq_len = int(min_seq_len_s * fps)
+    for i in range(predictions.shape[1]):
+        smooth = make_smooth_preds(predictions[:, i], window_size_s=window_size_s, fps=fps)
+        binary = np.array([p > threshold for p in smooth])
+        raw = find_true_pred_sequences(binary)
+        raw_sequences.append(raw)
+        filtered_sequences.append([s for s in raw if s[1] - s[0] > min_seq_len])
+    return raw_sequences, filtered_sequences
+
+
+def synthetic_predictions(n_frames, n_labels, seed=0):
+    """Noisy piecewise constant predictions, segments of 1 - 30 s at 50 fps"""
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(50, 1500, size=n_frames // 50 + 1)
+    segment_ids = np.repeat(np.arange(len(lengths)), lengths)[:n_frames]
+    levels = rng.uniform(size=(len(lengths), n_labels))[segment_ids]
+    noisy = levels + rng.normal(scale=0.15, size=levels.shape)
+    return np.clip(noisy, 0, 1).astype(np.float32)
+
+
+def best_of(repeats, fn):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per label vs vectorized post processing")
+    parser.add_argument("--n_frames", type=int, default=1_000_000, help="Number of frames")
+    parser.add_argument("--fps", type=int, default=50, help="Frames per second")
+    parser.add_argument("--window_size_s", type=float, default=1, help="Smoothing window")
+    parser.add_argument("--min_seq_len_s", type=float, default=0.5, help="Minimum sequence length")
+    parser.add_argument("--repeats", type=int, default=3, help="Repetitions, the best is reported")
+    args = parser.parse_args()
+
+    n_labels = len(sample_config["labels"])
+    predictions = synthetic_predictions(args.n_frames, n_labels)
+    kwargs = dict(window_size_s=args.window_size_s, fps=args.fps, min_seq_len_s=args.min_seq_len_s)
+
+    loop_s, (ref_raw, ref_filtered) = best_of(
+        args.repeats, lambda: per_label_post_process(predictions, threshold=0.5, **kwargs)
+    )
+    vectorized_s, (_, _, raw, filtered) = best_of(
+        args.repeats, lambda: post_process_matrix(predictions, thresholds=0.5, **kwargs)
+    )
+
+    assert raw == ref_raw, "Raw sequences differ"
+    assert filtered == ref_filtered, "Filtered sequences differ"
+
+    print(f"{args.n_frames} frames x {n_labels} labels, {sum(map(len, filtered))} sequences")
+    print(f"{'per label loop':<16} {loop_s:>8.3f} s")
+    print(f"{'vectorized':<16} {vectorized_s:>8.3f} s  ({loop_s / vectorized_s:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
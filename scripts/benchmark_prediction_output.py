@@ -0,0 +1,100 @@
+"""
+Benchmark the list output of Classifier.pipe (list of lists, readable dicts per frame,
+concat_pred_dicts) against the preallocated float32 array output on a synthetic video.
+
+The model is replaced by a trivial linear layer on 1x1 inputs, so only the cost of
+collecting the predictions and post processing them is measured.
+Every mode runs in a fresh process; peak RSS and peak traced Python allocations are reported.
+
+Usage:
+    python scripts/benchmark_prediction_output.py                 # 2 hours at 50 fps
+    python scripts/benchmark_prediction_output.py --hours 0.5 --fps 25
+"""
+
+import argparse
+import multiprocessing
+import resource
+import time
+import tracemalloc
+
+import torch
+from torch import nn
+
+from endo_ai.predictor.predict import Classifier, sample_config
+
+
+def synthetic_batches(n_frames, batchsize):
+    """Batches of 1x1 pixel frames, the model cost is negligible"""
+    for start in range(0, n_frames, batchsize):
+        yield torch.rand(min(batchsize, n_frames - start), 3, 1, 1)
+
+
+def run_mode(output, n_frames, fps, batchsize, queue):
+    torch.manual_seed(0)
+    config = dict(sample_config, batchsize=batchsize)
+    model = nn.Sequential(nn.Flatten(), nn.Linear(3, len(config["labels"])))
+    classifier = Classifier(model, config=config, device="cpu")
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    predictions = classifier.predict_batches(
+        synthetic_batches(n_frames, batchsize), n_frames=n_frames, output=output
+    )
+    predict_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if output == "list":
+        predictions = [classifier.readable(p) for p in predictions]
+    *_, filtered_sequences = classifier.post_process_predictions(
+        predictions, window_size_s=1, fps=fps, min_seq_len_s=0.5
+    )
+    postprocess_s = time.perf_counter() - start
+    _current, peak_traced = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    queue.put(
+        {
+            "output": output,
+            "predict_s": predict_s,
+            "postprocess_s": postprocess_s,
+            "peak_traced_mb": peak_traced / 1024**2,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "n_sequences": sum(len(s) for s in filtered_sequences.values()),
+        }
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark list vs array prediction output")
+    parser.add_argument("--hours", type=float, default=2, help="Video length in hours")
+    parser.add_argument("--fps", type=int, default=50, help="Frames per second")
+    parser.add_argument("--batchsize", type=int, default=16, help="Batch size")
+    args = parser.parse_args()
+
+    n_frames = int(args.hours * 3600 * args.fps)
+    context = multiprocessing.get_context("spawn")
+
+    results = []
+    for output in ["list", "array"]:
+        queue = context.Queue()
+        process = context.Process(
+            target=run_mode, args=(output, n_frames, args.fps, args.batchsize, queue)
+        )
+        process.start()
+        results.append(queue.get())
+        process.join()
+
+    print(f"{n_frames} frames x {len(sample_config['labels'])} labels")
+    print(
+        f"{'output':<8} {'predict s':>10} {'postproc s':>11} "
+        f"{'traced MiB':>11} {'peak RSS MiB':>13} {'sequences':>10}"
+    )
+    for r in results:
+        print(
+            f"{r['output']:<8} {r['predict_s']:>10.2f} {r['postprocess_s']:>11.2f} "
+            f"{r['peak_traced_mb']:>11.0f} {r['peak_rss_mb']:>13.0f} {r['n_sequences']:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
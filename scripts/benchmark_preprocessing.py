@@ -0,0 +1,108 @@
+"""
+Benchmark the per-item preprocessing path (float32 frames normalized in the dataset)
+against batch preprocessing (uint8 frames, normalized once per batch in Classifier.pipe).
+
+Every mode runs in a fresh process so the reported peak RSS belongs to that mode only.
+
+Usage:
+    python scripts/benchmark_preprocessing.py
+    python scripts/benchmark_preprocessing.py --n_frames 512 --batchsize 64 --num_workers 2
+"""
+
+import argparse
+import multiprocessing
+import resource
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+from PIL import Image
+from torch import nn
+
+from endo_ai.predictor.inference_dataset import InferenceDataset
+from endo_ai.predictor.predict import Classifier, sample_config
+
+
+def write_frames(frame_dir, n_unique, width, height):
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(n_unique):
+        frame = (rng.random((height, width, 3)) * 255).astype("uint8")
+        path = (Path(frame_dir) / f"frame_{i + 1:07d}.jpg").as_posix()
+        Image.fromarray(frame).save(path, quality=95)
+        paths.append(path)
+    return paths
+
+
+def run_mode(mode, paths, crop, args, queue):
+    """Runs the data path of Classifier.pipe with a trivial model and reports the results"""
+    torch.manual_seed(0)
+    config = dict(
+        sample_config,
+        preprocessing=mode,
+        batchsize=args.batchsize,
+        num_workers=args.num_workers,
+    )
+    # a cheap model keeps the timing focused on loading, collating and normalization
+    model = nn.Sequential(nn.AdaptiveAvgPool2d(1), nn.Flatten(), nn.Linear(3, len(config["labels"])))
+    classifier = Classifier(model, config=config, device="cpu")
+    ds = InferenceDataset(paths, [crop] * len(paths), config)
+
+    item = ds[0]
+    start = time.perf_counter()
+    classifier.predict_dataset(ds, num_workers=args.num_workers)
+    elapsed = time.perf_counter() - start
+
+    queue.put(
+        {
+            "mode": mode,
+            "fps": len(paths) / elapsed,
+            "item_bytes": item.numel() * item.element_size(),
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "peak_rss_children_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+        }
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark item vs batch preprocessing")
+    parser.add_argument("--n_frames", type=int, default=256, help="Frames per run")
+    parser.add_argument("--n_unique", type=int, default=16, help="Distinct JPEG files on disk")
+    parser.add_argument("--batchsize", type=int, default=32, help="Batch size")
+    parser.add_argument("--num_workers", type=int, default=0, help="DataLoader workers")
+    parser.add_argument("--width", type=int, default=1920, help="Frame width")
+    parser.add_argument("--height", type=int, default=1080, help="Frame height")
+    parser.add_argument("--crop", type=str, default="0,1080,550,1900", help="ymin,ymax,xmin,xmax")
+    args = parser.parse_args()
+
+    crop = [int(c) for c in args.crop.split(",")]
+    context = multiprocessing.get_context("spawn")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        unique_paths = write_frames(tmp_dir, args.n_unique, args.width, args.height)
+        paths = [unique_paths[i % len(unique_paths)] for i in range(args.n_frames)]
+
+        results = []
+        for mode in ["item", "batch"]:
+            queue = context.Queue()
+            process = context.Process(target=run_mode, args=(mode, paths, crop, args, queue))
+            process.start()
+            results.append(queue.get())
+            process.join()
+
+    print(
+        f"{args.n_frames} frames {args.width}x{args.height}, "
+        f"batchsize {args.batchsize}, num_workers {args.num_workers}"
+    )
+    print(f"{'mode':<8} {'frames/s':>10} {'KiB/frame':>10} {'peak RSS MiB':>13} {'workers MiB':>12}")
+    for r in results:
+        print(
+            f"{r['mode']:<8} {r['fps']:>10.1f} {r['item_bytes'] / 1024:>10.0f} "
+            f"{r['peak_rss_mb']:>13.0f} {r['peak_rss_children_mb']:>12.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
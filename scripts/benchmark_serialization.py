@@ -0,0 +1,68 @@
+"""
+Benchmark the JSON payload of Classifier.post_process_predictions_serializable:
+per frame lists against run-length encoded binary predictions without frame values.
+
+Usage:
+    python scripts/benchmark_serialization.py                  # 50 min at 50 fps
+    python scripts/benchmark_serialization.py --n_frames 500000
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from endo_ai.predictor.postprocess import rle_decode
+from endo_ai.predictor.predict import Classifier, sample_config
+
+
+def synthetic_predictions(n_frames, n_labels, seed=0):
+    """Noisy piecewise constant predictions, segments of 1 - 30 s at 50 fps"""
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(50, 1500, size=n_frames // 50 + 1)
+    segment_ids = np.repeat(np.arange(len(lengths)), lengths)[:n_frames]
+    levels = rng.uniform(size=(len(lengths), n_labels))[segment_ids]
+    noisy = levels + rng.normal(scale=0.15, size=levels.shape)
+    return np.clip(noisy, 0, 1).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark serialized post processing payloads")
+    parser.add_argument("--n_frames", type=int, default=150_000, help="Number of frames")
+    args = parser.parse_args()
+
+    classifier = Classifier(config=sample_config, device="cpu")
+    predictions = synthetic_predictions(args.n_frames, len(sample_config["labels"]))
+
+    variants = {
+        "lists (default)": {},
+        "rle binary": {"binary_format": "rle"},
+        "rle, no frame values": {"binary_format": "rle", "include_frame_values": False},
+    }
+    results = {}
+    print(f"{args.n_frames} frames x {len(sample_config['labels'])} labels")
+    print(f"{'variant':<22} {'build s':>8} {'dumps s':>8} {'MiB':>9} {'binary MiB':>11}")
+    for name, kwargs in variants.items():
+        start = time.perf_counter()
+        result = classifier.post_process_predictions_serializable(predictions, **kwargs)
+        build_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        payload = json.dumps(result)
+        dumps_s = time.perf_counter() - start
+
+        binary_mb = len(json.dumps(result["binary_predictions"])) / 1024**2
+        print(
+            f"{name:<22} {build_s:>8.2f} {dumps_s:>8.2f} "
+            f"{len(payload) / 1024**2:>9.2f} {binary_mb:>11.3f}"
+        )
+        results[name] = result
+
+    full = results["lists (default)"]["binary_predictions"]
+    for label, encoded in results["rle, no frame values"]["binary_predictions"].items():
+        assert rle_decode(encoded).tolist() == full[label], f"RLE mismatch for {label}"
+
+
+if __name__ == "__main__":
+    main()
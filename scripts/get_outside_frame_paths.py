@@ -1,24 +1,24 @@
 import os
 import django
-from pathlib import Path
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "endo_ai.settings_dev")
 django.setup()
 
-from endoreg_db.models import Label, RawVideoFile, Video
+from endoreg_db.models import RawVideoFile
 from icecream import ic
 
+from endo_ai.predictor.interval_index import IntervalIndex
+from endo_ai.predictor.video_prediction import get_sorted_frame_paths
+
 rvf = RawVideoFile.objects.first()
 assert rvf is not None
 
-outside_label = Label.objects.get(name="outside")
-assert outside_label is not None
-
-outside_segments = rvf.label_video_segments.filter(label=outside_label)
-
-frames = []
-for segment in outside_segments:
-    ic(segment)
-    frames.extend(segment.get_frames())
+# one segment query, then vectorized lookups instead of one frame query per segment
+index = IntervalIndex.from_segments(
+    rvf.label_video_segments.filter(label__name="outside").select_related("label")
+)
+paths, _indices = get_sorted_frame_paths(rvf)
+# segments count prediction rows from 0, the file numbers start at 1
+frame_paths = index.select_paths(paths, include=["outside"])
 
-ic(f"Found {len(frames)} frames in {len(outside_segments)} outside segments")
+ic(f"Found {len(frame_paths)} frames in {len(index.starts.get('outside', []))} outside intervals")
@@ -5,7 +5,7 @@ from icecream import ic
 from PIL import Image
 from torchvision import transforms
 
-from endo_ai.predictor.model_loader import MultiLabelClassificationNet
+from endo_ai.predictor.inference_model import InferenceNet
 
 from endo_ai.predictor.predict import Classifier, sample_config
 from endo_ai.predictor.inference_dataset import InferenceDataset
@@ -18,6 +18,7 @@ ic(ssl.get_default_verify_paths())
 FPS = 50
 SMOOTH_WINDOW_SIZE_S = 1
 MIN_SEQ_LEN_S = 0.5
+DEVICE = None  # "cpu", "cuda" or None to use cuda if available
 
 data_folder = Path("./data/test_frames")
 model_path = "./data/models/colo_segmentation_RegNetX800MF_6.ckpt"
@@ -62,12 +63,12 @@ sample_img = Image.fromarray(sample_img)
 sample_img.save(data_folder / "test_outputs/sample.jpg")
 
 
-model = MultiLabelClassificationNet.load_from_checkpoint(  # pylint: disable=no-value-for-parameter
+model = InferenceNet.load_from_checkpoint(
     checkpoint_path=model_path,
+    map_location="cpu",
 )
-_ = model.cuda()
-_ = model.eval()
-classifier = Classifier(model, verbose=True)
+# moves the model to DEVICE and sets eval mode
+classifier = Classifier(model, verbose=True, device=DEVICE)
 
 predictions = classifier.pipe(string_paths, crops)
 readable_predictions = [classifier.readable(p) for p in predictions]
@@ -7,14 +7,14 @@ from torchvision import transforms
 import numpy as np
 import ssl
 
-from endo_ai.predictor.model_loader import MultiLabelClassificationNet
+from endo_ai.predictor.inference_model import InferenceNet
 
 from endo_ai.predictor.predict import Classifier, sample_config
 from endo_ai.predictor.inference_dataset import InferenceDataset
+from endo_ai.predictor.prediction_io import PredictionFile
 from endo_ai.predictor.postprocess import (
-    concat_pred_dicts,
-    make_smooth_preds,
-    find_true_pred_sequences,
+    make_smooth_preds_2d,
+    find_true_pred_sequences_2d,
 )
 
 
@@ -32,13 +32,16 @@ VIDEO_UUID = "68a175cd-a66b-4f23-b255-d423052ed613"
 
 TEST_RUN = False
 N_TEST_FRAMES = 100
-PRED_OUTPUT_PATH = f"./data/predictions_{VIDEO_UUID}.json"
-READABLE_PRED_OUTPUT_PATH = f"./data/readable_predictions_{VIDEO_UUID}.json"
+# binary prediction file (prediction_io.py), see PredictionFile.export_json for JSON
+PRED_OUTPUT_PATH = f"./data/predictions_{VIDEO_UUID}.preds"
+PRED_DTYPE = "float16"  # "float32" for full precision
+EXPORT_JSON = False
 SEQUENCE_PRED_OUTPUT_PATH = f"./data/sequence_predictions_{VIDEO_UUID}.json"
 
 FPS = 50
 SMOOTH_WINDOW_SIZE_S = 1
 MIN_SEQ_LEN_S = 0.5
+DEVICE = None  # "cpu", "cuda" or None to use cuda if available
 BINARIZE_THRESHOLD = 0.5
 
 data_folder = Path(f"~/test-data/db_frame_dir/{VIDEO_UUID}/").expanduser()
@@ -59,7 +62,6 @@ start_message = f"""
     - Crop template: {crop_template}
     - Test run: {TEST_RUN}
     - Output path: {PRED_OUTPUT_PATH}
-    - Readable output path: {READABLE_PRED_OUTPUT_PATH}
     - Number of frames: {len(paths)}
     - FPS: {FPS}
     - Smooth window size: {SMOOTH_WINDOW_SIZE_S}
@@ -106,50 +108,33 @@ unorm = transforms.Normalize(
     std=[1 / s for s in sample_config["std"]],
 )
 
-model = MultiLabelClassificationNet.load_from_checkpoint(  # pylint: disable=no-value-for-parameter
+model = InferenceNet.load_from_checkpoint(
     checkpoint_path=MODEL_PATH,
+    map_location="cpu",
 )
-_ = model.cuda()
-_ = model.eval()
-classifier = Classifier(model, verbose=True)
+# moves the model to DEVICE and sets eval mode
+classifier = Classifier(model, verbose=True, device=DEVICE)
 
-predictions = classifier.pipe(string_paths, crops)
-readable_predictions = [classifier.readable(p) for p in predictions]
-
-with open(PRED_OUTPUT_PATH, "w", encoding="utf-8") as f:
-    json.dump(classifier.get_prediction_dict(predictions, string_paths), f, indent=2)
-
-with open(READABLE_PRED_OUTPUT_PATH, "w", encoding="utf-8") as f:
-    json.dump(
-        readable_predictions,
-        f,
-        indent=2,
-        default=lambda o: int(o) if isinstance(o, np.int64) else o,
-    )
+predictions = classifier.pipe(string_paths, crops, output="array")
 
+classifier.save_predictions(
+    predictions, string_paths, indices, target_path=PRED_OUTPUT_PATH, dtype=PRED_DTYPE
+)
 ic("Predictions saved to", PRED_OUTPUT_PATH)
-ic("Readable predictions saved to", READABLE_PRED_OUTPUT_PATH)
-
-merged_predictions = concat_pred_dicts(readable_predictions)
 
+if EXPORT_JSON:
+    json_path = Path(PRED_OUTPUT_PATH).with_suffix(".json")
+    PredictionFile(PRED_OUTPUT_PATH).export_json(json_path)
+    ic("JSON export saved to", json_path)
 
-smooth_merged_predictions = {}
-for key in merged_predictions.keys():
-    smooth_merged_predictions[key] = make_smooth_preds(
-        prediction_array=merged_predictions[key],
-        window_size_s=SMOOTH_WINDOW_SIZE_S,
-        fps=FPS,
-    )
-
-binary_smooth_merged_predictions = {}
-for key in smooth_merged_predictions.keys():
-    binary_smooth_merged_predictions[key] = (
-        smooth_merged_predictions[key] > BINARIZE_THRESHOLD
-    )
+smooth_predictions = make_smooth_preds_2d(
+    predictions, window_size_s=SMOOTH_WINDOW_SIZE_S, fps=FPS
+)
+binary_smooth_predictions = smooth_predictions > BINARIZE_THRESHOLD
 
-sequence_dict = {}
-for label, prediction_array in binary_smooth_merged_predictions.items():
-    sequence_dict[label] = find_true_pred_sequences(prediction_array)
+sequence_dict = dict(
+    zip(classifier.config["labels"], find_true_pred_sequences_2d(binary_smooth_predictions))
+)
 
 with open(SEQUENCE_PRED_OUTPUT_PATH, "w", encoding="utf-8") as f:
     json.dump(
@@ -0,0 +1,253 @@
+"""
+Runs the demo / processing pipeline as a dependency graph (endo_ai/pipeline.py), replacing
+the strictly sequential scripts/process_video.py and scripts/demo_pipe.sh.
+
+Stages are management commands with declared inputs and outputs. Independent branches run
+in parallel: the model meta, the report import and every video import after the base data;
+report and video anonymization after the pseudo examinations. Completed stages are
+checkpointed in the state file, a rerun resumes after the last failed stage. A timing
+report per stage is printed at the end, stage output is written to --log_dir.
+
+SQLite serializes writers: parallel stages wait for each other's transactions and fail
+with "database is locked" after the timeout. --max_parallel therefore defaults to 1 when
+the database of DJANGO_SETTINGS_MODULE is SQLite (or cannot be determined), else to 4.
+
+Compared to process_video.py: --model_name replaces its MODEL_NAME constant; the AiModel is
+created if missing (get_or_create) before its ModelMeta; export_anonym_videos runs after
+create_anonym_videos. Its --rm-db, --migrate, ... flags map to --rm_db and --stages.
+
+Usage:
+    python scripts/run_pipeline.py                                   # demo data, resumes
+    python scripts/run_pipeline.py --rm_db                           # fresh database
+    python scripts/run_pipeline.py --videos ~/test-data/video/a.mp4 ~/test-data/video/b.mp4 \
+        --reports ~/test-data/report/lux-gastro-report.pdf --predict_workers 2
+    python scripts/run_pipeline.py --stages predict                  # predict and its inputs
+    python scripts/run_pipeline.py --list                            # show the graph
+"""
+
+import argparse
+import importlib
+import os
+import sys
+from pathlib import Path
+
+import dotenv
+
+from endo_ai.pipeline import BLOCKED, FAILED, Pipeline, Stage, format_report
+
+dotenv.load_dotenv()
+
+DEFAULT_MODEL_PATH = "~/test-data/model/colo_segmentation_RegNetX800MF_6.ckpt"
+DEFAULT_REPORTS = ["~/test-data/report/lux-gastro-report.pdf"]
+DEFAULT_VIDEOS = ["~/test-data/video/lux-gastro-video.mp4"]
+DEFAULT_MODEL_NAME = "image_multilabel_classification_colonoscopy_default"
+SQLITE_MAX_PARALLEL = 1
+DEFAULT_MAX_PARALLEL = 4
+
+# AiModel.objects.get_or_create of process_video.py, the ModelMeta requires the AiModel
+ENSURE_AI_MODEL = """
+from endoreg_db.models import AiModel
+model, created = AiModel.objects.get_or_create(
+    name={model_name!r},
+    defaults={{
+        "description": "Default multilabel classification model for colonoscopy",
+        "model_type": "image_classification",
+        "model_subtype": "multilabel",
+    }},
+)
+print(f"AiModel {{model.name}} {{'created' if created else 'found'}}")
+"""
+
+
+def manage(*args):
+    return [sys.executable, "manage.py", *[str(a) for a in args]]
+
+
+def get_db_engine():
+    """Database engine of DJANGO_SETTINGS_MODULE without setting up Django, None if unknown"""
+    settings_module = os.environ.get("DJANGO_SETTINGS_MODULE", "").strip("\"'")
+    if not settings_module:
+        return None
+    try:
+        return importlib.import_module(settings_module).DATABASES["default"]["ENGINE"]
+    except Exception:  # pylint: disable=broad-except
+        return None
+
+
+def get_default_max_parallel(engine):
+    if engine is None or "sqlite" in engine:
+        return SQLITE_MAX_PARALLEL
+    return DEFAULT_MAX_PARALLEL
+
+
+def build_stages(args):
+    reports = [Path(p).expanduser() for p in args.reports]
+    videos = [Path(p).expanduser() for p in args.videos]
+    report_stages = [f"import_report_{i}" for i in range(len(reports))]
+    video_stages = [f"import_video_{i}" for i in range(len(videos))]
+
+    stages = [
+        Stage("migrate", manage("migrate"), outputs=["schema"]),
+        Stage("load_base_db_data", manage("load_base_db_data"), ["schema"], ["base_data"]),
+        Stage(
+            "ensure_ai_model",
+            manage("shell", "-c", ENSURE_AI_MODEL.format(model_name=args.model_name)),
+            ["base_data"],
+            ["ai_model"],
+        ),
+        Stage(
+            "create_model_meta",
+            manage(
+                "create_multilabel_model_meta",
+                "--model_path",
+                Path(args.model_path).expanduser(),
+                "--model_name",
+                args.model_name,
+            ),
+            ["ai_model"],
+            ["model_meta"],
+        ),
+    ]
+    stages += [
+        Stage(name, manage("import_report", path), ["base_data"], [name])
+        for name, path in zip(report_stages, reports)
+    ]
+    stages += [
+        Stage(name, manage("import_video", path), ["base_data"], [name])
+        for name, path in zip(video_stages, videos)
+    ]
+
+    predict_args = [
+        "predict_raw_video_files",
+        "--meta_name",
+        args.model_name,
+        "--workers",
+        args.predict_workers,
+    ]
+    if args.autotune:
+        predict_args.append("--autotune")
+    stages += [
+        Stage("predict", manage(*predict_args), ["model_meta", *video_stages], ["predictions"]),
+        # patients and examinations come from the SensitiveMeta of reports and videos
+        Stage(
+            "create_pseudo_patients",
+            manage("create_pseudo_patients"),
+            [*report_stages, *video_stages],
+            ["patients"],
+        ),
+        Stage(
+            "create_pseudo_examinations",
+            manage("create_pseudo_examinations"),
+            ["patients"],
+            ["examinations"],
+        ),
+        Stage(
+            "create_anonym_reports",
+            manage("create_anonym_reports"),
+            ["examinations"],
+            ["anonym_reports"],
+        ),
+        # outside segments of the predictions are censored in the anonymized videos
+        Stage(
+            "create_anonym_videos",
+            manage("create_anonym_videos"),
+            ["examinations", "predictions"],
+            ["anonym_videos"],
+        ),
+        Stage(
+            "export_anonym_videos",
+            manage("export_anonym_videos"),
+            ["anonym_videos"],
+            ["anonym_video_export"],
+        ),
+        Stage(
+            "export_patients",
+            manage("export_patients"),
+            ["anonym_reports", "anonym_videos"],
+            ["patient_export"],
+        ),
+    ]
+    return stages
+
+
+def main():
+    conf_dir = Path(os.environ.get("CONF_DIR", "./conf"))
+    parser = argparse.ArgumentParser(
+        description="Run the processing pipeline as a dependency graph"
+    )
+    parser.add_argument(
+        "--reports", nargs="*", default=DEFAULT_REPORTS, help="Report PDFs to import"
+    )
+    parser.add_argument("--videos", nargs="*", default=DEFAULT_VIDEOS, help="Videos to import")
+    parser.add_argument("--model_path", default=DEFAULT_MODEL_PATH, help="Model checkpoint")
+    parser.add_argument(
+        "--model_name", default=DEFAULT_MODEL_NAME, help="AiModel and ModelMeta name"
+    )
+    parser.add_argument(
+        "--predict_workers", type=int, default=1, help="predict_raw_video_files --workers"
+    )
+    parser.add_argument(
+        "--autotune", action="store_true", help="predict_raw_video_files --autotune"
+    )
+    parser.add_argument(
+        "--stages", nargs="*", default=None, help="Run these stages and their inputs only"
+    )
+    parser.add_argument(
+        "--max_parallel",
+        type=int,
+        default=None,
+        help=f"Stages running at the same time, defaults to {SQLITE_MAX_PARALLEL} on SQLite "
+        f"and {DEFAULT_MAX_PARALLEL} otherwise",
+    )
+    parser.add_argument(
+        "--restart", action="store_true", help="Ignore checkpoints, run every stage"
+    )
+    parser.add_argument(
+        "--rm_db", action="store_true", help="Remove db.sqlite3 first (implies --restart)"
+    )
+    parser.add_argument(
+        "--state_file", default=conf_dir / "pipeline_state.json", help="Checkpoint file"
+    )
+    parser.add_argument(
+        "--log_dir", default="data/logs/pipeline", help="Stage logs, empty for stdout"
+    )
+    parser.add_argument(
+        "--list", action="store_true", help="Print the stages and dependencies and exit"
+    )
+    args = parser.parse_args()
+
+    if args.max_parallel is None:
+        engine = get_db_engine()
+        args.max_parallel = get_default_max_parallel(engine)
+        print(f"Database engine {engine}: running up to {args.max_parallel} stages at a time")
+
+    pipeline = Pipeline(
+        build_stages(args),
+        state_path=args.state_file,
+        max_parallel=args.max_parallel,
+        log_dir=args.log_dir or None,
+    )
+
+    if args.list:
+        for name in pipeline.order:
+            deps = ", ".join(sorted(pipeline.dependencies[name])) or "-"
+            print(f"{name:<32} <- {deps}")
+        return
+
+    if args.rm_db:
+        db_file = Path("db.sqlite3")
+        if db_file.exists():
+            db_file.unlink()
+            print("Database file removed")
+
+    results = pipeline.run(targets=args.stages, restart=args.restart or args.rm_db)
+    print(format_report(results, pipeline.wall_seconds))
+
+    failed = [name for name, r in results.items() if r["status"] in (FAILED, BLOCKED)]
+    if failed:
+        print(f"Not completed: {', '.join(failed)}, rerun to resume")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
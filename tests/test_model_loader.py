@@ -0,0 +1,274 @@
+import json
+
+import pytest
+import torch
+from torch import nn
+
+from endo_ai.predictor import autotune as autotune_module
+from endo_ai.predictor.autotune import apply_tuning, autotune, get_tuning_path, probe
+from endo_ai.predictor.backends import (
+    compare_backends,
+    get_export_path,
+    load_backend,
+)
+from endo_ai.predictor.inference_model import InferenceNet
+from endo_ai.predictor.model_cache import ModelCache, get_model_key, get_model_nbytes
+from endo_ai.predictor.quantization import (
+    build_precision_model,
+    compare_sequences,
+    load_precision_model,
+    write_validation_report,
+)
+from endo_ai.predictor.video_prediction import get_inference_config
+
+CONFIG = {"batchsize": 2, "size_x": 32, "size_y": 32}
+
+
+class TinyNet(nn.Module):
+    def __init__(self, n_classes=4):
+        super().__init__()
+        self.model = nn.Sequential(
+            nn.Conv2d(3, 8, 3),
+            nn.BatchNorm2d(8),
+            nn.ReLU(),
+            nn.AdaptiveAvgPool2d(1),
+            nn.Flatten(),
+            nn.Linear(8, n_classes),
+        )
+
+    def forward(self, x):
+        return self.model(x)
+
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    torch.manual_seed(0)
+    model = TinyNet().eval()
+    weights_path = tmp_path / "model.ckpt"
+    torch.save(model.state_dict(), weights_path)
+    return model, weights_path
+
+
+def test_torchscript_export_is_cached_by_weights_hash(checkpoint):
+    model, weights_path = checkpoint
+    load_backend(model, "torchscript", weights_path, CONFIG)
+    export_path = get_export_path(weights_path, "torchscript")
+    assert export_path.exists()
+    mtime = export_path.stat().st_mtime_ns
+
+    load_backend(model, "torchscript", weights_path, CONFIG)
+    assert export_path.stat().st_mtime_ns == mtime
+
+    # new weights, new export
+    torch.save(TinyNet().state_dict(), weights_path)
+    assert get_export_path(weights_path, "torchscript") != export_path
+
+
+def test_torchscript_export_per_device(checkpoint):
+    model, weights_path = checkpoint
+    cpu_path = get_export_path(weights_path, "torchscript")
+    # frozen weights do not follow .to(device), other devices get their own export
+    assert get_export_path(weights_path, "torchscript", device="cuda:1") == cpu_path.with_name(
+        cpu_path.name.replace(".ts.pt", ".cuda.ts.pt")
+    )
+    assert get_export_path(weights_path, "onnxruntime", device="cuda") == get_export_path(
+        weights_path, "onnxruntime"
+    )
+
+    traced = load_backend(model, "torchscript", weights_path, CONFIG, device="cpu")
+    assert all(t.device.type == "cpu" for t in traced.state_dict().values())
+    if torch.cuda.is_available():
+        traced = load_backend(model, "torchscript", weights_path, CONFIG, device="cuda")
+        output = traced(torch.randn(1, 3, 32, 32, device="cuda"))
+        assert output.device.type == "cuda"
+
+
+@pytest.mark.parametrize("backend", ["torchscript", "onnxruntime"])
+def test_backend_parity(checkpoint, backend):
+    if backend == "onnxruntime":
+        pytest.importorskip("onnxruntime")
+        pytest.importorskip("onnx")
+    model, weights_path = checkpoint
+    results = compare_backends(model, [backend], weights_path, CONFIG, n_batches=2)
+
+    assert results["eager"]["max_abs_diff"] == 0
+    assert results[backend]["max_abs_diff"] < 1e-5
+
+
+def test_precision_variant_requires_passed_validation(checkpoint):
+    model, weights_path = checkpoint
+    calibration_batches = [torch.randn(2, 3, 32, 32) for _ in range(2)]
+    build_precision_model(model, "int8_static", weights_path, CONFIG, calibration_batches)
+    with pytest.raises(RuntimeError, match="not validated"):
+        load_precision_model(model, "int8_static", weights_path)
+
+    write_validation_report(weights_path, "int8_static", {"passed": False})
+    with pytest.raises(RuntimeError, match="not validated"):
+        load_precision_model(model, "int8_static", weights_path)
+
+    write_validation_report(weights_path, "int8_static", {"passed": True})
+    variant = load_precision_model(model, "int8_static", weights_path)
+
+    x = calibration_batches[0]
+    with torch.no_grad():
+        assert torch.allclose(torch.sigmoid(variant(x)), torch.sigmoid(model(x)), atol=2e-2)
+
+
+def test_reduced_precision_runs_on_cpu():
+    class Meta:
+        device = "cuda"
+
+        def get_inference_dataset_config(self):
+            return dict(CONFIG)
+
+    assert get_inference_config(Meta())["device"] == "cuda"
+    assert get_inference_config(Meta(), precision="int8_static")["device"] == "cpu"
+    assert get_inference_config(Meta(), precision="bf16", device="cuda:1")["device"] == "cpu"
+
+
+def test_static_int8_variant(checkpoint):
+    model, weights_path = checkpoint
+    calibration_batches = [torch.randn(2, 3, 32, 32) for _ in range(4)]
+    variant = build_precision_model(
+        model, "int8_static", weights_path, CONFIG, calibration_batches
+    )
+    with torch.no_grad():
+        x = calibration_batches[0]
+        assert torch.allclose(torch.sigmoid(variant(x)), torch.sigmoid(model(x)), atol=2e-2)
+
+
+def test_compare_sequences():
+    reference = {"polyp": [(10, 50), (100, 200)], "nbi": [(0, 20)]}
+    candidate = {"polyp": [(12, 49), (100, 205)], "nbi": [(0, 20), (40, 60)]}
+    report = compare_sequences(reference, candidate, n_frames=250, boundary_tolerance=5)
+
+    assert report["polyp"]["passed"]
+    assert report["polyp"]["max_boundary_shift"] == 5
+    assert not report["nbi"]["passed"]
+    assert report["nbi"]["frame_disagreement"] == pytest.approx(21 / 250)
+
+
+def test_model_cache_hits_eviction_and_invalidation():
+    nbytes = get_model_nbytes(TinyNet())
+    cache = ModelCache(max_bytes=int(nbytes * 2.5))
+    warmed_up = []
+
+    keys = [get_model_key("meta", version, "hash", "cpu") for version in [1, 2, 3]]
+    first = cache.get(keys[0], TinyNet, warmup_fn=warmed_up.append)
+    assert cache.get(keys[0], TinyNet) is first
+    assert warmed_up == [first]
+
+    cache.get(keys[1], TinyNet)
+    cache.get(keys[0], TinyNet)  # keys[1] is now least recently used
+    cache.get(keys[2], TinyNet)
+
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 2 and stats["misses"] == 3
+    assert stats["hit_rate"] == pytest.approx(2 / 5)
+    assert cache.get(keys[0], TinyNet) is first
+
+    assert cache.invalidate(meta_name="meta", meta_version=3) == 1
+    assert cache.invalidate(meta_name="meta") == 1
+    assert cache.stats()["entries"] == 0
+
+    # a new version (or new weights) replaces the models of the meta on every device
+    cache = ModelCache()
+    cache.get(get_model_key("meta", 1, "hash", "cpu"), TinyNet)
+    cache.get(get_model_key("meta", 1, "hash", "cuda"), TinyNet)
+    cache.get(get_model_key("other", 1, "hash", "cpu"), TinyNet)
+    assert cache.drop_superseded(get_model_key("meta", 1, "hash", "cpu", precision="int8")) == 0
+    assert cache.drop_superseded(get_model_key("meta", 1, "new-hash", "cpu")) == 2
+    assert cache.stats()["entries"] == 1
+
+
+def test_inference_net_loads_lightning_layout_checkpoint(tmp_path):
+    labels = ["outside", "polyp", "nbi"]
+    reference = InferenceNet(labels=labels, model_type="RegNetX800MF").eval()
+    state_dict = dict(reference.state_dict())
+    state_dict["criterion.pos_weight"] = torch.tensor([2.0] * len(labels))
+    checkpoint_path = tmp_path / "model.ckpt"
+    torch.save(
+        {
+            "state_dict": state_dict,
+            "hyper_parameters": {"labels": labels, "model_type": "RegNetX800MF", "lr": 0.006},
+        },
+        checkpoint_path,
+    )
+
+    model = InferenceNet.load_from_checkpoint(checkpoint_path)
+
+    assert model.labels == labels
+    assert not model.training
+    x = torch.randn(1, 3, 64, 64)
+    with torch.no_grad():
+        assert torch.equal(model(x), reference(x))
+
+
+def test_autotune_probes_once_and_respects_memory_cap(tmp_path, monkeypatch):
+    monkeypatch.setenv("CONF_DIR", str(tmp_path))
+    model = TinyNet().eval()
+    tuning_path = get_tuning_path("tiny", 1, host="test")
+    assert tuning_path.parent == tmp_path / "autotune"
+
+    tuning = autotune(
+        model, CONFIG, tuning_path, batch_sizes=(1, 2, 4), thread_counts=[1], n_batches=1
+    )
+    assert tuning_path.exists()
+    assert [(e["batchsize"], e["intra_op_threads"]) for e in tuning["grid"]] == [
+        (1, 1),
+        (2, 1),
+        (4, 1),
+    ]
+    assert tuning["batchsize"] in (1, 2, 4)
+
+    # cached, no probe
+    tuning["batchsize"] = 3
+    tuning_path.write_text(json.dumps(tuning))
+    assert autotune(model, CONFIG, tuning_path)["batchsize"] == 3
+
+    # larger batches are skipped once the peak memory exceeds the cap
+    capped = autotune(
+        model,
+        CONFIG,
+        tuning_path,
+        overwrite=True,
+        batch_sizes=(1, 2, 4),
+        thread_counts=[1],
+        memory_cap_bytes=1,
+        n_batches=1,
+    )
+    assert [e["batchsize"] for e in capped["grid"]] == [1]
+
+    config = apply_tuning(dict(CONFIG), capped)
+    assert config["batchsize"] == 1 and config["intra_op_threads"] == 1
+
+
+def test_probe_measures_memory_per_setting(monkeypatch):
+    # RSS grows linearly with the batch size while the model runs and is freed after;
+    # an earlier large batch must not cut the sweeps of later thread counts short
+    rss = {"now": 1000}
+
+    def model(x):
+        rss["now"] = 1000 + 100 * x.shape[0]
+        return x
+
+    def current_rss():
+        value, rss["now"] = rss["now"], 1000
+        return value
+
+    monkeypatch.setattr(autotune_module, "get_current_rss_bytes", current_rss)
+    batch_sizes = (1, 2, 4, 8, 16)
+    grid = probe(
+        model, CONFIG, batch_sizes, thread_counts=[1, 2], memory_cap_bytes=4000, n_batches=1
+    )
+    for threads in (1, 2):
+        measured = [e["batchsize"] for e in grid if e["intra_op_threads"] == threads]
+        assert measured == list(batch_sizes)
+
+    # 1000 + 100 * 32 exceeds the cap, the extrapolation from 8 -> 16 stops before it
+    grid = probe(
+        model, CONFIG, (*batch_sizes, 32), thread_counts=[1], memory_cap_bytes=4000, n_batches=1
+    )
+    assert [e["batchsize"] for e in grid] == list(batch_sizes)
@@ -0,0 +1,70 @@
+import threading
+import time
+
+import pytest
+
+from endo_ai.pipeline import BLOCKED, CACHED, FAILED, RAN, Pipeline, Stage, format_report
+
+
+def make_stages(calls, fail=(), barrier=None):
+    def step(name, seconds=0.0, wait=False):
+        def run():
+            calls.append(name)
+            if wait and barrier is not None:
+                # returns only once the other stage is running as well
+                barrier.wait()
+            time.sleep(seconds)
+            assert name not in fail, f"{name} failed"
+
+        run.__qualname__ = name
+        return run
+
+    return [
+        Stage("base", step("base"), outputs=["base_data"]),
+        Stage("report", step("report", 0.3, wait=True), ["base_data"], ["report"]),
+        Stage("video", step("video", 0.3, wait=True), ["base_data"], ["video"]),
+        Stage("predict", step("predict"), ["video"], ["predictions"]),
+        Stage("export", step("export"), ["report", "predictions"], ["export"]),
+    ]
+
+
+def test_pipeline_runs_independent_stages_in_parallel(tmp_path):
+    calls = []
+    # run one after the other, the stages would fail on the barrier timeout
+    barrier = threading.Barrier(2, timeout=30)
+    pipeline = Pipeline(make_stages(calls, barrier=barrier), state_path=tmp_path / "state.json")
+    results = pipeline.run()
+
+    assert {r["status"] for r in results.values()} == {RAN}
+    assert calls[0] == "base" and calls[-1] == "export"
+    # report and video overlap: each starts before the other one ends
+    report, video = results["report"], results["video"]
+    assert report["start"] < video["start"] + video["seconds"]
+    assert video["start"] < report["start"] + report["seconds"]
+    assert "parallel speedup" in format_report(results, pipeline.wall_seconds)
+
+
+def test_pipeline_resumes_from_checkpoint(tmp_path):
+    state_path = tmp_path / "state.json"
+    calls = []
+    results = Pipeline(make_stages(calls, fail={"predict"}), state_path=state_path).run()
+    assert results["predict"]["status"] == FAILED
+    assert results["export"]["status"] == BLOCKED
+    assert results["report"]["status"] == RAN
+
+    # the rerun only runs the failed stage and everything downstream of it
+    calls.clear()
+    results = Pipeline(make_stages(calls), state_path=state_path).run()
+    assert calls == ["predict", "export"]
+    assert results["base"]["status"] == CACHED and results["video"]["status"] == CACHED
+
+    calls.clear()
+    Pipeline(make_stages(calls), state_path=state_path).run(targets=["video"], restart=True)
+    assert sorted(calls) == ["base", "video"]
+
+
+def test_pipeline_validates_the_graph():
+    with pytest.raises(AssertionError, match="No stage produces"):
+        Pipeline([Stage("a", lambda: None, ["missing"], ["x"])])
+    with pytest.raises(AssertionError, match="cycle"):
+        Pipeline([Stage("a", lambda: None, ["y"], ["x"]), Stage("b", lambda: None, ["x"], ["y"])])
@@ -0,0 +1,270 @@
+import numpy as np
+import pytest
+
+from endo_ai.predictor.postprocess import (
+    find_true_pred_sequences,
+    find_true_pred_sequences_2d,
+    get_threshold_vector,
+    make_smooth_preds,
+    make_smooth_preds_2d,
+    post_process_matrix,
+    rle_decode,
+    rle_encode,
+    StreamingPostProcessor,
+)
+from endo_ai.predictor.filters import (
+    FILTERS,
+    apply_filters,
+    hysteresis_threshold,
+    parse_filter_spec,
+)
+from endo_ai.predictor.frame_selection import get_frame_numbers, select_annotation_frames
+from endo_ai.predictor.interval_index import IntervalIndex
+from endo_ai.predictor.predict import Classifier, sample_config
+
+
+def make_label_predictions(n_frames, n_labels, seed=0):
+    """Piecewise constant noisy predictions with runs of different lengths"""
+    rng = np.random.default_rng(seed)
+    levels = rng.uniform(size=(n_frames // 20 + 1, n_labels)).repeat(20, axis=0)[:n_frames]
+    noisy = levels + rng.normal(scale=0.1, size=levels.shape)
+    return np.clip(noisy, 0, 1).astype(np.float32)
+
+
+def reference_post_process(predictions, window_size_s, fps, min_seq_len_s, thresholds):
+    """Per label loop of the original post_process_predictions"""
+    smooth, binary, raw, filtered = {}, {}, {}, {}
+    min_seq_len = int(min_seq_len_s * fps)
+    for i in range(predictions.shape[1]):
+        smooth[i] = make_smooth_preds(predictions[:, i], window_size_s=window_size_s, fps=fps)
+        binary[i] = np.array([p > thresholds[i] for p in smooth[i]])
+        raw[i] = find_true_pred_sequences(binary[i])
+        filtered[i] = [s for s in raw[i] if s[1] - s[0] > min_seq_len]
+    return smooth, binary, raw, filtered
+
+
+@pytest.mark.parametrize("window_size_s,fps", [(1, 50), (0.02, 50), (0.5, 25)])
+def test_smooth_preds_2d_matches_convolve(window_size_s, fps):
+    predictions = make_label_predictions(1000, 4)
+    smooth = make_smooth_preds_2d(predictions, window_size_s, fps)
+    for i in range(predictions.shape[1]):
+        np.testing.assert_allclose(
+            smooth[:, i], make_smooth_preds(predictions[:, i], window_size_s, fps), atol=1e-9
+        )
+
+
+def test_sequences_2d_edge_runs():
+    binary = np.array(
+        [[1, 0, 0], [1, 0, 1], [0, 0, 1], [1, 0, 1], [1, 0, 1]], dtype=bool
+    )
+    sequences = find_true_pred_sequences_2d(binary)
+    assert sequences == [[(0, 1), (3, 4)], [], [(1, 4)]]
+    assert find_true_pred_sequences_2d(binary, min_seq_len=1) == [[], [], [(1, 4)]]
+    for i in (0, 2):
+        assert sequences[i] == find_true_pred_sequences(binary[:, i])
+
+
+def test_post_process_matches_per_label_reference():
+    labels = sample_config["labels"]
+    classifier = Classifier(config=sample_config, device="cpu")
+    predictions = make_label_predictions(5000, len(labels), seed=1)
+    thresholds = {"outside": 0.3, "polyp": 0.7}
+
+    _, smooth, binary, raw, filtered = classifier.post_process_predictions(
+        predictions, window_size_s=1, fps=50, min_seq_len_s=0.5, thresholds=thresholds
+    )
+    ref_smooth, ref_binary, ref_raw, ref_filtered = reference_post_process(
+        predictions, 1, 50, 0.5, get_threshold_vector(labels, thresholds)
+    )
+
+    for i, label in enumerate(labels):
+        np.testing.assert_allclose(smooth[label], ref_smooth[i], atol=1e-9)
+        np.testing.assert_array_equal(binary[label], ref_binary[i])
+        assert raw[label] == ref_raw[i]
+        assert filtered[label] == ref_filtered[i]
+
+    readable = [classifier.readable(p) for p in predictions.tolist()]
+    from_dicts = classifier.post_process_predictions_serializable(readable)
+    from_array = classifier.post_process_predictions_serializable(predictions)
+    assert from_dicts["filtered_sequences"] == from_array["filtered_sequences"]
+    assert from_dicts["raw_sequences"] == from_array["raw_sequences"]
+
+
+@pytest.mark.parametrize("batchsize", [1, 7, 16, 500])
+def test_streaming_post_processor_matches_batch(batchsize):
+    labels = sample_config["labels"]
+    predictions = make_label_predictions(3000, len(labels), seed=2)
+    thresholds = get_threshold_vector(labels, {"blood": 0.4})
+    *_, filtered = post_process_matrix(
+        predictions, window_size_s=1, fps=25, min_seq_len_s=0.5, thresholds=thresholds
+    )
+
+    emitted = []
+    processor = StreamingPostProcessor(
+        labels,
+        window_size_s=1,
+        fps=25,
+        min_seq_len_s=0.5,
+        thresholds={"blood": 0.4},
+        on_sequence=lambda *sequence: emitted.append(sequence),
+    )
+    n_closed_early = 0
+    for start in range(0, len(predictions), batchsize):
+        n_closed_early += len(processor.update(predictions[start : start + batchsize]))
+    closed_at_end = processor.finish()
+
+    assert processor.sequences == dict(zip(labels, filtered))
+    assert len(emitted) == n_closed_early + len(closed_at_end)
+    # only runs which are still open at the end wait for finish()
+    assert len(closed_at_end) <= len(labels)
+    assert len(processor._window) == 24
+
+
+def test_streaming_post_processor_matches_predict_video_segments():
+    # predict_video --stream_segments: no minimum length, like postprocess_video
+    labels = sample_config["labels"]
+    predictions = make_label_predictions(2000, len(labels), seed=4)
+    binary = make_smooth_preds_2d(predictions, window_size_s=1, fps=25) > 0.5
+    expected = dict(zip(labels, find_true_pred_sequences_2d(binary)))
+
+    processor = StreamingPostProcessor(
+        labels, window_size_s=1, fps=25, min_seq_len_s=None, thresholds=0.5
+    )
+    for start in range(0, len(predictions), 64):
+        processor.update(predictions[start : start + 64])
+    processor.finish()
+    assert processor.sequences == expected
+    assert any(stop == start for sequences in expected.values() for start, stop in sequences)
+
+
+def test_filters_keep_indices_and_reduce_fragments():
+    rng = np.random.default_rng(3)
+    truth = np.zeros(2000, dtype=bool)
+    truth[500:1200] = True
+    # flickering label: the true segment with noise around the threshold
+    predictions = np.clip(truth * 0.4 + 0.3 + rng.normal(scale=0.15, size=2000), 0, 1)
+    predictions = np.column_stack([predictions, predictions])
+
+    for name, params in [("box", [1]), ("ema", [0.3]), ("median", [1])]:
+        smooth = FILTERS[name](predictions, *params, fps=50)
+        assert smooth.shape == predictions.shape
+        np.testing.assert_allclose(smooth[:, 0], FILTERS[name](predictions[:, 0], *params, fps=50))
+
+    hysteresis = hysteresis_threshold(np.array([0.1, 0.5, 0.8, 0.5, 0.4, 0.2, 0.5, 0.9]), 0.3, 0.7)
+    assert hysteresis.tolist() == [False, False, True, True, True, False, False, True]
+
+    raw_fragments = find_true_pred_sequences_2d(predictions > 0.5)[0]
+    _, binary = apply_filters(
+        predictions, ["blood", "polyp"], "default=box:0.2;blood=median:0.5,hysteresis:0.4:0.6", fps=50
+    )
+    sequences = find_true_pred_sequences_2d(binary)
+    assert len(raw_fragments) > 20
+    assert len(sequences[0]) == 1 and len(sequences[1]) <= 3
+    start, stop = sequences[0][0]
+    assert abs(start - 500) < 25 and abs(stop - 1199) < 25
+
+    # a misspelled label raises instead of silently using the default chain
+    with pytest.raises(AssertionError, match="water-jet"):
+        apply_filters(predictions, ["blood", "water_jet"], "water-jet=median:0.5", fps=50)
+    with pytest.raises(AssertionError, match="water-jet"):
+        parse_filter_spec("default=box:1;water-jet=ema:0.5", labels=["blood", "water_jet"])
+    assert set(parse_filter_spec("water_jet=ema:0.5", labels=["water_jet"])) == {
+        "water_jet",
+        "default",
+    }
+
+
+def test_interval_index_queries():
+    sequences = {
+        "polyp": [(10, 20), (15, 30), (50, 60), (31, 35)],
+        "nbi": [(25, 55)],
+        "outside": [],
+    }
+    index = IntervalIndex.from_sequences(sequences, n_frames=100)
+
+    # overlapping and adjacent intervals are merged
+    assert index.to_dict()["polyp"] == [[10, 35], [50, 60]]
+    assert index.contains("polyp", 35) and not index.contains("polyp", 36)
+    assert not index.contains("outside", 0) and not index.contains("unknown", 0)
+    assert index.active_labels(30) == ["polyp", "nbi"]
+    assert index.overlapping("polyp", 36, 50) == [(50, 60)]
+
+    frames = np.arange(100)
+    polyp = np.zeros(100, dtype=bool)
+    polyp[10:36] = polyp[50:61] = True
+    nbi = (frames >= 25) & (frames <= 55)
+    np.testing.assert_array_equal(index.contains("polyp", frames), polyp)
+    np.testing.assert_array_equal(index.select(include=["polyp"], exclude=["nbi"]), polyp & ~nbi)
+    assert index.intervals(include=["polyp"], exclude=["nbi"]) == [(10, 24), (56, 60)]
+    assert index.intervals(any_of=["polyp", "nbi"]) == [(10, 60)]
+    assert IntervalIndex.from_sequences(index.to_dict()).to_dict() == index.to_dict()
+
+
+def test_interval_index_paths_follow_prediction_rows():
+    # sequences of find_true_pred_sequences_2d count rows from 0, files from 1
+    binary = np.zeros((8, 1), dtype=bool)
+    binary[0:3, 0] = binary[7, 0] = True
+    index = IntervalIndex.from_sequences(
+        {"outside": find_true_pred_sequences_2d(binary)[0]}, n_frames=8
+    )
+    paths = [f"/frames/frame_{i:07d}.jpg" for i in range(1, 9)]
+
+    assert index.select_paths(paths, include=["outside"]) == [
+        "/frames/frame_0000001.jpg",
+        "/frames/frame_0000002.jpg",
+        "/frames/frame_0000003.jpg",
+        "/frames/frame_0000008.jpg",
+    ]
+
+
+def test_rle_roundtrip_and_serializable_payload():
+    binary = np.array([1, 1, 0, 0, 1, 0, 1, 1, 1], dtype=bool)
+    rle = rle_encode(binary)
+    assert rle == {"start": [0, 4, 6], "length": [2, 1, 3], "n_frames": 9}
+    np.testing.assert_array_equal(rle_decode(rle), binary)
+    assert rle_decode(rle_encode(np.zeros(5, dtype=bool))).tolist() == [False] * 5
+
+    classifier = Classifier(config=sample_config, device="cpu")
+    predictions = make_label_predictions(3000, len(sample_config["labels"]), seed=4)
+    full = classifier.post_process_predictions_serializable(predictions)
+    compact = classifier.post_process_predictions_serializable(
+        predictions, binary_format="rle", include_frame_values=False
+    )
+
+    assert "predictions" not in compact and "smooth_predictions" not in compact
+    assert compact["filtered_sequences"] == full["filtered_sequences"]
+    for label, encoded in compact["binary_predictions"].items():
+        assert rle_decode(encoded).tolist() == full["binary_predictions"][label]
+
+
+def test_select_annotation_frames_per_second_and_split():
+    labels = ["polyp", "nbi", "outside"]
+    fps = 10
+    predictions = np.zeros((60, 3))
+    predictions[:, 0] = np.linspace(0.6, 0.9, 60)  # polyp everywhere, rising confidence
+    predictions[30:, 1] = 0.8  # nbi in seconds 3 - 5
+    predictions[10:20, 2] = 0.9  # second 1 is outside
+    predictions[45, 0] = 0.2  # no polyp
+
+    selection = select_annotation_frames(predictions, labels, fps=fps)
+    # most confident frame of every second, without second 1
+    assert selection["without_nbi"].tolist() == [9, 29]
+    assert selection["with_nbi"].tolist() == [39, 49, 59]
+
+    shifted = select_annotation_frames(
+        predictions, labels, fps=fps, frame_numbers=np.arange(60) + 5, split_label=None
+    )
+    # row r is frame r + 5, rows 10 - 19 (frames 15 - 24) are outside
+    assert shifted["all"].tolist() == [9, 14, 29, 39, 49, 59, 64]
+
+    random = select_annotation_frames(predictions, labels, fps=fps, mode="random", seed=0)
+    assert len(random["with_nbi"]) == 3 and len(random["without_nbi"]) == 2
+    assert sorted(f // fps for f in random["with_nbi"]) == [3, 4, 5]
+
+
+
+def test_frame_numbers_from_prediction_paths():
+    paths = [f"/frames/frame_{i:07d}.jpg" for i in range(1, 3)]
+    prediction_dict = {"paths": paths, "predictions": [[0.1], [0.2]]}
+    assert get_frame_numbers(prediction_dict).tolist() == [1, 2]
+    assert get_frame_numbers({"predictions": [[0.1], [0.2]]}).tolist() == [0, 1]
@@ -0,0 +1,364 @@
+import math
+import subprocess
+import time
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+from endo_ai.predictor.data_loading import close_frame_loaders, get_frame_loader
+from endo_ai.predictor import frame_extraction
+from endo_ai.predictor.frame_extraction import (
+    extract_segment,
+    get_frame_paths,
+    get_segment_command,
+    plan_segments,
+)
+from endo_ai.predictor.fingerprint import (
+    get_fingerprint_options,
+    get_fingerprint_payload,
+    get_prediction_fingerprint,
+    get_stale_videos,
+    hash_fingerprint_payload,
+    with_postprocessing_options,
+)
+from endo_ai.predictor.inference_dataset import InferenceDataset
+from endo_ai.predictor.predict import Classifier, sample_config
+from endo_ai.predictor.prediction_io import PredictionFile
+from endo_ai.predictor.staged_executor import StagedExecutor
+from endo_ai.predictor.postprocess import (
+    find_true_pred_sequences,
+    find_true_pred_sequences_2d,
+    make_smooth_preds_2d,
+)
+from endo_ai.predictor.sparse_sampling import predict_sparse
+from endo_ai.predictor.video_pool import run_pool, summarize_results
+
+
+class FrameIndexClassifier:
+    """Stub classifier which looks up precomputed predictions by frame index"""
+
+    def __init__(self, predictions):
+        self.predictions = predictions
+        self.n_forward = 0
+
+    def pipe(self, paths, crops, output="list"):
+        self.n_forward += len(paths)
+        predictions = self.predictions[[int(p) for p in paths]].astype(np.float32)
+        return predictions if output == "array" else predictions.tolist()
+
+
+def make_step_predictions(n_frames, boundaries, n_labels=3, seed=0):
+    rng = np.random.default_rng(seed)
+    predictions = rng.uniform(0.0, 0.4, size=(n_frames, n_labels))
+    for label, (start, stop) in boundaries.items():
+        predictions[start : stop + 1, label] += 0.5
+    return predictions
+
+
+def test_predict_sparse_recovers_exact_boundaries():
+    n_frames = 5000
+    boundaries = {0: (0, 1234), 1: (777, 3001), 2: (4500, 4999)}
+    dense = make_step_predictions(n_frames, boundaries)
+    classifier = FrameIndexClassifier(dense)
+    paths = [str(i) for i in range(n_frames)]
+
+    predictions, n_evaluated = predict_sparse(
+        classifier, paths, [None] * n_frames, stride=50, tolerance=1
+    )
+    predictions = np.array(predictions)
+
+    assert predictions.shape == dense.shape
+    assert n_evaluated == classifier.n_forward
+    assert n_evaluated < n_frames / 10
+    for label in range(dense.shape[1]):
+        assert find_true_pred_sequences(predictions[:, label] > 0.5) == (
+            find_true_pred_sequences(dense[:, label] > 0.5)
+        )
+
+
+def test_predict_sparse_tolerance():
+    n_frames = 2000
+    dense = make_step_predictions(n_frames, {0: (333, 1500)}, n_labels=1)
+    classifier = FrameIndexClassifier(dense)
+    paths = [str(i) for i in range(n_frames)]
+
+    predictions, _ = predict_sparse(
+        classifier, paths, [None] * n_frames, stride=64, tolerance=8
+    )
+    ((start, stop),) = find_true_pred_sequences(np.array(predictions)[:, 0] > 0.5)
+
+    assert abs(start - 333) < 8
+    assert abs(stop - 1500) < 8
+
+
+@pytest.mark.parametrize("tolerance", [1, 8])
+def test_predict_sparse_matches_dense_post_processing(tolerance):
+    # production smooths and binarizes the filled matrix like a dense one; the
+    # boundaries differ by the tolerance plus the noise averaged by the dense window
+    n_frames, fps, window_size_s = 5000, 50, 1
+    boundaries = {0: (0, 1234), 1: (777, 3001), 2: (4500, 4999)}
+    paths = [str(i) for i in range(n_frames)]
+
+    def post_process(predictions):
+        smooth = make_smooth_preds_2d(predictions, window_size_s=window_size_s, fps=fps)
+        return find_true_pred_sequences_2d(smooth > 0.5)
+
+    for seed in range(5):
+        dense = make_step_predictions(n_frames, boundaries, seed=seed)
+        sparse, _ = predict_sparse(
+            FrameIndexClassifier(dense), paths, [None] * n_frames, stride=50, tolerance=tolerance
+        )
+        for dense_sequences, sparse_sequences in zip(post_process(dense), post_process(sparse)):
+            assert len(dense_sequences) == len(sparse_sequences)
+            for (start, stop), (sparse_start, sparse_stop) in zip(
+                dense_sequences, sparse_sequences
+            ):
+                assert abs(start - sparse_start) <= tolerance + window_size_s * fps // 4
+                assert abs(stop - sparse_stop) <= tolerance + window_size_s * fps // 4
+
+
+def test_frame_loader_workers_match_dataset_and_are_reused(tmp_path):
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(6):
+        path = (tmp_path / f"frame_{i + 1:07d}.jpg").as_posix()
+        Image.fromarray((rng.random((120, 160, 3)) * 255).astype("uint8")).save(path)
+        paths.append(path)
+    crops = [[0, 120, 20, 140]] * len(paths)
+    config = dict(sample_config, size_x=64, size_y=64, batchsize=4, num_workers=2)
+
+    expected = torch.stack(list(InferenceDataset(paths, crops, config)))
+    loader = get_frame_loader(config)
+    try:
+        batches = list(loader.iter_batches(paths, crops))
+        assert [len(b) for b in batches] == [4, 2]
+        assert torch.equal(torch.cat(batches), expected)
+
+        # second "video" on the same workers
+        assert get_frame_loader(config) is loader
+        batches = list(loader.iter_batches(paths[::-1], crops))
+        assert torch.equal(torch.cat(batches), expected.flip(0))
+    finally:
+        close_frame_loaders()
+
+
+def test_staged_executor_keeps_order():
+    rng = np.random.default_rng(0)
+    delays = rng.uniform(0, 0.005, size=50)
+
+    def load(i):
+        time.sleep(delays[i])
+        return torch.tensor([i])
+
+    executor = StagedExecutor(load, batchsize=8, n_threads=4, prefetch_batches=2)
+    batches = list(executor.iter_batches(range(50)))
+
+    assert [len(b) for b in batches] == [8] * 6 + [2]
+    assert torch.cat(batches).flatten().tolist() == list(range(50))
+    assert set(executor.report()) == {"decode", "collate", "model"}
+
+
+def test_staged_executor_propagates_errors():
+    def load(i):
+        if i == 13:
+            raise ValueError("broken frame")
+        return torch.tensor([i])
+
+    executor = StagedExecutor(load, batchsize=4, n_threads=2)
+    with pytest.raises(ValueError, match="broken frame"):
+        list(executor.iter_batches(range(20)))
+
+
+def test_predict_batches_array_matches_list():
+    torch.manual_seed(0)
+    config = dict(sample_config, batchsize=4)
+    model = torch.nn.Sequential(torch.nn.Flatten(), torch.nn.Linear(3, len(config["labels"])))
+    classifier = Classifier(model, config=config, device="cpu")
+    batches = [torch.rand(4, 3, 1, 1), torch.rand(4, 3, 1, 1), torch.rand(2, 3, 1, 1)]
+
+    as_list = classifier.predict_batches(batches, output="list")
+    as_array = classifier.predict_batches(batches, n_frames=10, output="array")
+    streamed = []
+    unknown_length = classifier.predict_batches(
+        iter(batches), output="array", batch_callback=streamed.append
+    )
+
+    assert as_array.dtype == np.float32 and as_array.shape == (10, len(config["labels"]))
+    np.testing.assert_allclose(as_array, np.array(as_list), atol=1e-6)
+    np.testing.assert_array_equal(as_array, unknown_length)
+    np.testing.assert_array_equal(np.concatenate(streamed), unknown_length)
+
+    readable = [classifier.readable(p) for p in as_list]
+    *_, sequences_list = classifier.post_process_predictions(readable, window_size_s=0.1, fps=10)
+    *_, sequences_array = classifier.post_process_predictions(as_array, window_size_s=0.1, fps=10)
+    assert sequences_list == sequences_array
+
+
+def test_prediction_file_roundtrip(tmp_path):
+    config = dict(sample_config)
+    classifier = Classifier(torch.nn.Identity(), config=config, device="cpu")
+    rng = np.random.default_rng(0)
+    predictions = rng.uniform(size=(50, len(config["labels"]))).astype(np.float32)
+    frame_indices = list(range(10, 110, 2))
+    paths = [f"/frames/{{uuid}}/frame_{i}.jpg" for i in frame_indices]
+
+    target = classifier.save_predictions(
+        predictions, paths, frame_indices, target_path=tmp_path / "p.preds"
+    )
+    prediction_file = PredictionFile(target)
+
+    assert prediction_file.labels == config["labels"]
+    np.testing.assert_array_equal(prediction_file.predictions, predictions)
+    assert prediction_file.get_path(14) == paths[2]
+    np.testing.assert_array_equal(prediction_file.frame_indices, frame_indices)
+    # frames 20, 22, 24 of two labels
+    np.testing.assert_array_equal(
+        prediction_file.select(["polyp", "blood"], start=19, stop=25),
+        predictions[5:8][:, [config["labels"].index("polyp"), config["labels"].index("blood")]],
+    )
+
+    half = classifier.save_predictions(
+        predictions, paths, frame_indices, target_path=tmp_path / "h.preds", dtype="float16"
+    )
+    np.testing.assert_allclose(PredictionFile(half).select(), predictions, atol=1e-3)
+
+    exported = prediction_file.to_json_dict()
+    assert exported["paths"] == paths
+    np.testing.assert_allclose(exported["predictions"], predictions)
+
+
+def test_prediction_file_padded_and_irregular_paths(tmp_path):
+    config = dict(sample_config)
+    classifier = Classifier(torch.nn.Identity(), config=config, device="cpu")
+    predictions = np.zeros((12, len(config["labels"])), dtype=np.float32)
+    frame_indices = list(range(1, 13))
+    # frame names of frame_extraction / extract_frames, in a directory with a number
+    paths = [f"/data/frames/2024/frame_{i:07d}.jpg" for i in frame_indices]
+
+    prediction_file = PredictionFile(
+        classifier.save_predictions(predictions, paths, frame_indices, tmp_path / "p.preds")
+    )
+    assert prediction_file.path_pattern == "/data/frames/2024/frame_{index:07d}.jpg"
+    assert [prediction_file.get_path(i) for i in frame_indices] == paths
+
+    irregular = [f"/frames/{name}.jpg" for name in "abcdefghijkl"]
+    prediction_file = PredictionFile(
+        classifier.save_predictions(predictions, irregular, frame_indices, tmp_path / "i.preds")
+    )
+    assert prediction_file.path_pattern is None
+    assert prediction_file.get_path(3) == "/frames/c.jpg"
+    assert prediction_file.to_json_dict()["paths"] == irregular
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_video_pool_isolates_failures(workers):
+    # math.sqrt fails for negative numbers, the other items still complete
+    results = list(run_pool([4.0, -1.0, 9.0], math.sqrt, workers=workers, method="spawn"))
+    assert sorted(r["item"] for r in results) == [-1.0, 4.0, 9.0]
+    by_item = {r["item"]: r for r in results}
+    assert by_item[9.0]["ok"] and by_item[9.0]["result"] == 3.0
+    assert not by_item[-1.0]["ok"] and "ValueError" in by_item[-1.0]["error"]
+
+    summary = summarize_results(results, wall_seconds=2)
+    assert summary["n_videos"] == 2 and summary["n_failed"] == 1
+    assert summary["failed"][-1.0].startswith("ValueError")
+    assert summary["videos_per_hour"] == 3600
+
+
+def test_prediction_fingerprint_tracks_result_relevant_settings():
+    options = get_fingerprint_options(filters="default=box:1")
+    reference = get_prediction_fingerprint("abc", "meta", 7, sample_config, options)
+
+    # device and throughput settings do not change the result
+    tuned = dict(sample_config, batchsize=64, intra_op_threads=8, device="cpu")
+    assert get_prediction_fingerprint("abc", "meta", 7, tuned, options) == reference
+    same_spec = get_fingerprint_options(filters=" default = box:1 ")
+    assert get_prediction_fingerprint("abc", "meta", 7, sample_config, same_spec) == reference
+
+    changed = [
+        get_prediction_fingerprint("abd", "meta", 7, sample_config, options),
+        get_prediction_fingerprint("abc", "meta", 8, sample_config, options),
+        get_prediction_fingerprint("abc", "meta", 7, dict(sample_config, size_x=512), options),
+        get_prediction_fingerprint(
+            "abc", "meta", 7, sample_config, get_fingerprint_options(filters="default=box:2")
+        ),
+        get_prediction_fingerprint(
+            "abc", "meta", 7, sample_config, get_fingerprint_options(test_run=True)
+        ),
+    ]
+    assert reference not in changed and len(set(changed)) == len(changed)
+
+    stored = {"a": reference, "b": changed[0], "c": None}
+    expected = {"a": reference, "b": reference, "c": reference, "d": reference}
+    assert get_stale_videos(stored, expected) == {"b": "stale", "c": "new", "d": "new"}
+    assert set(get_stale_videos(stored, expected, force=True)) == {"a", "b", "c", "d"}
+
+
+def test_fingerprint_payload_postprocessing_update_matches_new_prediction():
+    inference_options = {"test_run": True, "n_test_frames": 50, "sparse_stride": 4}
+    payload = get_fingerprint_payload(
+        "abc", "meta", 7, sample_config, get_fingerprint_options(**inference_options)
+    )
+    assert hash_fingerprint_payload(payload) == get_prediction_fingerprint(
+        "abc", "meta", 7, sample_config, get_fingerprint_options(**inference_options)
+    )
+
+    updated = with_postprocessing_options(
+        payload, binarize_threshold=0.6, filters="default=ema:0.3"
+    )
+    expected = get_prediction_fingerprint(
+        "abc",
+        "meta",
+        7,
+        sample_config,
+        get_fingerprint_options(
+            binarize_threshold=0.6, filters="default=ema:0.3", **inference_options
+        ),
+    )
+    assert hash_fingerprint_payload(updated) == expected
+    assert updated["options"]["sparse_stride"] == 4
+
+
+def test_frame_extraction_plan_splits_at_keyframes():
+    fps, n_frames = 50, 1003
+    times = 10.0 + np.arange(n_frames) / fps
+    keyframes = np.arange(n_frames) % 100 == 0
+
+    segments = plan_segments(times, keyframes, n_segments=4, start_time=10.0)
+    assert len(segments) == 4 and segments[0]["seek"] is None
+    assert sum(s["n_frames"] for s in segments) == n_frames
+    for previous, segment in zip(segments[:-1], segments[1:]):
+        start = segment["start_frame"]
+        assert start == previous["start_frame"] + previous["n_frames"]
+        assert keyframes[start]
+        # seek lands between the previous frame and the keyframe, relative to the start
+        assert (start - 1) / fps < segment["seek"] < start / fps
+
+    assert [s["start_frame"] for s in plan_segments(times, keyframes, 1)] == [0]
+    assert len(plan_segments(times, np.arange(n_frames) == 0, 8)) == 1
+
+    command = get_segment_command("video.mp4", "frames", segments[2])
+    assert command[command.index("-start_number") + 1] == str(segments[2]["start_frame"] + 1)
+    assert command[command.index("-frames:v") + 1] == str(segments[2]["n_frames"])
+    paths = get_frame_paths("frames", segments[2]["start_frame"], 2)
+    assert paths[0].name == f"frame_{segments[2]['start_frame'] + 1:07d}.jpg"
+
+
+def test_extract_segment_checks_the_whole_range(tmp_path, monkeypatch):
+    segment = {"start_frame": 10, "n_frames": 5, "seek": 0.4}
+    paths = get_frame_paths(tmp_path, 10, 5)
+
+    def run(_command, **_kwargs):
+        # a mis-seek: the last frame exists, one in the middle is missing
+        for path in paths[:2] + paths[3:]:
+            path.touch()
+        return subprocess.CompletedProcess(_command, 0, "", "")
+
+    monkeypatch.setattr(frame_extraction.subprocess, "run", run)
+    with pytest.raises(AssertionError, match="wrote 4 of 5 frames"):
+        extract_segment("video.mp4", tmp_path, segment)
+
+    paths[2].touch()
+    assert extract_segment("video.mp4", tmp_path, segment) == paths
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+import torch
+from PIL import Image, ImageFilter
+
+from endo_ai.predictor.inference_dataset import BatchPreprocessor, FramePreprocessor
+from endo_ai.predictor.predict import sample_config
+from endo_ai.predictor.preprocess import Cropper, crop_resize_img
+
+
+@pytest.fixture(scope="module")
+def frame():
+    rng = np.random.default_rng(0)
+    noise = (rng.random((1080, 1920, 3)) * 255).astype("uint8")
+    return np.array(Image.fromarray(noise).filter(ImageFilter.GaussianBlur(2)))
+
+
+@pytest.mark.parametrize(
+    "crop, scale",
+    [
+        ([0, 1080, 550, 1900], [716, 716]),  # wide crop, padded rows
+        ([100, 1000, 300, 800], [716, 716]),  # tall crop, padded columns
+        ([0, 1080, 550, 1900], [300, 200]),  # non square output
+        ([0, 500, 0, 500], [716, 716]),  # square crop, no padding
+        ([10, 30, 0, 1920], [716, 716]),  # crop too small for the fused path
+    ],
+)
+@pytest.mark.parametrize(
+    "scale_method",
+    [Image.Resampling.LANCZOS, Image.Resampling.BICUBIC, Image.Resampling.NEAREST],
+)
+def test_fast_cropper_matches_reference(frame, crop, scale, scale_method):
+    reference = Cropper()(frame, crop, scale=scale, scale_method=scale_method)
+    fast = Cropper(fast=True)(frame, crop, scale=scale, scale_method=scale_method)
+
+    assert fast.shape == reference.shape
+    assert fast.dtype == np.uint8
+    # identical up to fixed point rounding in Pillow
+    assert np.abs(fast.astype(int) - reference.astype(int)).max() <= 1
+
+
+def test_crop_resize_img_pil_input_and_out_buffer(frame):
+    crop = [0, 1080, 550, 1900]
+    out = np.full((716, 716, 3), 255, dtype=np.uint8)
+
+    result = crop_resize_img(Image.fromarray(frame), crop, (716, 716), out=out)
+
+    assert result is out
+    np.testing.assert_array_equal(out, crop_resize_img(frame, crop, (716, 716)))
+
+
+def test_batch_preprocessing_matches_item_preprocessing(frame):
+    crop = [0, 1080, 550, 1900]
+    item = FramePreprocessor(sample_config)(frame, crop)
+    uint8_item = FramePreprocessor(dict(sample_config, preprocessing="batch"))(frame, crop)
+
+    assert uint8_item.dtype == torch.uint8
+    assert uint8_item.shape == (sample_config["size_y"], sample_config["size_x"], 3)
+
+    batch = BatchPreprocessor(sample_config)(torch.stack([uint8_item, uint8_item]))
+    assert batch.shape == (2,) + tuple(item.shape)
+    assert batch.is_contiguous(memory_format=torch.channels_last)
+    assert torch.allclose(batch[0], item, atol=1e-5)
+